@@ -0,0 +1,237 @@
+"""
+ローカルの合成サイトに対して監視処理全体を実行するエンドツーエンドのベンチマーク
+
+使い方:
+    python benchmarks/bench_e2e.py [--urls 200] [--runs 3] [--size 20000] [--latency-ms 0]
+                                   [--error-rate 0] [--mutation-rate 0.1]
+                                   [--pipeline] [--fetch-workers 8] [--cpu-workers 4]
+                                   [--json results.json] [--save-baseline] [--check]
+
+一時ディレクトリに settings.json と urls.csv（10〜10,000件）を生成し、合成サイト
+(synthetic_site.py) に対して run_monitoring を繰り返し実行する。スクリーンショットと
+通知はスタブに置き換える。実行ごとのURL/秒、URLあたりの所要時間のp50/p99、
+ピークRSSを表示し、benchmarks/baselines/e2e.json の同じシナリオの値と比較する。
+1回目の実行は比較対象の履歴がないため、集計には2回目以降を使う。
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import statistics
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from synthetic_site import SiteOptions, SyntheticSite  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baselines' / 'e2e.json'
+
+# 値が大きいほど良い指標（それ以外は小さいほど良い）
+HIGHER_IS_BETTER = ('urls_per_sec',)
+
+def peak_rss_mb():
+    """
+    このプロセスのピークRSS（MB）を返す（取得できない環境ではNone）
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト単位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def write_workspace(site, url_count, sitemap=False, pipeline=None):
+    """
+    カレントディレクトリに監視用の設定ファイルと urls.csv を生成する
+    """
+    config_dir = Path('config')
+    config_dir.mkdir()
+    settings = {
+        'monitoring': {'interval': '5', 'start_date': '2000-01-01', 'end_date': '2100-12-31'},
+        'notifications': {'email': True, 'slack': False, 'diff_only': True, 'recipients': []},
+        'screenshot': {'enabled': True, 'format': 'png', 'width': 1280, 'height': 800},
+        'log': {'level': 'INFO', 'mode': 'production'},
+        'metrics': {},
+        'report': {'csv_enabled': True, 'visualization_enabled': False}
+    }
+    if sitemap:
+        settings['sitemaps'] = {
+            'enabled': True,
+            'domains': {f"{site.host}:{site.port}": site.sitemap_url},
+            'full_check_hours': 24
+        }
+    if pipeline:
+        settings['pipeline'] = pipeline
+    with open(config_dir / 'settings.json', 'w', encoding='utf-8') as file:
+        json.dump(settings, file, indent=2)
+
+    with open(config_dir / 'urls.csv', 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['url', 'name', 'check_frequency', 'notification'])
+        for index, url in enumerate(site.urls(url_count)):
+            writer.writerow([url, f"Synthetic page {index}", 5, 'true'])
+
+def run_benchmark(args):
+    """
+    ベンチマークを実行し、実行ごとの結果と集計値を返す
+    """
+    import monitor
+    from loguru import logger
+    from store import read_results, RUNS_DIR
+
+    # setup_logger が呼ばれる前の既定の出力先（DEBUG）を外す
+    logger.remove()
+
+    # 外部との通信やブラウザの起動は計測対象外のためスタブに置き換える
+    monitor.take_screenshot = lambda url, picture_dir, config: ''
+    monitor.send_notification = lambda *args, **kwargs: True
+
+    options = SiteOptions(args.size, args.latency_ms, args.error_rate, args.mutation_rate, args.seed, args.urls)
+    runs = []
+    with SyntheticSite(options) as site:
+        write_workspace(site, args.urls, args.sitemap, pipeline_config(args))
+        for _ in range(args.runs):
+            site.next_run()
+            started_at = time.perf_counter()
+            monitor.run_monitoring()
+            wall = time.perf_counter() - started_at
+
+            summary = read_results(base_dir=RUNS_DIR).to_pylist()[-1]
+            runs.append({
+                'wall_s': wall,
+                'urls_per_sec': args.urls / wall,
+                'p50_ms': summary['elapsed_ms_p50'],
+                'p99_ms': summary['elapsed_ms_p99'],
+                'changes': summary['changes'],
+                'failures': summary['failures'],
+                'skipped': summary.get('skipped', 0)
+            })
+
+    measured = runs[1:] or runs
+    result = {
+        'urls_per_sec': statistics.median(run['urls_per_sec'] for run in measured),
+        'p50_ms': statistics.median(run['p50_ms'] for run in measured),
+        'p99_ms': statistics.median(run['p99_ms'] for run in measured),
+        'peak_rss_mb': peak_rss_mb()
+    }
+    return runs, result
+
+def pipeline_config(args):
+    """
+    --pipeline を指定した場合の settings.json の pipeline セクション
+    """
+    if not args.pipeline:
+        return None
+    return {
+        'enabled': True,
+        'fetch_workers': args.fetch_workers,
+        'cpu_workers': args.cpu_workers,
+        'max_in_flight': args.max_in_flight
+    }
+
+def scenario_name(args):
+    name = (
+        f"urls={args.urls},size={args.size},latency_ms={args.latency_ms:g},"
+        f"error_rate={args.error_rate:g},mutation_rate={args.mutation_rate:g}"
+    )
+    if args.sitemap:
+        name += ',sitemap'
+    if args.pipeline:
+        name += f",pipeline={args.fetch_workers}x{args.cpu_workers or os.cpu_count()}"
+    return name
+
+def compare(result, baseline, threshold):
+    """
+    ベースラインと比較して差分を表示し、閾値を超えて悪化した指標の名前を返す
+    """
+    regressions = []
+    for key, value in result.items():
+        base = baseline.get(key)
+        if value is None or not base:
+            continue
+        change = (value - base) / base
+        worse = -change if key in HIGHER_IS_BETTER else change
+        flag = '  REGRESSION' if worse > threshold else ''
+        print(f"  {key:<14} {base:10.2f} -> {value:10.2f}  ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end monitoring benchmark against a synthetic local site')
+    parser.add_argument('--urls', type=int, default=200, help='Number of URLs (10-10000)')
+    parser.add_argument('--runs', type=int, default=3, help='Monitoring runs; the first one only warms the history')
+    parser.add_argument('--size', type=int, default=20000, help='Approximate page size in bytes')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Server delay per response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--mutation-rate', type=float, default=0.1, help='Fraction of pages changed per run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sitemap', action='store_true', help='Skip unmodified pages using the site\'s sitemap lastmod')
+    parser.add_argument('--pipeline', action='store_true', help='Fetch in threads and parse/diff in a process pool')
+    parser.add_argument('--fetch-workers', type=int, default=8, help='Fetch threads with --pipeline')
+    parser.add_argument('--cpu-workers', type=int, default=0, help='Parse/diff processes with --pipeline (0: CPU count)')
+    parser.add_argument('--max-in-flight', type=int, default=0, help='Bound on groups in flight with --pipeline (0: default)')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Baseline file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the result as the baseline for this scenario')
+    parser.add_argument('--check', action='store_true', help='Exit with 1 if a metric regresses beyond --threshold')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed regression ratio for --check')
+    args = parser.parse_args()
+
+    if not 10 <= args.urls <= 10000:
+        parser.error('--urls must be between 10 and 10000')
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            runs, result = run_benchmark(args)
+        finally:
+            os.chdir(cwd)
+
+    name = scenario_name(args)
+    print(name)
+    for index, run in enumerate(runs, start=1):
+        print(
+            f"  run {index}: {run['urls_per_sec']:8.1f} URLs/s  p50 {run['p50_ms']:7.1f} ms  "
+            f"p99 {run['p99_ms']:7.1f} ms  changes {run['changes']}  failures {run['failures']}  "
+            f"skipped {run['skipped']}"
+        )
+    rss = f"{result['peak_rss_mb']:.1f} MB" if result['peak_rss_mb'] is not None else 'n/a'
+    print(f"  median: {result['urls_per_sec']:8.1f} URLs/s  p50 {result['p50_ms']:7.1f} ms  "
+          f"p99 {result['p99_ms']:7.1f} ms  peak RSS {rss}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'scenario': name, 'runs': runs, 'result': result}, file, indent=2)
+
+    baseline_path = Path(args.baseline)
+    baselines = {}
+    if baseline_path.exists():
+        with open(baseline_path, 'r', encoding='utf-8') as file:
+            baselines = json.load(file)
+
+    regressions = []
+    if name in baselines:
+        print("Compared with baseline:")
+        regressions = compare(result, baselines[name], args.threshold)
+    else:
+        print("No baseline for this scenario")
+
+    if args.save_baseline:
+        baselines[name] = result
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {baseline_path}")
+
+    if args.check and regressions:
+        print(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
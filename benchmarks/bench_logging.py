@@ -0,0 +1,86 @@
+"""
+ログ出力1件あたりのオーバーヘッドを計測するベンチマーク
+
+使い方:
+    python benchmarks/bench_logging.py [--records 20000] [--json results.json]
+
+一時ディレクトリ内でロガーを各モードで初期化し、監視処理と同じ形のログ呼び出しを
+繰り返して1件あたりの所要時間（マイクロ秒）を表示する。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from logger import setup_logger  # noqa: E402
+
+URL = 'https://example.com/products/item?id=12345'
+HASH = 'c0ffee' * 10
+
+def _fstring_debug(logger, i):
+    logger.debug(f"Generated hash: {HASH[:10]}... for {URL} #{i}")
+
+def _lazy_debug(logger, i):
+    logger.debug("Generated hash: {:.10}... for {} #{}", HASH, URL, i)
+
+def _info(logger, i):
+    logger.info("Monitoring URL: {}", URL)
+
+# (名前, ログ設定, ログ呼び出し)
+SCENARIOS = [
+    ('debug disabled, f-string', {'level': 'INFO'}, _fstring_debug),
+    ('debug disabled, lazy', {'level': 'INFO'}, _lazy_debug),
+    ('development, debug', {'level': 'DEBUG', 'json_format': True}, _lazy_debug),
+    ('development, info', {'level': 'DEBUG', 'json_format': True}, _info),
+    ('production, debug (1% sampled)', {'level': 'DEBUG', 'mode': 'production'}, _lazy_debug),
+    ('production, info', {'level': 'DEBUG', 'mode': 'production'}, _info),
+]
+
+def run_scenario(config, call, records):
+    """
+    1つのシナリオを実行し、1件あたりの所要時間（マイクロ秒）を返す
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        logger = setup_logger(config)
+        with logger.contextualize(url=URL):
+            started_at = time.perf_counter()
+            for i in range(records):
+                call(logger, i)
+            # 非同期の出力先の書き込み完了まで含める
+            logger.complete()
+            elapsed = time.perf_counter() - started_at
+        logger.remove()
+    return elapsed / records * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-record logging overhead')
+    parser.add_argument('--records', type=int, default=20000, help='Log calls per scenario')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            for name, config, call in SCENARIOS:
+                results[name] = run_scenario(config, call, args.records)
+        finally:
+            os.chdir(cwd)
+
+    width = max(len(name) for name in results)
+    for name, per_record in results.items():
+        print(f"{name:<{width}}  {per_record:8.2f} us/record")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'records': args.records, 'us_per_record': results}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+HTMLのパース・テキスト抽出・ハッシュ化・差分検出のマイクロベンチマーク
+
+使い方:
+    python benchmarks/bench_micro.py [--filter large_table] [--json results.json]
+                                     [--save-baseline] [--check] [--threshold 0.25] [--min-delta-us 20]
+
+代表的な形のページ（小さな静的ページ、大きな表、JSの多いSPA、不正なHTML）を生成し、
+処理段階ごとに1回あたりの所要時間（マイクロ秒、繰り返しの中央値）を計測する。
+差分検出は変更量（1行・1%・10%・50%の行）を変えて計測する。
+--check を指定すると benchmarks/baselines/micro.json と比較し、閾値の割合を超え、かつ
+--min-delta-us 以上遅くなった段階があれば終了コード1で終了する（数十マイクロ秒の段階は
+割合だけでは揺らぎで誤検出するため）。
+"""
+import sys
+import json
+import random
+import timeit
+import statistics
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baselines' / 'micro.json'
+
+# 差分検出で書き換える行の割合（0は1行のみ）
+MUTATION_SIZES = (('1line', 0), ('1pct', 0.01), ('10pct', 0.1), ('50pct', 0.5))
+
+WORDS = (
+    'monitor change price stock release update news product service support '
+    'account report market policy notice event schedule detail summary result'
+).split()
+
+def _sentence(rng, low=6, high=18):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+def small_static_page(rng):
+    """
+    数KBの静的なページ
+    """
+    items = ''.join(f"<li><a href=\"/item/{i}\">{_sentence(rng, 2, 4)}</a></li>" for i in range(10))
+    paragraphs = ''.join(f"<p>{_sentence(rng)}.</p>\n" for _ in range(15))
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Company news</title>"
+        "<meta name=\"viewport\" content=\"width=device-width\"><style>body{font-family:sans-serif}</style>"
+        f"</head><body><header><nav><ul>{items}</ul></nav></header>"
+        f"<main><h1>News</h1>\n{paragraphs}</main><footer>(c) Example</footer></body></html>"
+    )
+
+def large_table_page(rng, rows=3000):
+    """
+    数千行の表を含むページ（価格一覧など）
+    """
+    body = ''.join(
+        f"<tr><td>{i}</td><td>{_sentence(rng, 2, 5)}</td><td>{rng.randint(100, 99999)}</td>"
+        f"<td>{rng.choice(('in stock', 'sold out', 'preorder'))}</td></tr>\n"
+        for i in range(rows)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Price list</title></head><body>"
+        "<table><thead><tr><th>ID</th><th>Product</th><th>Price</th><th>Status</th></tr></thead>"
+        f"<tbody>\n{body}</tbody></table></body></html>"
+    )
+
+def spa_page(rng, bundle_lines=4000):
+    """
+    本文が少なく、インラインのJSと状態データが大半を占めるSPAのページ
+    """
+    bundle = '\n'.join(
+        f"function f{i}(a,b){{return a+b*{rng.randint(1, 99)}; /* {_sentence(rng, 2, 6)} */}}"
+        for i in range(bundle_lines)
+    )
+    state = json.dumps({'items': [{'id': i, 'title': _sentence(rng, 2, 5)} for i in range(500)]})
+    return (
+        "<!DOCTYPE html><html><head><title>App</title>"
+        f"<script>{bundle}</script><style>#app{{display:flex}}</style></head>"
+        f"<body><div id=\"app\"></div><noscript>{_sentence(rng)}</noscript>"
+        f"<script id=\"__STATE__\" type=\"application/json\">{state}</script></body></html>"
+    )
+
+def malformed_page(rng, blocks=800):
+    """
+    閉じタグの欠落や入れ子の誤りを含むHTML
+    """
+    parts = []
+    for i in range(blocks):
+        kind = i % 5
+        if kind == 0:
+            parts.append(f"<div class=box{i}><p>{_sentence(rng)}")
+        elif kind == 1:
+            parts.append(f"<b><i>{_sentence(rng)}</b></i>")
+        elif kind == 2:
+            parts.append(f"</div></span><td>{_sentence(rng, 2, 4)}")
+        elif kind == 3:
+            parts.append(f"<a href=/x?{i}&y=1>{_sentence(rng, 2, 4)}<br><br/>")
+        else:
+            parts.append(f"<li>{_sentence(rng)}<li>{_sentence(rng, 2, 4)}\n")
+    return "<html><head><title>Broken<body>" + ''.join(parts)
+
+CORPUS = {
+    'small_static': small_static_page,
+    'large_table': large_table_page,
+    'spa': spa_page,
+    'malformed': malformed_page
+}
+
+def build_corpus(seed=0):
+    """
+    コーパスを生成する（同じseedでは常に同じ内容）
+    """
+    return {name: build(random.Random(f"{seed}:{name}")) for name, build in CORPUS.items()}
+
+def mutate_text(text, fraction, seed=0):
+    """
+    テキストの指定した割合の行を書き換える（0の場合は1行のみ）
+    """
+    lines = text.split('\n')
+    rng = random.Random(seed)
+    count = max(1, int(len(lines) * fraction))
+    for index in rng.sample(range(len(lines)), min(count, len(lines))):
+        lines[index] = f"changed line {index}"
+    return '\n'.join(lines)
+
+def measure(func, repeat=7, min_time=0.2):
+    """
+    1回あたりの所要時間（マイクロ秒）を計測し、繰り返しの中央値を返す
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return statistics.median(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def cases(corpus):
+    """
+    (名前, 計測する関数) を順に返す
+    """
+    from utils import extract_text, hash_text, diff_texts, generate_hash, detect_changes
+
+    for name, content in corpus.items():
+        text, clean_text = extract_text(content)
+        yield f"{name}/parse_html.parser", lambda c=content: BeautifulSoup(c, 'html.parser')
+        yield f"{name}/parse_lxml", lambda c=content: BeautifulSoup(c, 'lxml')
+        yield f"{name}/extract_text", lambda c=content: extract_text(c)
+        yield f"{name}/hash_text", lambda t=clean_text: hash_text(t)
+        yield f"{name}/generate_hash", lambda c=content: generate_hash(c)
+        for label, fraction in MUTATION_SIZES:
+            mutated = mutate_text(text, fraction)
+            yield f"{name}/diff_{label}", lambda old=text, new=mutated: diff_texts(old, new)
+        yield f"{name}/detect_changes", lambda c=content: detect_changes(c, c.replace('e', 'E', 20))
+
+def compare(results, baseline, threshold, min_delta_us=0.0):
+    """
+    ベースラインと比較して差分を表示し、閾値を超えて遅くなった段階の名前を返す
+
+    割合が threshold を超え、かつ min_delta_us マイクロ秒以上遅くなった段階だけを回帰とする
+    """
+    regressions = []
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"  {name:<{width}}  (new)")
+            continue
+        change = (value - base) / base
+        flag = '  REGRESSION' if change > threshold and value - base >= min_delta_us else ''
+        print(f"  {name:<{width}}  {base:12.1f} -> {value:12.1f} us  ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for parsing, hashing and diffing')
+    parser.add_argument('--filter', help='Only run cases whose name contains this string')
+    parser.add_argument('--repeat', type=int, default=7, help='Repetitions per case (the median is reported)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Baseline file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the baseline')
+    parser.add_argument('--check', action='store_true', help='Exit with 1 if a case regresses beyond --threshold')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown ratio for --check')
+    parser.add_argument('--min-delta-us', type=float, default=20.0,
+                        help='Minimum absolute slowdown (us) for --check to report a regression')
+    args = parser.parse_args()
+
+    # ベンチマーク中は監視処理のログを出力しない
+    from loguru import logger
+    logger.remove()
+
+    corpus = build_corpus(args.seed)
+    for name, content in corpus.items():
+        print(f"corpus {name}: {len(content.encode('utf-8')):,} bytes")
+
+    results = {}
+    for name, func in cases(corpus):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat)
+        print(f"{name:<36} {results[name]:12.1f} us")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'seed': args.seed, 'us_per_op': results}, file, indent=2)
+
+    baseline_path = Path(args.baseline)
+    baseline = {}
+    if baseline_path.exists():
+        with open(baseline_path, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    regressions = []
+    if baseline:
+        print("Compared with baseline:")
+        regressions = compare(results, baseline, args.threshold, args.min_delta_us)
+
+    if args.save_baseline:
+        baseline.update(results)
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {baseline_path}")
+
+    if args.check and regressions:
+        print(f"Regressed beyond {args.threshold:.0%} and {args.min_delta_us:g} us: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+ベンチマーク用の合成サイトを配信するローカルHTTPサーバー
+
+使い方:
+    python benchmarks/synthetic_site.py [--port 8765] [--size 20000] [--latency-ms 0]
+                                        [--error-rate 0] [--mutation-rate 0.1]
+
+/page/<番号> に決定的に生成したHTMLを返す。ページの大きさ・応答遅延・エラー率・
+実行ごとの変更率を指定でき、next_run() を呼ぶたびに変更率に応じて一部のページが変化する。
+/sitemap.xml はサイトマップインデックスで、/sitemaps/<番号>.xml.gz（gzip圧縮）に
+各ページの最終変更日時を lastmod として返す。
+ベンチマーク対象の処理とCPUを取り合わないよう、サーバーは別プロセスで動かす。
+"""
+import sys
+import gzip
+import math
+import time
+import random
+import argparse
+import multiprocessing
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# next_run() で進められる世代数の上限（世代ごとの開始時刻を共有メモリに保持する）
+MAX_GENERATIONS = 4096
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+WORDS = (
+    'monitor change price stock release update news product service support '
+    'account report market policy notice event schedule detail summary result'
+).split()
+
+def _chance(seed, page, generation, salt):
+    """
+    (ページ, 世代) ごとに決定的な0以上1未満の値を返す
+    """
+    return random.Random(f"{seed}:{salt}:{page}:{generation}").random()
+
+class SiteOptions:
+    """
+    合成サイトの設定
+    """
+    __slots__ = ('size', 'latency_ms', 'error_rate', 'mutation_rate', 'seed', 'pages', 'sitemap_chunk')
+
+    def __init__(self, size=20000, latency_ms=0.0, error_rate=0.0, mutation_rate=0.1, seed=0,
+                 pages=1000, sitemap_chunk=500):
+        self.size = size
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.mutation_rate = mutation_rate
+        self.seed = seed
+        # サイトマップに載せるページ数と、1ファイルあたりのURL数
+        self.pages = pages
+        self.sitemap_chunk = sitemap_chunk
+
+    def is_error(self, page, generation):
+        return self.error_rate > 0 and _chance(self.seed, page, generation, 'error') < self.error_rate
+
+    def _mutations(self, page, generation):
+        if self.mutation_rate <= 0:
+            return []
+        return [
+            past for past in range(1, generation + 1)
+            if _chance(self.seed, page, past, 'mutation') < self.mutation_rate
+        ]
+
+    def revision(self, page, generation):
+        """
+        指定した世代までにページが変更された回数を返す
+        """
+        return len(self._mutations(page, generation))
+
+    def modified_generation(self, page, generation):
+        """
+        指定した世代までにページが最後に変更された世代を返す（未変更の場合は0）
+        """
+        mutations = self._mutations(page, generation)
+        return mutations[-1] if mutations else 0
+
+    def render(self, page, generation):
+        """
+        ページのHTMLを生成する
+        """
+        rng = random.Random(f"{self.seed}:page:{page}")
+        revision = self.revision(page, generation)
+        paragraphs = []
+        length = 200
+        while length < self.size:
+            sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 24)))
+            paragraphs.append(f"<p>{sentence}.</p>")
+            length += len(sentence) + 9
+
+        # 変更のたびに1段落ずつ書き換える
+        if paragraphs and revision:
+            paragraphs[revision % len(paragraphs)] = f"<p>Updated content, revision {revision}.</p>"
+
+        return (
+            f"<!DOCTYPE html><html><head><title>Page {page}</title>"
+            f"<script>var page = {page};</script></head>"
+            f"<body><h1>Page {page}</h1>{''.join(paragraphs)}</body></html>"
+        )
+
+def _lastmod(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    """
+    /page/<番号> とサイトマップを返すHTTPハンドラ
+    """
+    options = SiteOptions()
+    generation = None
+    started_at = None
+    base_url = ''
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sitemap_index(self):
+        chunks = math.ceil(self.options.pages / self.options.sitemap_chunk)
+        entries = ''.join(
+            f"<sitemap><loc>{self.base_url}/sitemaps/{index}.xml.gz</loc></sitemap>"
+            for index in range(chunks)
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="{SITEMAP_NS}">{entries}</sitemapindex>'
+
+    def _sitemap(self, index):
+        generation = self.generation.value
+        first = index * self.options.sitemap_chunk
+        last = min(self.options.pages, first + self.options.sitemap_chunk)
+        entries = ''.join(
+            f"<url><loc>{self.base_url}/page/{page}</loc>"
+            f"<lastmod>{_lastmod(self.started_at[self.options.modified_generation(page, generation)])}</lastmod></url>\n"
+            for page in range(first, last)
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n{entries}</urlset>'
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts == ['sitemap.xml']:
+            self._send(self._sitemap_index().encode('utf-8'), 'application/xml')
+            return
+        if len(parts) == 2 and parts[0] == 'sitemaps':
+            name = parts[1]
+            index = name.split('.', 1)[0]
+            if index.isdigit() and name.endswith(('.xml', '.xml.gz')):
+                body = self._sitemap(int(index)).encode('utf-8')
+                if name.endswith('.gz'):
+                    self._send(gzip.compress(body), 'application/gzip')
+                else:
+                    self._send(body, 'application/xml')
+                return
+        if len(parts) != 2 or parts[0] != 'page' or not parts[1].isdigit():
+            self.send_error(404)
+            return
+
+        page = int(parts[1])
+        generation = self.generation.value
+        if self.options.latency_ms:
+            time.sleep(self.options.latency_ms / 1000)
+        if self.options.is_error(page, generation):
+            self.send_error(500)
+            return
+
+        self._send(self.options.render(page, generation).encode('utf-8'), 'text/html; charset=utf-8')
+
+    def log_message(self, format, *args):
+        pass
+
+def _serve(options, generation, started_at, host, port, ready):
+    """
+    子プロセスでサーバーを起動する
+    """
+    _SiteHandler.options = options
+    _SiteHandler.generation = generation
+    _SiteHandler.started_at = started_at
+    server = ThreadingHTTPServer((host, port), _SiteHandler)
+    server.daemon_threads = True
+    _SiteHandler.base_url = f"http://{host}:{server.server_port}"
+    ready.send(server.server_port)
+    ready.close()
+    server.serve_forever()
+
+class SyntheticSite:
+    """
+    合成サイトのサーバープロセスを管理するクラス
+
+    with SyntheticSite(SiteOptions(size=50000)) as site:
+        urls = site.urls(100)
+        site.next_run()
+    """
+
+    def __init__(self, options=None, host='127.0.0.1', port=0):
+        self.options = options or SiteOptions()
+        self.host = host
+        self.port = port
+        self.generation = multiprocessing.Value('i', 0)
+        # 世代ごとの開始時刻（サイトマップの lastmod に使う）
+        self.started_at = multiprocessing.Array('d', MAX_GENERATIONS)
+        self.started_at[0] = time.time()
+        self.process = None
+
+    def start(self):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=_serve,
+            args=(self.options, self.generation, self.started_at, self.host, self.port, sender),
+            daemon=True
+        )
+        self.process.start()
+        self.port = receiver.recv()
+        receiver.close()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def url(self, page):
+        return f"{self.base_url}/page/{page}"
+
+    def urls(self, count):
+        return [self.url(page) for page in range(count)]
+
+    @property
+    def sitemap_url(self):
+        return f"{self.base_url}/sitemap.xml"
+
+    def next_run(self):
+        """
+        世代を進め、変更率に応じて一部のページを変化させる
+        """
+        with self.generation.get_lock():
+            generation = self.generation.value + 1
+            if generation >= MAX_GENERATIONS:
+                raise RuntimeError(f"at most {MAX_GENERATIONS - 1} runs are supported")
+            self.started_at[generation] = time.time()
+            self.generation.value = generation
+        return generation
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic pages for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--size', type=int, default=20000, help='Approximate page size in bytes')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay before each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--mutation-rate', type=float, default=0.1, help='Fraction of pages changed per run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pages', type=int, default=1000, help='Number of pages listed in /sitemap.xml')
+    args = parser.parse_args()
+
+    options = SiteOptions(args.size, args.latency_ms, args.error_rate, args.mutation_rate, args.seed, args.pages)
+    with SyntheticSite(options, args.host, args.port) as site:
+        print(f"Serving synthetic pages at {site.base_url}/page/<n> (press Enter to advance a run, Ctrl+C to stop)")
+        try:
+            for _ in sys.stdin:
+                print(f"Run {site.next_run()}")
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+URL×日付ごとの集計テーブルを提供するモジュール
+
+監視結果を保存するたびに、その実行で触れた日付のパーティション
+(data/results/aggregates/YYYYMMDD.arrow) だけを更新する。
+レポートは生の監視結果ではなくこの集計テーブルを読み込む。
+加算済みの書き込みの識別子 (batch_id) はパーティションのメタデータに記録し、
+同じ監視結果を二重に加算しないようにする。
+ストア導入前のCSVレポートは migrate_legacy_reports で1回だけ結果ストアに取り込み、
+集計テーブルと変更履歴インデックスを作り直す。
+"""
+import os
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from logger import get_logger
+from store import RESULTS_DIR, read_results, stored_dates, import_legacy_csv
+from history_index import rebuild_index
+from utils import load_json_state, save_json_state_atomic
+
+logger = get_logger()
+
+AGGREGATES_DIR = RESULTS_DIR / 'aggregates'
+PARTITION_SUFFIX = '.arrow'
+LEGACY_STATE_PATH = Path('data/state/legacy_import.json')
+
+# 集計テーブルのスキーマ
+AGGREGATE_SCHEMA = pa.schema([
+    ('url', pa.string()),
+    ('date', pa.date32()),
+    ('checks', pa.int64()),
+    ('changes', pa.int64()),
+    ('failures', pa.int64()),
+    ('latency_count', pa.int64()),
+    ('latency_sum_ms', pa.float64()),
+    ('latency_min_ms', pa.float64()),
+    ('latency_max_ms', pa.float64())
+])
+
+def _partition_path(date_str, base_dir=AGGREGATES_DIR):
+    """
+    日付パーティションのファイルパスを返す関数
+    """
+    return Path(base_dir) / f"{date_str}{PARTITION_SUFFIX}"
+
+def _read_partition(path):
+    """
+    集計パーティションを読み込む関数
+
+    Returns:
+        pyarrow.Table: 集計テーブル（存在しない場合は空のテーブル）
+    """
+    if not path.exists():
+        return AGGREGATE_SCHEMA.empty_table()
+    with pa.OSFile(str(path), 'rb') as source:
+        return ipc.open_file(source).read_all()
+
+def _applied_batches(table):
+    """
+    集計パーティションに加算済みの batch_id のリストを返す関数
+    """
+    metadata = table.schema.metadata or {}
+    return json.loads(metadata.get(b'batches', b'[]'))
+
+def _write_partition(path, rows, batches=()):
+    """
+    集計パーティションを一時ファイル経由で置き換える関数
+    """
+    schema = AGGREGATE_SCHEMA.with_metadata({'batches': json.dumps(list(batches))})
+    table = pa.Table.from_pylist(rows, schema=schema)
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def _is_failure(record):
+    """
+    監視結果が取得失敗かを判定する関数
+    """
+    return bool(record.get('error'))
+
+def _merge_record(row, record):
+    """
+    1件の監視結果を集計行に加算する関数
+
+    取得結果を共有した監視対象は、取得・解析の時間を代表の監視対象にだけ記録するため、
+    取得していない行（fetch_ms が0の行）は所要時間の集計に含めない。fetch_ms 列がない
+    行（列の追加前の結果）はこれまでどおり elapsed_ms を集計する
+    """
+    row['checks'] += 1
+    if record.get('has_changed'):
+        row['changes'] += 1
+    if _is_failure(record):
+        row['failures'] += 1
+
+    fetch_ms = record.get('fetch_ms')
+    if fetch_ms is not None and fetch_ms == fetch_ms and not fetch_ms:
+        return
+    latency = record.get('elapsed_ms')
+    if latency is not None and latency == latency:
+        row['latency_count'] += 1
+        row['latency_sum_ms'] += latency
+        row['latency_min_ms'] = latency if row['latency_min_ms'] is None else min(row['latency_min_ms'], latency)
+        row['latency_max_ms'] = latency if row['latency_max_ms'] is None else max(row['latency_max_ms'], latency)
+
+def _empty_row(url, date):
+    """
+    空の集計行を作成する関数
+    """
+    return {
+        'url': url,
+        'date': date,
+        'checks': 0,
+        'changes': 0,
+        'failures': 0,
+        'latency_count': 0,
+        'latency_sum_ms': 0.0,
+        'latency_min_ms': None,
+        'latency_max_ms': None
+    }
+
+def merge_aggregates(partitions, records, batch_id=None, base_dir=AGGREGATES_DIR):
+    """
+    監視結果を読み込み済みの集計パーティションに加算する関数（書き込みは write_aggregates で行う）
+
+    監視結果を1件ずつ加算するため、監視結果の件数に関係なくメモリ使用量は集計行の数で決まる
+
+    Args:
+        partitions (dict): 日付をキーとする (パス, URLをキーとする集計行, 加算済みの batch_id) の辞書
+            （加算済みの日付はNone）。呼び出しをまたいで同じ辞書を渡す
+        records (iterable): 監視結果の辞書
+        batch_id (str, optional): 書き込みの識別子。同じ識別子を加算済みの日付には加算しない
+        base_dir (Path): 集計テーブルのディレクトリ
+    """
+    for record in records:
+        # 確認を省略した監視結果は集計しない
+        if record.get('skipped'):
+            continue
+        timestamp = record['timestamp']
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        date = timestamp.date()
+
+        if date not in partitions:
+            path = _partition_path(date.strftime('%Y%m%d'), base_dir)
+            table = _read_partition(path)
+            batches = _applied_batches(table)
+            if batch_id in batches:
+                logger.debug(f"Batch {batch_id} is already aggregated in {path}")
+                partitions[date] = None
+                continue
+            if batch_id is not None:
+                batches.append(batch_id)
+            partitions[date] = (path, {row['url']: row for row in table.to_pylist()}, batches)
+
+        partition = partitions[date]
+        if partition is None:
+            continue
+        rows = partition[1]
+        url = record['url']
+        if url not in rows:
+            rows[url] = _empty_row(url, date)
+        _merge_record(rows[url], record)
+
+def write_aggregates(partitions):
+    """
+    merge_aggregates で加算した集計パーティションを書き込む関数
+
+    Returns:
+        int: 書き込んだ集計行の数
+    """
+    updated = 0
+    for partition in partitions.values():
+        if partition is None:
+            continue
+        path, rows, batches = partition
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_partition(path, list(rows.values()), batches)
+        updated += len(rows)
+    return updated
+
+def update_aggregates(records, base_dir=AGGREGATES_DIR, batch_id=None):
+    """
+    監視結果を集計テーブルに加算する関数
+
+    Args:
+        records (iterable): 監視結果の辞書
+        base_dir (Path): 集計テーブルのディレクトリ
+        batch_id (str, optional): 書き込みの識別子。同じ識別子を加算済みの日付には加算しない
+
+    Returns:
+        int: 更新した集計行の数
+    """
+    partitions = {}
+    merge_aggregates(partitions, records, batch_id, Path(base_dir))
+    updated = write_aggregates(partitions)
+    logger.debug(f"Updated aggregates for {len(partitions)} day(s)")
+    return updated
+
+def load_aggregates(days=30, base_dir=AGGREGATES_DIR):
+    """
+    直近n日分の集計テーブルを読み込む関数
+
+    Args:
+        days (int): 読み込む日数
+        base_dir (Path): 集計テーブルのディレクトリ
+
+    Returns:
+        pandas.DataFrame: url, date, checks, changes, failures, 応答時間統計の列を持つデータフレーム
+    """
+    base_dir = Path(base_dir)
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days)
+
+    tables = []
+    current_date = start_date
+    while current_date <= end_date:
+        path = _partition_path(current_date.strftime('%Y%m%d'), base_dir)
+        if path.exists():
+            tables.append(_read_partition(path))
+        current_date += timedelta(days=1)
+
+    if not tables:
+        return AGGREGATE_SCHEMA.empty_table().to_pandas()
+
+    data = pa.concat_tables(tables).to_pandas()
+    data['date'] = data['date'].astype('datetime64[ns]')
+    data['latency_mean_ms'] = data['latency_sum_ms'] / data['latency_count'].where(data['latency_count'] > 0)
+    return data
+
+def rebuild_aggregates(days=30, base_dir=AGGREGATES_DIR):
+    """
+    結果ストアから集計テーブルを作り直す関数（集計テーブル導入前のデータの取り込み用）
+
+    Args:
+        days (int): 作り直す日数
+        base_dir (Path): 集計テーブルのディレクトリ
+
+    Returns:
+        int: 作成した集計行の数
+    """
+    end = datetime.now()
+    start = datetime.combine((end - timedelta(days=days)).date(), datetime.min.time())
+    columns = ['timestamp', 'url', 'has_changed', 'error', 'elapsed_ms', 'fetch_ms', 'skipped']
+    records = read_results(start, end, columns).to_pylist()
+
+    # 対象期間のパーティションを削除してから再集計
+    base_dir = Path(base_dir)
+    if base_dir.exists():
+        for path in base_dir.glob(f"*{PARTITION_SUFFIX}"):
+            if path.stem >= start.strftime('%Y%m%d'):
+                path.unlink()
+
+    updated = update_aggregates(records, base_dir)
+    logger.info(f"Rebuilt aggregates from {len(records)} results")
+    return updated
+
+def migrate_legacy_reports(state_path=LEGACY_STATE_PATH):
+    """
+    ストア導入前のCSVレポートを取り込み、集計テーブルと変更履歴インデックスを作り直す関数
+
+    1回だけ実行する（完了したことを state_path に記録する）。取り込みの対象外とする日付
+    （移行を始める前からストアにある日付）は最初に記録するため、途中で中断しても続きから
+    同じ条件でやり直せる
+
+    Args:
+        state_path (Path): 移行の状態の保存先
+
+    Returns:
+        int: 取り込んだ日数（移行済みの場合は0）
+    """
+    state = load_json_state(state_path)
+    if state.get('finished'):
+        return 0
+    if 'exclude_dates' not in state:
+        state['exclude_dates'] = sorted(stored_dates())
+        save_json_state_atomic(state, state_path)
+
+    imported = import_legacy_csv(state['exclude_dates'])
+    if imported:
+        # 取り込んだ最も古い日付から今日までを作り直す
+        oldest = datetime.strptime(min(imported), '%Y%m%d').date()
+        days = (datetime.now().date() - oldest).days
+        rebuild_aggregates(days)
+        rebuild_index(days)
+
+    state.update({'finished': True, 'imported_dates': sorted(imported), 'migrated_at': datetime.now().isoformat()})
+    save_json_state_atomic(state, state_path)
+    return len(imported)
@@ -0,0 +1,447 @@
+"""
+レポート・スクリーンショット・監視履歴の保持期間を管理し、古いデータを圧縮するモジュール
+
+settings.json の retention セクションの方針に従って、次の処理を行う。
+
+- 実行ごとのCSVレポート: csv_days を過ぎた日付は日次のgzip圧縮CSV
+  (reports/archive/daily/YYYYMMDD.csv.gz) に、monthly_after_days を過ぎた日次CSVは
+  月次のgzip圧縮CSV (reports/archive/monthly/YYYYMM.csv.gz) にまとめる
+- スクリーンショット: screenshot_downsample_days を過ぎたものは screenshot_max_width まで
+  縮小し、picture_delete_days を過ぎた画像（グラフを含む）は削除する
+- 監視履歴: URLリストから外れて history_orphan_days が過ぎた data/history の履歴を、
+  変更履歴インデックスの変更イベント・差分 (data/diffs) とともに削除する
+- 変更履歴: change_history_days を過ぎた変更イベントと差分を削除する。削除した
+  スクリーンショットを参照している変更イベントの screenshot_path は空にする
+- 結果ストア: results_days を過ぎた日付パーティションを削除する（0の場合は削除しない）
+
+月末の集計などで実行時間が延びないよう、監視の最後に実行する場合は interval_hours ごとに
+1回だけ実行する。
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from logger import get_logger
+from utils import load_json_state, save_json_state_atomic
+from history_index import HISTORY_DIR, DIFFS_DIR, url_key, prune_events, clear_screenshot_paths
+
+logger = get_logger()
+
+REPORTS_DIR = Path('reports')
+ARCHIVE_DIR = REPORTS_DIR / 'archive'
+STATE_PATH = Path('data/state/compaction.json')
+
+DEFAULT_CSV_DAYS = 7
+DEFAULT_MONTHLY_AFTER_DAYS = 90
+DEFAULT_SCREENSHOT_DOWNSAMPLE_DAYS = 30
+DEFAULT_SCREENSHOT_MAX_WIDTH = 640
+DEFAULT_PICTURE_DELETE_DAYS = 180
+DEFAULT_HISTORY_ORPHAN_DAYS = 7
+DEFAULT_CHANGE_HISTORY_DAYS = 365
+DEFAULT_INTERVAL_HOURS = 24
+
+PICTURE_SUFFIXES = ('.png', '.jpg', '.jpeg')
+
+# 空でも削除しない直近の日付ディレクトリの日数（今日の実行とバックグラウンドの描画、
+# 日付をまたいだ実行が書き込み中の可能性があるため、今日と前日は残す）
+ACTIVE_DAYS = 1
+
+class CompactionReport:
+    """
+    コンパクションの結果（処理した件数と削減したバイト数）
+    """
+    __slots__ = ('counts', 'bytes_before', 'bytes_after', 'seconds')
+
+    def __init__(self):
+        self.counts = {}
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.seconds = 0.0
+
+    def add(self, name, count=1, before=0, after=0):
+        """
+        処理の件数と、処理前後のバイト数を加算する
+        """
+        self.counts[name] = self.counts.get(name, 0) + count
+        self.bytes_before += before
+        self.bytes_after += after
+
+    @property
+    def reclaimed_bytes(self):
+        return self.bytes_before - self.bytes_after
+
+    def to_dict(self):
+        return {
+            **self.counts,
+            'reclaimed_bytes': self.reclaimed_bytes,
+            'seconds': round(self.seconds, 3)
+        }
+
+    def __repr__(self):
+        counts = ', '.join(f"{name} {count}" for name, count in self.counts.items()) or 'nothing to do'
+        return f"{counts}; reclaimed {self.reclaimed_bytes / (1024 * 1024):.1f} MB in {self.seconds:.1f} s"
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _age_days(date_str, today):
+    """
+    YYYYMMDD形式の日付の経過日数を返す（日付でない場合はNone）
+    """
+    try:
+        return (today - datetime.strptime(date_str, '%Y%m%d').date()).days
+    except ValueError:
+        return None
+
+def _report_days(reports_dir):
+    """
+    reports 以下の日付ディレクトリを古い順に返す
+    """
+    if not reports_dir.exists():
+        return []
+    return sorted(path for path in reports_dir.iterdir() if path.is_dir() and len(path.name) == 8 and path.name.isdigit())
+
+def _merge_csv(sources, output_path):
+    """
+    CSVファイルを1つのgzip圧縮CSVにまとめる（出力先が既にある場合はその内容に追加する）
+
+    Returns:
+        list: まとめることができた入力ファイルのパス（読み込めなかったファイルは含まない）
+    """
+    import pandas as pd
+
+    frames = []
+    merged = []
+    if output_path.exists():
+        frames.append(pd.read_csv(output_path))
+    for path in sources:
+        try:
+            frames.append(pd.read_csv(path))
+            merged.append(path)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable CSV {path}: {e}")
+    if not merged:
+        return []
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    data = pd.concat(frames, ignore_index=True)
+    if 'timestamp' in data.columns:
+        data = data.sort_values('timestamp', kind='stable')
+    data.to_csv(tmp_path, index=False, compression='gzip')
+    os.replace(tmp_path, output_path)
+    return merged
+
+def _remove_empty_dirs(path):
+    """
+    空になったディレクトリを下から順に削除する
+    """
+    for directory in sorted((p for p in path.rglob('*') if p.is_dir()), key=lambda p: len(p.parts), reverse=True):
+        try:
+            directory.rmdir()
+        except OSError:
+            pass
+    try:
+        path.rmdir()
+    except OSError:
+        pass
+
+def compact_csv_reports(report, today, csv_days, monthly_after_days, reports_dir=REPORTS_DIR):
+    """
+    古い実行ごとのCSVを日次に、古い日次CSVを月次にまとめる関数
+    """
+    archive_dir = reports_dir / 'archive'
+    for day_dir in _report_days(reports_dir):
+        age = _age_days(day_dir.name, today)
+        csv_dir = day_dir / 'CSV'
+        if age is None or age <= csv_days or not csv_dir.exists():
+            continue
+        sources = sorted(csv_dir.glob('*.csv'))
+        if not sources:
+            continue
+
+        output_path = archive_dir / 'daily' / f"{day_dir.name}.csv.gz"
+        before = sum(_size(path) for path in sources) + _size(output_path)
+        merged = _merge_csv(sources, output_path)
+        for path in merged:
+            path.unlink()
+        report.add('csv_rolled_daily', len(merged), before, _size(output_path) + sum(_size(path) for path in sources if path not in merged))
+        _remove_empty_dirs(csv_dir)
+
+    daily_dir = archive_dir / 'daily'
+    if not daily_dir.exists():
+        return
+
+    # 日次CSVを月ごとにまとめる
+    by_month = {}
+    for path in sorted(daily_dir.glob('*.csv.gz')):
+        date_str = path.name[:8]
+        age = _age_days(date_str, today)
+        if age is not None and age > monthly_after_days:
+            by_month.setdefault(date_str[:6], []).append(path)
+
+    for month, sources in by_month.items():
+        output_path = archive_dir / 'monthly' / f"{month}.csv.gz"
+        before = sum(_size(path) for path in sources) + _size(output_path)
+        merged = _merge_csv(sources, output_path)
+        for path in merged:
+            path.unlink()
+        report.add('csv_rolled_monthly', len(merged), before, _size(output_path) + sum(_size(path) for path in sources if path not in merged))
+
+def _downsample(path, max_width):
+    """
+    画像を max_width まで縮小して同じパス・同じ形式で保存する
+
+    Returns:
+        bool: 縮小した場合はTrue（既に小さい場合はFalse、Pillowがない場合はNone）
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        # 縮小できない場合は元の画像をそのまま残す
+        return None
+
+    with Image.open(path) as image:
+        if image.width <= max_width:
+            return False
+        height = max(1, round(image.height * max_width / image.width))
+        resized = image.resize((max_width, height), Image.LANCZOS)
+        image_format = image.format
+
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    options = {'optimize': True}
+    if image_format == 'JPEG':
+        options['quality'] = 70
+        resized = resized.convert('RGB')
+    resized.save(tmp_path, format=image_format, **options)
+    os.replace(tmp_path, path)
+    return True
+
+def compact_pictures(report, today, downsample_days, max_width, delete_days, reports_dir=REPORTS_DIR):
+    """
+    古いスクリーンショットを縮小し、さらに古い画像を削除する関数
+
+    縮小は同じパス・同じ形式で行うため、変更履歴インデックスの screenshot_path はそのまま使える。
+    削除したスクリーンショットを参照している screenshot_path は空にする
+    """
+    can_downsample = bool(downsample_days and max_width)
+
+    deleted_screenshots = []
+    for day_dir in _report_days(reports_dir):
+        age = _age_days(day_dir.name, today)
+        picture_dir = day_dir / 'PICTURE'
+        if age is None or not picture_dir.exists():
+            continue
+
+        if delete_days and age > delete_days:
+            pictures = [path for path in picture_dir.iterdir() if path.suffix.lower() in PICTURE_SUFFIXES]
+            before = sum(_size(path) for path in pictures)
+            for path in pictures:
+                path.unlink()
+                if path.name.startswith('screenshot_'):
+                    deleted_screenshots.append(path)
+            report.add('pictures_deleted', len(pictures), before, 0)
+            _remove_empty_dirs(picture_dir)
+            continue
+
+        if can_downsample and age > downsample_days:
+            for path in picture_dir.glob('screenshot_*'):
+                if path.suffix.lower() not in PICTURE_SUFFIXES:
+                    continue
+                before = _size(path)
+                try:
+                    downsampled = _downsample(path, max_width)
+                except Exception as e:
+                    logger.warning(f"Could not downsample {path}: {e}")
+                    continue
+                if downsampled is None:
+                    logger.warning("Pillow is not installed, keeping screenshots at full size")
+                    can_downsample = False
+                    break
+                if downsampled:
+                    report.add('screenshots_downsampled', 1, before, _size(path))
+
+    if deleted_screenshots:
+        report.add('screenshot_refs_cleared', clear_screenshot_paths(deleted_screenshots))
+
+    # 中身のなくなった日付ディレクトリを削除する
+    for day_dir in _report_days(reports_dir):
+        age = _age_days(day_dir.name, today)
+        if age is None or age <= ACTIVE_DAYS:
+            continue
+        if not any(day_dir.rglob('*.*')):
+            _remove_empty_dirs(day_dir)
+
+def prune_history(report, targets, orphan_days, history_dir=HISTORY_DIR):
+    """
+    URLリストから外れた監視対象の履歴を削除する関数
+
+    一時的にリストから外しただけの監視対象の履歴を残すため、最終更新から orphan_days 日を
+    過ぎたものだけを削除する。URLリストが空の場合は何も削除しない
+
+    Returns:
+        set: 履歴を削除したURLのキー（url_key の値）
+    """
+    history_dir = Path(history_dir)
+    pruned = set()
+    if not targets or not history_dir.exists():
+        return pruned
+    keys = {url_key(target.url) for target in targets}
+    threshold = time.time() - orphan_days * 86400
+    for path in history_dir.glob('*.json'):
+        if path.stem in keys:
+            continue
+        try:
+            stat = path.stat()
+            if stat.st_mtime > threshold:
+                continue
+            path.unlink()
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+            continue
+        pruned.add(path.stem)
+        report.add('history_pruned', 1, stat.st_size, 0)
+    return pruned
+
+def prune_change_history(report, today, change_days, pruned_keys, diffs_dir=DIFFS_DIR):
+    """
+    古い変更イベントと、履歴を削除したURLの変更イベントを差分とともに削除する関数
+
+    Args:
+        report (CompactionReport): 結果の集計先
+        today (date): 今日の日付
+        change_days (int): 変更履歴の保持日数（0の場合は古さでは削除しない）
+        pruned_keys (set): prune_history で履歴を削除したURLのキー
+        diffs_dir (Path): 差分の保存先ディレクトリ
+    """
+    before = datetime.combine(today - timedelta(days=change_days), datetime.min.time()) if change_days else None
+    deleted, diff_paths = prune_events(before, pruned_keys)
+    if deleted:
+        report.add('change_events_pruned', deleted)
+
+    removed = size = 0
+    for diff_path in diff_paths:
+        diff_size = _size(diff_path)
+        try:
+            os.remove(diff_path)
+        except OSError:
+            continue
+        removed += 1
+        size += diff_size
+    for day_dir in {Path(diff_path).parent for diff_path in diff_paths}:
+        _remove_empty_dirs(day_dir)
+
+    # インデックスに記録されなかった差分も日付ディレクトリごと削除する
+    diffs_dir = Path(diffs_dir)
+    if change_days and diffs_dir.exists():
+        for day_dir in sorted(path for path in diffs_dir.iterdir() if path.is_dir()):
+            age = _age_days(day_dir.name, today)
+            if age is None or age <= change_days:
+                continue
+            for path in day_dir.iterdir():
+                diff_size = _size(path)
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                removed += 1
+                size += diff_size
+            _remove_empty_dirs(day_dir)
+
+    if removed:
+        report.add('diffs_deleted', removed, size, 0)
+
+def apply_results_retention(report, today, results_days):
+    """
+    保持期間を過ぎた結果ストアと集計テーブルの日付パーティションを削除する関数
+    """
+    if not results_days:
+        return
+    from store import RESULTS_DIR, RUNS_DIR, PARTITION_SUFFIX, INDEX_SUFFIX
+    from aggregates import AGGREGATES_DIR, PARTITION_SUFFIX as AGGREGATE_SUFFIX
+
+    for directory, suffix in ((RESULTS_DIR, PARTITION_SUFFIX), (RUNS_DIR, PARTITION_SUFFIX), (AGGREGATES_DIR, AGGREGATE_SUFFIX)):
+        if not directory.exists():
+            continue
+        for path in directory.glob(f"*{suffix}"):
+            age = _age_days(path.name[:-len(suffix)], today)
+            if age is not None and age > results_days:
+                # 結果ストアのサイドカーファイルもあわせて削除する
+                index_path = path.with_name(f"{path.name}{INDEX_SUFFIX}")
+                size = _size(path) + _size(index_path)
+                path.unlink()
+                if index_path.exists():
+                    index_path.unlink()
+                report.add('result_partitions_deleted', 1, size, 0)
+
+def is_due(config, now=None, state_path=STATE_PATH):
+    """
+    前回のコンパクションから interval_hours が過ぎているかを返す関数
+    """
+    last_run = load_json_state(state_path).get('last_run')
+    if not last_run:
+        return True
+    now = now or datetime.now()
+    interval = timedelta(hours=float(config.get('interval_hours', DEFAULT_INTERVAL_HOURS)))
+    return now - datetime.fromisoformat(last_run) >= interval
+
+def compact(config, targets=None, now=None, state_path=STATE_PATH):
+    """
+    保持期間の方針に従ってレポート・スクリーンショット・履歴を圧縮・削除する関数
+
+    Args:
+        config (dict): settings.json の retention セクション
+        targets (list, optional): 現在の監視対象（Noneの場合は履歴の削除を行わない）
+        now (datetime, optional): 現在日時
+        state_path (Path): 最終実行日時の保存先
+
+    Returns:
+        CompactionReport: 処理した件数・削減したバイト数・所要時間
+    """
+    now = now or datetime.now()
+    today = now.date()
+    report = CompactionReport()
+    started_at = time.perf_counter()
+
+    pruned_keys = set()
+    steps = (
+        ('csv', lambda: compact_csv_reports(
+            report, today,
+            int(config.get('csv_days', DEFAULT_CSV_DAYS)),
+            int(config.get('monthly_after_days', DEFAULT_MONTHLY_AFTER_DAYS))
+        )),
+        ('pictures', lambda: compact_pictures(
+            report, today,
+            int(config.get('screenshot_downsample_days', DEFAULT_SCREENSHOT_DOWNSAMPLE_DAYS)),
+            int(config.get('screenshot_max_width', DEFAULT_SCREENSHOT_MAX_WIDTH)),
+            int(config.get('picture_delete_days', DEFAULT_PICTURE_DELETE_DAYS))
+        )),
+        ('history', lambda: pruned_keys.update(prune_history(
+            report, targets,
+            float(config.get('history_orphan_days', DEFAULT_HISTORY_ORPHAN_DAYS))
+        ))),
+        ('change history', lambda: prune_change_history(
+            report, today,
+            int(config.get('change_history_days', DEFAULT_CHANGE_HISTORY_DAYS)),
+            pruned_keys
+        )),
+        ('results', lambda: apply_results_retention(report, today, int(config.get('results_days', 0))))
+    )
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"Error during {name} compaction: {e}")
+
+    report.seconds = time.perf_counter() - started_at
+    try:
+        save_json_state_atomic({'last_run': now.isoformat(), 'last_report': report.to_dict()}, state_path)
+    except Exception as e:
+        logger.error(f"Error saving compaction state: {e}")
+
+    logger.info(f"Compaction finished: {report}")
+    return report
@@ -0,0 +1,221 @@
+"""
+差分の要約と通知用レンダリングを提供するモジュール
+"""
+import io
+import gzip
+import heapq
+import html
+
+from logger import get_logger
+
+logger = get_logger()
+
+# 通知本文のデフォルト上限
+DEFAULT_TOP_HUNKS = 5
+DEFAULT_EMAIL_MAX_BYTES = 100_000
+DEFAULT_SLACK_MAX_CHARS = 1000
+
+# 要約に保持する量の上限（ページサイズに関係なくメモリを一定に保つ）
+MAX_SECTIONS = 50
+MAX_HUNK_LINES = 40
+
+def summarize_diff(diff, top_n=DEFAULT_TOP_HUNKS, max_hunk_lines=MAX_HUNK_LINES):
+    """
+    unified diff 文字列を1回走査して要約を作成する関数
+
+    Args:
+        diff (str): detect_changes が返す unified diff
+        top_n (int): 保持する変更量の大きいハンクの数
+        max_hunk_lines (int): ハンクごとに保持する最大行数
+
+    Returns:
+        dict: 追加行数・削除行数・ハンク数・変更セクション・上位ハンクなどを含む要約
+    """
+    summary = {
+        'added': 0,
+        'removed': 0,
+        'hunks': 0,
+        'sections': [],
+        'top_hunks': [],
+        'total_bytes': len(diff.encode('utf-8')) if diff else 0
+    }
+
+    if not diff:
+        return summary
+
+    # (変更行数, 出現順, ハンク) のヒープで上位N件のみ保持
+    heap = []
+    current = None
+
+    def close_hunk(hunk):
+        if hunk is None or top_n <= 0:
+            return
+        entry = (hunk['changed'], -hunk['index'], hunk)
+        if len(heap) < top_n:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    for line in io.StringIO(diff):
+        line = line.rstrip('\n')
+        if not line:
+            continue
+
+        if line.startswith('@@'):
+            close_hunk(current)
+            summary['hunks'] += 1
+            if len(summary['sections']) < MAX_SECTIONS:
+                summary['sections'].append(line)
+            current = {
+                'index': summary['hunks'],
+                'header': line,
+                'lines': [],
+                'changed': 0,
+                'truncated': False
+            }
+            continue
+
+        # 最初のハンクより前のファイルヘッダ行は数えない
+        if current is None and (line.startswith('+++') or line.startswith('---')):
+            continue
+
+        if line.startswith('+'):
+            summary['added'] += 1
+        elif line.startswith('-'):
+            summary['removed'] += 1
+
+        if current is None:
+            continue
+
+        if line[0] in '+-':
+            current['changed'] += 1
+        if len(current['lines']) < max_hunk_lines:
+            current['lines'].append(line)
+        else:
+            current['truncated'] = True
+
+    close_hunk(current)
+
+    # 変更量の大きい順に並べ、同数の場合は出現順
+    summary['top_hunks'] = [
+        {key: hunk[key] for key in ('header', 'lines', 'changed', 'truncated')}
+        for _, _, hunk in sorted(heap, reverse=True)
+    ]
+
+    logger.opt(lazy=True).debug(
+        "Diff summarized: {} ({} bytes)",
+        lambda: format_summary_line(summary),
+        lambda: summary['total_bytes']
+    )
+    return summary
+
+def format_summary_line(summary):
+    """
+    要約の1行表示を作成する関数
+
+    Args:
+        summary (dict): summarize_diff の戻り値
+
+    Returns:
+        str: 例 "+12 / -3 lines in 4 sections"
+    """
+    return f"+{summary['added']} / -{summary['removed']} lines in {summary['hunks']} sections"
+
+def _hunks_text(summary):
+    """
+    上位ハンクをテキストとして列挙するジェネレータ
+    """
+    for hunk in summary['top_hunks']:
+        yield hunk['header']
+        for line in hunk['lines']:
+            yield line
+        if hunk['truncated']:
+            yield '...'
+
+def render_email_diff(diff, summary, max_bytes=DEFAULT_EMAIL_MAX_BYTES):
+    """
+    メール本文用の差分HTMLを作成する関数
+
+    エスケープした差分全体が上限内であればそのまま、
+    上限を超える場合は要約と上位ハンクのみを上限内で出力する
+    （上限の判定はエスケープ後のバイト数で行う。& や < は最大6倍に増えるため）
+
+    Args:
+        diff (str): unified diff
+        summary (dict): summarize_diff の戻り値
+        max_bytes (int): 差分部分のHTMLの最大バイト数
+
+    Returns:
+        tuple: (差分部分のHTML, 差分全体を添付する必要があるかのブール値)
+    """
+    pre_style = 'background-color: #f5f5f5; padding: 10px; border-radius: 5px;'
+    header = f"<p><strong>Summary:</strong> {html.escape(format_summary_line(summary))}</p>"
+
+    if summary['total_bytes'] <= max_bytes:
+        escaped_diff = html.escape(diff)
+        if len(escaped_diff.encode('utf-8')) <= max_bytes:
+            return f'{header}\n<pre style="{pre_style}">{escaped_diff}</pre>', False
+
+    sections = ''.join(
+        f"<li>{html.escape(section)}</li>" for section in summary['sections']
+    )
+    if summary['hunks'] > len(summary['sections']):
+        sections += f"<li>... and {summary['hunks'] - len(summary['sections'])} more</li>"
+
+    html_head = (
+        f"{header}\n"
+        f"<p>The full diff ({summary['total_bytes']} bytes) exceeds the email size limit "
+        f"and is attached as a compressed file.</p>\n"
+        f"<h4>Changed sections:</h4><ul>{sections}</ul>\n"
+        f"<h4>Largest changes:</h4>\n"
+        f'<pre style="{pre_style}">'
+    )
+
+    # 上位ハンクをエスケープ後のサイズが上限に達するまで追加
+    remaining = max_bytes - len(html_head.encode('utf-8')) - len('... (truncated)\n</pre>')
+    body_lines = []
+    for line in _hunks_text(summary):
+        escaped = html.escape(line) + '\n'
+        size = len(escaped.encode('utf-8'))
+        if size > remaining:
+            body_lines.append('... (truncated)\n')
+            break
+        body_lines.append(escaped)
+        remaining -= size
+
+    return f'{html_head}{"".join(body_lines)}</pre>', True
+
+def render_text_diff(diff, summary, max_chars=DEFAULT_SLACK_MAX_CHARS):
+    """
+    チャット通知用のテキスト差分を作成する関数
+
+    Args:
+        diff (str): unified diff
+        summary (dict): summarize_diff の戻り値
+        max_chars (int): 最大文字数
+
+    Returns:
+        str: 要約行と差分（上限を超える場合は上位ハンク）のテキスト
+    """
+    lines = [format_summary_line(summary)]
+    if diff and len(diff) <= max_chars:
+        lines.append(diff)
+    else:
+        lines.extend(_hunks_text(summary))
+
+    text = '\n'.join(lines)
+    if len(text) > max_chars:
+        text = text[:max_chars] + '...'
+    return text
+
+def compress_diff(diff):
+    """
+    差分全体を添付用にgzip圧縮する関数
+
+    Args:
+        diff (str): unified diff
+
+    Returns:
+        bytes: gzip圧縮された差分
+    """
+    return gzip.compress(diff.encode('utf-8'))
@@ -0,0 +1,331 @@
+"""
+1回の監視の実行時間・転送量・メモリ使用量の上限を管理するモジュール
+
+settings.json の governor セクションで実行ごとの予算（経過時間・受信バイト数・RSS）を
+指定すると、予算に収まらない監視対象は捨てずに次回の実行へ繰り越す。繰り越す順番は
+確認の遅れ（最終確認からの経過時間 - check_frequency）と過去の繰り越し回数で決め、
+遅れている監視対象から先に確認する。繰り越した監視対象は data/state/deferred.json に
+保存する。実行が中断された場合も、再開した実行が中断前に繰り越した監視対象を引き継ぐ。
+
+また、data/state/run.lock で実行中の監視をロックし、タスクスケジューラと常駐モードなど
+複数の実行が重ならないようにする。
+"""
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from logger import get_logger
+from sitemap import last_checked
+from utils import load_json_state, save_json_state_atomic
+
+logger = get_logger()
+
+STATE_DIR = Path('data/state')
+DEFERRED_PATH = STATE_DIR / 'deferred.json'
+LOCK_PATH = STATE_DIR / 'run.lock'
+
+# 予算の超過理由（監視結果の skipped には 'deferred' を記録する）
+REASON_TIME = 'time'
+REASON_BANDWIDTH = 'bandwidth'
+REASON_MEMORY = 'memory'
+
+# 所要時間の見込みに使う指数移動平均の重み
+ESTIMATE_WEIGHT = 0.2
+
+def current_rss_mb():
+    """
+    このプロセスの現在のRSS（MB）を返す関数
+
+    Returns:
+        float: RSS（取得できない環境ではNone）
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/statm', 'r') as file:
+                pages = int(file.read().split()[1])
+            return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+        if os.name == 'nt':
+            import ctypes
+            from ctypes import wintypes
+
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [
+                    ('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t)
+                ]
+
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize / (1024 * 1024)
+            return None
+
+        # その他の環境ではピークRSSで代用する（macOSはバイト単位）
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except Exception as e:
+        logger.debug(f"Could not read RSS: {e}")
+        return None
+
+class RunLock:
+    """
+    監視の実行が重ならないようにするファイルロック
+
+    OSのファイルロックを使うため、プロセスが異常終了した場合もロックは残らない
+    """
+
+    def __init__(self, path=LOCK_PATH):
+        self.path = Path(path)
+        self._file = None
+
+    def _holder(self):
+        """
+        ロックを保持しているプロセスのPIDを返す（読めない場合は空文字列）
+        """
+        try:
+            return self.path.read_text(encoding='utf-8').split()[0]
+        except (OSError, IndexError):
+            return ''
+
+    def acquire(self):
+        """
+        ロックを取得する
+
+        Returns:
+            bool: 取得できた場合はTrue、他の実行が保持している場合はFalse
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        file = open(self.path, 'a+', encoding='utf-8')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            logger.warning(f"Another monitoring run is in progress (pid {self._holder() or 'unknown'}), skipping this run")
+            return False
+
+        file.seek(0)
+        file.truncate()
+        file.write(f"{os.getpid()} {datetime.now().isoformat()}\n")
+        file.flush()
+        self._file = file
+        return True
+
+    def release(self):
+        """
+        ロックを解放する
+        """
+        if self._file is None:
+            return
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError as e:
+            logger.error(f"Error releasing run lock: {e}")
+        finally:
+            # POSIXではクローズ時にロックが解放される
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+def load_deferred(path=DEFERRED_PATH):
+    """
+    繰り越し中の監視対象を読み込む関数
+
+    Returns:
+        dict: URLをキーとする {'since': 最初に繰り越した日時, 'count': 繰り越し回数, 'reason': 理由}
+    """
+    return load_json_state(path)
+
+def save_deferred(deferred, path=DEFERRED_PATH):
+    """
+    繰り越し中の監視対象を保存する関数（一時ファイル経由で置き換える）
+    """
+    save_json_state_atomic(deferred, path)
+
+class Governor:
+    """
+    1回の実行の予算を管理し、予算を超える監視対象を次回に繰り越すクラス
+
+    予算は0または未設定の場合は制限しない。経過時間は1グループあたりの所要時間の
+    見込みを加えて判定するため、予算の終わり際に遅いページを取得し始めることはない
+    """
+
+    def __init__(self, config, started_at=None, deferred_path=DEFERRED_PATH, run_id=''):
+        """
+        Args:
+            config (dict): settings.json の governor セクション
+            started_at (float, optional): 実行開始時刻（time.perf_counter の値）
+            deferred_path (Path): 繰り越し中の監視対象の保存先
+            run_id (str, optional): 実行の識別子（繰り越しを記録した実行として保存する）
+        """
+        self.max_seconds = float(config.get('max_run_seconds') or 0)
+        self.max_bytes = int(float(config.get('max_megabytes') or 0) * 1024 * 1024)
+        self.max_memory_mb = float(config.get('max_memory_mb') or 0)
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.deferred_path = Path(deferred_path)
+        self.run_id = run_id
+        self.previous = load_deferred(self.deferred_path)
+        self.deferred = {}
+        self.received_bytes = 0
+        self.reason = ''
+        self._estimate = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.max_seconds or self.max_bytes or self.max_memory_mb)
+
+    def priority(self, targets, now):
+        """
+        グループの優先度を返す（値が小さいほど先に確認する）
+
+        未確認の監視対象を最優先とし、次に確認の遅れ（分）が大きいもの、
+        遅れが同じ場合は繰り越し回数が多いものを先にする
+        """
+        overdue = None
+        count = 0
+        for target in targets:
+            checked_at = last_checked(target.url)
+            if checked_at is None:
+                target_overdue = float('inf')
+            else:
+                target_overdue = (now - checked_at).total_seconds() / 60 - target.check_frequency
+            overdue = target_overdue if overdue is None else max(overdue, target_overdue)
+            count = max(count, self.previous.get(target.url, {}).get('count', 0))
+        return (-overdue, -count)
+
+    def order(self, groups, now=None):
+        """
+        予算が設定されている場合、グループを優先度の順に並べ替える
+
+        Args:
+            groups (list): group_targets の戻り値
+            now (datetime, optional): 現在日時
+
+        Returns:
+            list: 並べ替えたグループ
+        """
+        if not self.enabled:
+            return groups
+        now = now or datetime.now()
+        return sorted(groups, key=lambda group: self.priority(group[1], now))
+
+    def admit(self):
+        """
+        次のグループを今回の実行で確認できるかを判定する
+
+        Returns:
+            bool: 確認できる場合はTrue（予算を超えた後は常にFalse）
+        """
+        if self.reason:
+            return False
+
+        if self.max_seconds:
+            elapsed = time.perf_counter() - self.started_at
+            if elapsed + self._estimate > self.max_seconds:
+                self.reason = REASON_TIME
+        if not self.reason and self.max_bytes and self.received_bytes >= self.max_bytes:
+            self.reason = REASON_BANDWIDTH
+        if not self.reason and self.max_memory_mb:
+            rss = current_rss_mb()
+            if rss is not None and rss >= self.max_memory_mb:
+                self.reason = REASON_MEMORY
+
+        if self.reason:
+            logger.warning(f"Run budget exhausted ({self.reason}), deferring the remaining targets to the next run")
+            return False
+        return True
+
+    def account(self, results, seconds):
+        """
+        確認したグループの受信バイト数と所要時間を加算する
+
+        Args:
+            results (list): グループ内の監視対象の監視結果
+            seconds (float): グループの所要時間（秒）
+        """
+        self.received_bytes += sum(result.get('response_bytes', 0) for result in results)
+        if self._estimate:
+            self._estimate += ESTIMATE_WEIGHT * (seconds - self._estimate)
+        else:
+            self._estimate = seconds
+
+    def defer(self, target, now=None):
+        """
+        監視対象を次回の実行に繰り越す
+        """
+        now = now or datetime.now()
+        previous = self.previous.get(target.url, {})
+        self.deferred[target.url] = {
+            'since': previous.get('since', now.isoformat()),
+            'count': previous.get('count', 0) + 1,
+            'reason': self.reason,
+            'run': self.run_id
+        }
+
+    def resume(self, urls, now=None):
+        """
+        再開した実行で、中断前に繰り越した監視対象を繰り越し一覧に戻す
+
+        中断前の実行は繰り越し一覧を保存していないため、前回の実行の繰り越し回数に
+        1を加える（この実行の繰り越しとして保存済みのものはそのまま使う）
+
+        Args:
+            urls (iterable): 中断前に繰り越した監視対象のURL
+            now (datetime, optional): 現在日時
+        """
+        now = now or datetime.now()
+        for url in urls:
+            previous = self.previous.get(url, {})
+            if self.run_id and previous.get('run') == self.run_id:
+                self.deferred[url] = previous
+                continue
+            self.deferred[url] = {
+                'since': previous.get('since', now.isoformat()),
+                'count': previous.get('count', 0) + 1,
+                'reason': previous.get('reason', ''),
+                'run': self.run_id
+            }
+
+    def save(self):
+        """
+        繰り越した監視対象を保存する（今回確認した監視対象は一覧から外れる）
+
+        Returns:
+            int: 繰り越した監視対象の数
+        """
+        if self.deferred or self.previous:
+            try:
+                save_deferred(self.deferred, self.deferred_path)
+            except Exception as e:
+                logger.error(f"Error saving deferred targets: {e}")
+        if self.deferred:
+            oldest = min(entry['since'] for entry in self.deferred.values())
+            logger.info(f"Deferred {len(self.deferred)} targets to the next run (oldest since {oldest})")
+        return len(self.deferred)
@@ -0,0 +1,296 @@
+"""
+URLごとの変更履歴のインデックスと検索機能を提供するモジュール
+
+変更を検出した監視結果を (url, timestamp) でインデックス化したSQLiteデータベース
+(data/history_index.sqlite) に記録し、差分本体は data/diffs/ 以下に圧縮して保存する。
+"""
+import gzip
+import sqlite3
+import hashlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from logger import get_logger
+from store import read_results
+
+logger = get_logger()
+
+INDEX_PATH = Path('data/history_index.sqlite')
+DIFFS_DIR = Path('data/diffs')
+HISTORY_DIR = Path('data/history')
+
+# インデックスに保存する列
+EVENT_COLUMNS = (
+    'url',
+    'timestamp',
+    'name',
+    'status_code',
+    'lines_added',
+    'lines_removed',
+    'diff_path',
+    'screenshot_path'
+)
+
+def _connect(index_path=INDEX_PATH):
+    """
+    インデックスに接続し、必要ならテーブルとインデックスを作成する関数
+    """
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(index_path))
+    connection.row_factory = sqlite3.Row
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS change_events (
+            url TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            name TEXT,
+            status_code INTEGER,
+            lines_added INTEGER,
+            lines_removed INTEGER,
+            diff_path TEXT,
+            screenshot_path TEXT,
+            PRIMARY KEY (url, timestamp)
+        ) WITHOUT ROWID;
+    ''')
+    return connection
+
+def url_key(url):
+    """
+    URLから履歴ファイル名などに使うキーを生成する関数
+
+    Args:
+        url (str): URL
+
+    Returns:
+        str: URLのMD5ハッシュ値
+    """
+    return hashlib.md5(url.encode()).hexdigest()
+
+def save_diff(url, timestamp, diff, diffs_dir=DIFFS_DIR):
+    """
+    検出した差分を圧縮して保存する関数
+
+    Args:
+        url (str): URL
+        timestamp (str): 監視結果のタイムスタンプ（ISO形式）
+        diff (str): unified diff
+        diffs_dir (Path): 差分の保存先ディレクトリ
+
+    Returns:
+        str: 保存した差分ファイルのパス（失敗した場合は空文字列）
+    """
+    try:
+        checked_at = datetime.fromisoformat(timestamp)
+        diff_dir = Path(diffs_dir) / checked_at.strftime('%Y%m%d')
+        diff_dir.mkdir(parents=True, exist_ok=True)
+
+        diff_path = diff_dir / f"{url_key(url)}_{checked_at.strftime('%H%M%S%f')}.diff.gz"
+        with gzip.open(diff_path, 'wt', encoding='utf-8') as file:
+            file.write(diff)
+
+        return str(diff_path)
+
+    except Exception as e:
+        logger.error(f"Error saving diff for {url}: {e}")
+        return ""
+
+def _event_row(result):
+    """
+    監視結果からインデックスの1行を作成する関数
+    """
+    timestamp = result['timestamp']
+    if not isinstance(timestamp, str):
+        timestamp = timestamp.isoformat()
+    return (
+        result['url'],
+        timestamp,
+        result.get('name', ''),
+        result.get('status_code', 0),
+        result.get('lines_added', 0),
+        result.get('lines_removed', 0),
+        result.get('diff_path', ''),
+        result.get('screenshot_path', '')
+    )
+
+def record_changes(results, index_path=INDEX_PATH):
+    """
+    変更を検出した監視結果をインデックスに記録する関数
+
+    Args:
+        results (list): 監視結果の辞書のリスト
+        index_path (Path): インデックスのパス
+
+    Returns:
+        int: 記録した変更イベントの数
+    """
+    rows = [_event_row(result) for result in results if result.get('has_changed')]
+    if not rows:
+        return 0
+
+    connection = _connect(index_path)
+    try:
+        with connection:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO change_events ({', '.join(EVENT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in EVENT_COLUMNS)})",
+                rows
+            )
+    finally:
+        connection.close()
+
+    logger.debug(f"Indexed {len(rows)} change events")
+    return len(rows)
+
+def _read_diff(diff_path):
+    """
+    保存済みの差分を読み込む関数
+    """
+    try:
+        with gzip.open(diff_path, 'rt', encoding='utf-8') as file:
+            return file.read()
+    except OSError:
+        return ""
+
+def query_history(url, start=None, end=None, include_diff=False, limit=None, index_path=INDEX_PATH, before=None):
+    """
+    URLと期間を指定して変更イベントを検索する関数
+
+    Args:
+        url (str): 対象のURL
+        start (datetime, optional): 開始日時（含む）
+        end (datetime, optional): 終了日時（含む）
+        include_diff (bool): 差分本体も読み込むか
+        limit (int, optional): 新しい順に返す最大件数
+        index_path (Path): インデックスのパス
+        before (datetime, optional): 終了日時（含まない。日付単位の指定で翌日0時を渡す場合に使う）
+
+    Returns:
+        list: 変更イベントの辞書のリスト（新しい順）
+    """
+    if not Path(index_path).exists():
+        return []
+
+    conditions = ['url = ?']
+    params = [url]
+    if start is not None:
+        conditions.append('timestamp >= ?')
+        params.append(start.isoformat())
+    if end is not None:
+        conditions.append('timestamp <= ?')
+        params.append(end.isoformat())
+    if before is not None:
+        conditions.append('timestamp < ?')
+        params.append(before.isoformat())
+
+    sql = f"SELECT {', '.join(EVENT_COLUMNS)} FROM change_events WHERE {' AND '.join(conditions)} ORDER BY timestamp DESC"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+
+    connection = _connect(index_path)
+    try:
+        events = [dict(row) for row in connection.execute(sql, params)]
+    finally:
+        connection.close()
+
+    if include_diff:
+        for event in events:
+            event['diff'] = _read_diff(event['diff_path']) if event['diff_path'] else ""
+
+    return events
+
+def rebuild_index(days=30, index_path=INDEX_PATH):
+    """
+    結果ストアからインデックスを作り直す関数（インデックス導入前のデータの取り込み用）
+
+    差分本体はインデックス導入前には保存されていないため、導入前の変更イベントの diff_path は空になる
+
+    Args:
+        days (int): 取り込む日数
+        index_path (Path): インデックスのパス
+
+    Returns:
+        int: 記録した変更イベントの数
+    """
+    end = datetime.now()
+    start = datetime.combine((end - timedelta(days=days)).date(), datetime.min.time())
+    columns = ['timestamp', 'url', 'name', 'status_code', 'has_changed',
+               'lines_added', 'lines_removed', 'diff_path', 'screenshot_path']
+    # 後から追加された列は古いセグメントでは欠損値になるため、既定値で記録する
+    results = [
+        {key: value for key, value in row.items() if value is not None}
+        for row in read_results(start, end, columns).to_pylist()
+        if row.get('has_changed')
+    ]
+    recorded = record_changes(results, index_path)
+    logger.info(f"Indexed {recorded} change events from the results store")
+    return recorded
+
+def prune_events(before=None, url_keys=None, index_path=INDEX_PATH):
+    """
+    古い変更イベントと、指定したURLの変更イベントを削除する関数
+
+    Args:
+        before (datetime, optional): これより前の変更イベントを削除する
+        url_keys (set, optional): 変更イベントを全て削除するURLのキー（url_key の値）
+        index_path (Path): インデックスのパス
+
+    Returns:
+        tuple: (削除した変更イベントの数, 削除した変更イベントの差分ファイルのパスのリスト)
+    """
+    if not Path(index_path).exists() or (before is None and not url_keys):
+        return 0, []
+
+    deleted = 0
+    diff_paths = []
+    connection = _connect(index_path)
+    try:
+        with connection:
+            selections = []
+            if before is not None:
+                selections.append(('timestamp < ?', (before.isoformat(),)))
+            if url_keys:
+                urls = [row[0] for row in connection.execute('SELECT DISTINCT url FROM change_events')]
+                selections.extend(('url = ?', (url,)) for url in urls if url_key(url) in url_keys)
+
+            for condition, params in selections:
+                diff_paths.extend(
+                    row[0] for row in connection.execute(
+                        f"SELECT diff_path FROM change_events WHERE {condition} AND diff_path != ''", params
+                    )
+                )
+                deleted += connection.execute(f"DELETE FROM change_events WHERE {condition}", params).rowcount
+    finally:
+        connection.close()
+
+    logger.debug(f"Pruned {deleted} change events")
+    return deleted, diff_paths
+
+def clear_screenshot_paths(paths, index_path=INDEX_PATH):
+    """
+    削除したスクリーンショットを参照している変更イベントの screenshot_path を空にする関数
+
+    Args:
+        paths (list): 削除したスクリーンショットのパス
+        index_path (Path): インデックスのパス
+
+    Returns:
+        int: 更新した変更イベントの数
+    """
+    if not paths or not Path(index_path).exists():
+        return 0
+
+    connection = _connect(index_path)
+    try:
+        with connection:
+            connection.execute('CREATE TEMP TABLE deleted_screenshots (path TEXT PRIMARY KEY)')
+            connection.executemany(
+                'INSERT OR IGNORE INTO deleted_screenshots (path) VALUES (?)',
+                ((str(path),) for path in paths)
+            )
+            updated = connection.execute(
+                "UPDATE change_events SET screenshot_path = '' "
+                "WHERE screenshot_path IN (SELECT path FROM deleted_screenshots)"
+            ).rowcount
+    finally:
+        connection.close()
+    return updated
@@ -0,0 +1,421 @@
+"""
+監視結果を1件ずつディスクに書き出し、中断した実行を再開できるようにするモジュール
+
+実行中はURLごとに追記専用のジャーナル (data/state/journal.jsonl) とCSVレポートだけを
+書き出し、実行の完了時にジャーナルを読み直して結果ストア・集計テーブル・変更履歴
+インデックスへまとめて反映する。結果ストアと変更履歴インデックスへは日付ごと・最大
+batch_size 件ずつ、集計テーブルへは集計行をメモリ上で加算して日付ごとに1回だけ書き込む。
+反映先ごとに反映済みの行数をチェックポイント (data/state/checkpoint.json) に記録する。各反映には
+実行とジャーナルの行番号から決まる識別子 (batch_id) を付けるため、反映の途中で失敗・中断
+しても、反映済みの反映先に同じ監視結果を二重に書き込むことはない。
+
+実行が途中で中断された場合、次の実行はジャーナルを読み直して完了済みの監視対象を
+取得せずに続きから再開する。再開しない実行の監視結果を反映できなかった場合は、
+ジャーナルとチェックポイントを保留中のファイル (data/state/journal_<実行>.pending.jsonl,
+checkpoint_<実行>.pending.json) に移し、以降の実行の開始時に全ての反映先へ反映できるまで
+反映し直す。監視結果はメモリに溜めないため、URL数が多くてもメモリ
+使用量は一定に保たれる。
+"""
+import os
+import csv
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from logger import get_logger
+from store import append_results
+from aggregates import merge_aggregates, write_aggregates
+from history_index import record_changes
+from timing import RunStats
+from utils import load_json_state, save_json_state_atomic
+
+logger = get_logger()
+
+STATE_DIR = Path('data/state')
+JOURNAL_PATH = STATE_DIR / 'journal.jsonl'
+CHECKPOINT_PATH = STATE_DIR / 'checkpoint.json'
+
+# 結果ストアへ1回に反映する最大件数（結果ストアの1セグメントの最大行数）
+DEFAULT_BATCH_SIZE = 10000
+
+# 監視結果の反映先（反映先ごとに反映済みの行数をチェックポイントに記録する）
+SINKS = ('store', 'aggregates', 'index')
+
+# これより古い中断された実行は再開せず、反映だけ行って新しい実行を始める（時間）
+DEFAULT_RESUME_HOURS = 6
+
+# CSVレポートの先頭に並べる列（計測値などの追加列は後ろに並べる）
+CSV_BASE_COLUMNS = ['timestamp', 'url', 'name', 'status_code', 'has_changed', 'screenshot_path']
+
+class RunJournal:
+    """
+    1回の実行の監視結果を逐次書き出すジャーナル
+    """
+
+    def __init__(self, config=None, journal_path=JOURNAL_PATH, checkpoint_path=CHECKPOINT_PATH):
+        """
+        Args:
+            config (dict, optional): settings.json の journal セクション
+            journal_path (Path): ジャーナルのパス
+            checkpoint_path (Path): チェックポイントのパス
+        """
+        config = config or {}
+        self.config = config
+        self.batch_size = max(1, int(config.get('batch_size', DEFAULT_BATCH_SIZE)))
+        self.fsync = bool(config.get('fsync', False))
+        self.resume_window = timedelta(hours=float(config.get('resume_hours', DEFAULT_RESUME_HOURS)))
+        self.journal_path = Path(journal_path)
+        self.checkpoint_path = Path(checkpoint_path)
+
+        self.timestamp = ''
+        self.started_at = None
+        self.csv_path = ''
+        self.completed = set()
+        self.deferred = set()
+        self.stats = RunStats()
+        self._offsets = dict.fromkeys(SINKS, 0)
+        self._journal = None
+        self._csv_file = None
+        self._csv_writer = None
+
+    def _load_checkpoint(self):
+        return load_json_state(self.checkpoint_path) or None
+
+    def _save_checkpoint(self, finished=False, checkpoint_path=None):
+        """
+        チェックポイントを一時ファイル経由で置き換える
+        """
+        checkpoint = {
+            'timestamp': self.timestamp,
+            'started_at': self.started_at.isoformat(),
+            'csv_path': self.csv_path,
+            'offsets': self._offsets,
+            'finished': finished
+        }
+        save_json_state_atomic(checkpoint, checkpoint_path or self.checkpoint_path)
+
+    def _restore(self, checkpoint):
+        """
+        チェックポイントから実行の情報と反映先ごとの反映済みの行数を復元する
+        """
+        self.timestamp = checkpoint['timestamp']
+        self.started_at = datetime.fromisoformat(checkpoint['started_at'])
+        self.csv_path = checkpoint.get('csv_path', '')
+        self._offsets = dict.fromkeys(SINKS, checkpoint.get('stored', 0))
+        self._offsets.update(checkpoint.get('offsets', {}))
+
+    def _pending_paths(self, timestamp):
+        """
+        反映できなかった実行のジャーナルとチェックポイントの移動先を返す
+
+        Returns:
+            tuple: (ジャーナルのパス, チェックポイントのパス)
+        """
+        return (
+            self.journal_path.with_name(f"{self.journal_path.stem}_{timestamp}.pending{self.journal_path.suffix}"),
+            self.checkpoint_path.with_name(f"{self.checkpoint_path.stem}_{timestamp}.pending{self.checkpoint_path.suffix}")
+        )
+
+    def _set_aside(self):
+        """
+        反映できなかった実行のジャーナルを保留中のファイルに移す（新しい実行で上書きしないため）
+
+        チェックポイントを先に書き出すため、移動の途中で中断しても監視結果は失われない
+
+        Returns:
+            Path: 移動先のジャーナルのパス
+        """
+        journal_path, checkpoint_path = self._pending_paths(self.timestamp)
+        self._save_checkpoint(finished=True, checkpoint_path=checkpoint_path)
+        os.replace(self.journal_path, journal_path)
+        return journal_path
+
+    def _flush_pending(self):
+        """
+        保留中のジャーナルを反映し、全ての反映先に反映できたものを削除する
+
+        Returns:
+            int: 反映できずに残っている保留中のジャーナルの数
+        """
+        pattern = f"{self.checkpoint_path.stem}_*.pending{self.checkpoint_path.suffix}"
+        remaining = 0
+        for checkpoint_path in sorted(self.checkpoint_path.parent.glob(pattern)):
+            pending = RunJournal(self.config, self.journal_path, checkpoint_path)
+            checkpoint = pending._load_checkpoint()
+            if checkpoint is not None:
+                pending._restore(checkpoint)
+                pending.journal_path = self._pending_paths(pending.timestamp)[0]
+                if pending.journal_path.exists() and not pending._flush():
+                    logger.warning(f"Results of run {pending.timestamp} are still pending in {pending.journal_path}")
+                    remaining += 1
+                    continue
+                logger.info(f"Stored pending results of run {pending.timestamp}")
+            for path in (pending.journal_path, checkpoint_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return remaining
+
+    def _iter_records(self):
+        """
+        ジャーナルを先頭から読み込むジェネレータ
+
+        書き込み途中で中断された末尾の行は切り詰める
+
+        Yields:
+            dict: 監視結果
+        """
+        with open(self.journal_path, 'r+b') as file:
+            offset = 0
+            for line in file:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    result = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Truncating incomplete record at byte {offset} of {self.journal_path}")
+                    file.truncate(offset)
+                    break
+                offset += len(line)
+                yield result
+
+    def _replay(self):
+        """
+        ジャーナルを読み直し、完了済みの監視対象・繰り越した監視対象と集計を復元する
+
+        Returns:
+            int: ジャーナルの行数
+        """
+        lines = 0
+        for result in self._iter_records():
+            lines += 1
+            self._track(result)
+        return lines
+
+    def _recover(self, checkpoint):
+        """
+        中断された実行のジャーナルを読み直し、再開できるかを返す
+
+        完了した実行や再開するには古すぎる実行は、未反映の監視結果を反映してから破棄する。
+        反映できなかった場合は、全ての反映先に反映できるまでジャーナルを保留中のファイルに残す
+        """
+        self._restore(checkpoint)
+
+        if checkpoint.get('finished') or datetime.now() - self.started_at > self.resume_window:
+            if not checkpoint.get('finished'):
+                logger.warning(f"Interrupted run {self.timestamp} is too old to resume, starting a new run")
+                self._save_checkpoint(finished=True)
+            if self.journal_path.exists() and not self._flush():
+                pending_path = self._set_aside()
+                logger.error(
+                    f"Could not store all results of run {self.timestamp}, "
+                    f"keeping them in {pending_path} until they are stored"
+                )
+            self._reset()
+            return False
+
+        lines = self._replay() if self.journal_path.exists() else 0
+        logger.info(f"Resuming interrupted run {self.timestamp}: {lines} targets already done")
+        return True
+
+    def _track(self, result):
+        self.completed.add(result['url'])
+        if result.get('skipped') == 'deferred':
+            self.deferred.add(result['url'])
+        self.stats.add(result)
+
+    def _reset(self):
+        self.completed = set()
+        self.deferred = set()
+        self.stats = RunStats()
+        self._offsets = dict.fromkeys(SINKS, 0)
+
+    def start(self, timestamp, started_at, csv_dir=None):
+        """
+        実行を開始する（中断された実行があれば続きから再開する）
+
+        Args:
+            timestamp (str): 新しい実行のタイムスタンプ（YYYYMMDDHHMMSS）
+            started_at (datetime): 新しい実行の開始日時
+            csv_dir (Path, optional): CSVレポートの保存先（Noneの場合はCSVを出力しない）
+
+        Returns:
+            bool: 中断された実行を再開した場合はTrue
+        """
+        # 以前の実行で反映できなかった監視結果を反映し直す
+        try:
+            self._flush_pending()
+        except Exception as e:
+            logger.error(f"Error storing pending results: {e}")
+
+        checkpoint = self._load_checkpoint()
+        resumed = False
+        if checkpoint is not None:
+            try:
+                resumed = self._recover(checkpoint)
+            except Exception as e:
+                logger.error(f"Error recovering interrupted run: {e}")
+                self._reset()
+
+        if not resumed:
+            self.timestamp = timestamp
+            self.started_at = started_at
+            self.csv_path = str(Path(csv_dir) / f"report_{timestamp}.csv") if csv_dir else ''
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            open(self.journal_path, 'w', encoding='utf-8').close()
+            self._save_checkpoint()
+
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        return resumed
+
+    def _write_csv(self, result):
+        """
+        CSVレポートに1行追記する（既存のCSVに追記する場合はそのヘッダーに合わせる）
+        """
+        if self._csv_writer is None:
+            path = Path(self.csv_path)
+            fieldnames = None
+            if path.exists() and path.stat().st_size:
+                with open(path, 'r', encoding='utf-8', newline='') as file:
+                    fieldnames = next(csv.reader(file), None)
+            self._csv_file = open(path, 'a', encoding='utf-8', newline='')
+            if not fieldnames:
+                fieldnames = CSV_BASE_COLUMNS + [key for key in result if key not in CSV_BASE_COLUMNS]
+                self._csv_writer = csv.DictWriter(self._csv_file, fieldnames, extrasaction='ignore')
+                self._csv_writer.writeheader()
+            else:
+                self._csv_writer = csv.DictWriter(self._csv_file, fieldnames, extrasaction='ignore')
+        self._csv_writer.writerow(result)
+        self._csv_file.flush()
+
+    def record(self, result):
+        """
+        監視結果を1件書き出す（ジャーナルとCSVレポートにだけ書き込む）
+
+        Args:
+            result (dict): 監視結果
+        """
+        self._journal.write(json.dumps(result, ensure_ascii=False, default=str) + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+        self._track(result)
+        if self.csv_path:
+            try:
+                self._write_csv(result)
+            except Exception as e:
+                logger.error(f"Error writing {self.csv_path}: {e}")
+
+    def _iter_batches(self):
+        """
+        ジャーナルを反映の単位に区切るジェネレータ
+
+        日付が変わるか batch_size 件に達するごとに区切る。区切りはジャーナルの内容だけで
+        決まるため、反映をやり直しても同じ区切り・同じ batch_id になる
+
+        Yields:
+            tuple: (先頭の行番号, 末尾の次の行番号, 監視結果のリスト)
+        """
+        start = 0
+        batch = []
+        for result in self._iter_records():
+            if batch and (len(batch) >= self.batch_size or result['timestamp'][:10] != batch[0]['timestamp'][:10]):
+                yield start, start + len(batch), batch
+                start += len(batch)
+                batch = []
+            batch.append(result)
+        if batch:
+            yield start, start + len(batch), batch
+
+    def _batch_id(self, first):
+        return f"{self.started_at.isoformat()}#{first}"
+
+    def _write_sink(self, sink, records, first):
+        if sink == 'store':
+            append_results(records, batch_id=self._batch_id(first))
+        else:
+            # 変更履歴インデックスは (url, timestamp) で置き換えるため、書き直しても重複しない
+            record_changes(records)
+
+    def _flush(self):
+        """
+        ジャーナルの監視結果のうち、未反映のものを反映先ごとに反映する
+
+        反映先ごとの反映済みの行数は反映するたびにチェックポイントに記録し、反映済みの
+        反映先には書き込まない。失敗した反映先はそれ以降の監視結果も反映せず、次の実行の
+        開始時に続きから反映する
+
+        Returns:
+            bool: 全ての反映先に全ての監視結果を反映できた場合はTrue
+        """
+        failed = set()
+        stored = 0
+        # 集計行は全ての監視結果を加算してから日付ごとに1回だけ書き込む
+        aggregated = self._offsets['aggregates']
+        partitions = {}
+        for start, end, records in self._iter_batches():
+            for sink in ('store', 'index'):
+                offset = self._offsets[sink]
+                if sink in failed or offset >= end:
+                    continue
+                first = max(start, offset)
+                try:
+                    self._write_sink(sink, records[first - start:], first)
+                except Exception as e:
+                    logger.error(f"Error storing monitoring results ({sink}): {e}")
+                    failed.add(sink)
+                    continue
+                self._offsets[sink] = end
+                self._save_checkpoint(finished=True)
+
+            if 'aggregates' not in failed and aggregated < end:
+                try:
+                    merge_aggregates(partitions, records[max(start, aggregated) - start:], self._batch_id(aggregated))
+                except Exception as e:
+                    logger.error(f"Error storing monitoring results (aggregates): {e}")
+                    failed.add('aggregates')
+            stored = end
+
+        if 'aggregates' not in failed and stored > aggregated:
+            try:
+                write_aggregates(partitions)
+                self._offsets['aggregates'] = stored
+                self._save_checkpoint(finished=True)
+            except Exception as e:
+                logger.error(f"Error storing monitoring results (aggregates): {e}")
+                failed.add('aggregates')
+
+        if stored:
+            logger.debug(f"Stored {stored} results of run {self.timestamp}")
+        return not failed
+
+    def close(self):
+        """
+        ファイルを閉じる（ジャーナルとチェックポイントは残すため、次の実行で再開できる）
+        """
+        for file in (self._journal, self._csv_file):
+            if file is not None:
+                file.close()
+        self._journal = self._csv_file = self._csv_writer = None
+
+    def finish(self):
+        """
+        監視結果を結果ストア・集計テーブル・変更履歴インデックスに反映して実行を完了する
+
+        Returns:
+            RunStats: 実行全体の集計
+        """
+        self.close()
+        # 以降はジャーナルに追記しない（反映できなかった分は次の実行の開始時に反映する）
+        self._save_checkpoint(finished=True)
+        if self._flush():
+            for path in (self.checkpoint_path, self.journal_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if self.csv_path and Path(self.csv_path).exists():
+            logger.info(f"Monitoring result saved to {self.csv_path}")
+        return self.stats
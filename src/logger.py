@@ -9,6 +9,65 @@ import json
 
 from loguru import logger
 
+# ログ出力モード
+#   development: 標準出力（色付き）+ テキストファイル（+ json_format が有効ならJSONL）
+#   production : JSONLファイル + 標準エラー出力（WARNING以上）のみ
+LOG_MODES = ('development', 'production')
+
+class DebugSampler:
+    """
+    大量に出力されるDEBUGログを呼び出し箇所ごとに間引くフィルタ
+
+    各呼び出し箇所の最初の burst 件は必ず出力し、以降は rate の割合で出力する。
+    判定結果はレコードに保存し、複数の出力先で同じ判定を共有する。
+    """
+
+    def __init__(self, rate=1.0, burst=10):
+        self.rate = rate
+        self.burst = burst
+        self.counts = {}
+
+    def __call__(self, record):
+        extra = record['extra']
+        if '_sampled' not in extra:
+            extra['_sampled'] = self._decide(record)
+        return extra['_sampled']
+
+    def _decide(self, record):
+        if record['level'].no > 10 or self.rate >= 1.0:
+            return True
+
+        site = (record['name'], record['line'])
+        count = self.counts.get(site, 0) + 1
+        self.counts[site] = count
+        if count <= self.burst:
+            return True
+        # 件数に rate を掛けた値の整数部が増えたときだけ出力する（決定的な間引き）
+        return int(count * self.rate) != int((count - 1) * self.rate)
+
+def _json_line(record):
+    """
+    ログレコードを1行のJSONに変換するloguru用フォーマッタ
+
+    バインドされたコンテキスト（urlなど）もそのまま出力する
+    """
+    entry = {
+        "timestamp": record["time"].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+        "level": record["level"].name,
+        "message": record["message"],
+        "module": record["name"],
+        "function": record["function"],
+        "line": record["line"]
+    }
+    for key, value in record["extra"].items():
+        if not key.startswith('_'):
+            entry[key] = value
+    if record["exception"] is not None:
+        entry["exception"] = repr(record["exception"].value)
+
+    record["extra"]["_json"] = json.dumps(entry, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
 def setup_logger(config):
     """
     loguruを使用してログ設定を行う関数
@@ -18,6 +77,16 @@ def setup_logger(config):
     """
     # ログレベルの設定
     log_level = config.get('level', 'INFO')
+    mode = config.get('mode', 'development')
+    if mode not in LOG_MODES:
+        mode = 'development'
+    retention = f"{config.get('retention_days', 30)} days"
+
+    # DEBUGログの間引き（1.0で間引きなし）
+    sampler = DebugSampler(
+        rate=config.get('debug_sample_rate', 1.0 if mode == 'development' else 0.01),
+        burst=config.get('debug_sample_burst', 10)
+    )
 
     # ログファイルのパスを作成
     log_dir = Path('logs/Execution_logFolder')
@@ -30,66 +99,50 @@ def setup_logger(config):
     # 現在の日付を取得してログファイル名を生成
     today = datetime.now().strftime('%Y%m%d')
     log_file = log_dir / f"{today}.log"
-    json_log_file = json_log_dir / f"{today}.json"
+    json_log_file = json_log_dir / f"{today}.jsonl"
 
     # デフォルトのロガーを削除
     logger.remove()
 
-    # 標準出力へのロガーを追加
-    logger.add(
-        sys.stdout,
-        level=log_level,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
-    )
+    if mode == 'production':
+        # 標準エラー出力には警告以上のみ
+        logger.add(
+            sys.stderr,
+            level='WARNING',
+            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}"
+        )
+    else:
+        # 標準出力へのロガーを追加
+        logger.add(
+            sys.stdout,
+            level=log_level,
+            filter=sampler,
+            format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+        )
 
-    # ファイルへのロガーを追加
-    logger.add(
-        log_file,
-        level=log_level,
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-        rotation="1 day",
-        retention=f"{config.get('retention_days', 30)} days"
-    )
+        # ファイルへのロガーを追加
+        logger.add(
+            log_file,
+            level=log_level,
+            filter=sampler,
+            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+            rotation="1 day",
+            retention=retention
+        )
 
-    # JSONフォーマットのログが有効な場合、JSON形式でもログを保存（別ディレクトリに）
-    if config.get('json_format', False):
+    # JSON Lines形式のログ（1行1レコードのため、異常終了しても書き込み済みの行は有効）
+    if mode == 'production' or config.get('json_format', False):
         logger.add(
             json_log_file,
             level=log_level,
-            format=lambda record: json.dumps({
-                "timestamp": record["time"].strftime("%Y-%m-%d %H:%M:%S"),
-                "level": record["level"].name,
-                "message": record["message"],
-                "module": record["name"],
-                "function": record["function"],
-                "line": record["line"]
-            }) + ",\n",
+            filter=sampler,
+            format=_json_line,
             rotation="1 day",
-            retention=f"{config.get('retention_days', 30)} days",
-            # JSON配列形式で出力するための特別な処理
-            filter=lambda record: record["extra"].update({"write_json_header": record["elapsed"].total_seconds() < 0.01}),
+            retention=retention,
             enqueue=True
         )
 
-        # JSON配列の開始・終了処理を登録
-        @logger.catch
-        def setup_json_log():
-            # ファイルが存在しない場合は開始括弧を書き込む
-            if not json_log_file.exists() or json_log_file.stat().st_size == 0:
-                with open(json_log_file, 'w') as f:
-                    f.write("[\n")
-
-            # プログラム終了時に終了括弧を書き込む
-            import atexit
-            def finalize_json_log():
-                if json_log_file.exists():
-                    with open(json_log_file, 'a') as f:
-                        f.write("\n]")
-            atexit.register(finalize_json_log)
-
-        setup_json_log()
-
-    logger.info("Logger setup completed")
+    logger.info("Logger setup completed (mode: {})", mode)
     return logger
 
 def get_logger():
@@ -0,0 +1,298 @@
+"""
+Prometheus形式のメトリクスを提供するモジュール
+
+プロセス内でカウンタ・ゲージ・ヒストグラムを保持し、テキスト形式
+(text/plain; version=0.0.4) でファイルへの書き出しまたはHTTPで公開する。
+"""
+import os
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logger import get_logger
+from timing import STAGES
+
+logger = get_logger()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 処理時間ヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value):
+    """
+    ラベル値をエスケープする関数
+    """
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    """
+    ラベルを {name="value",...} 形式に整形する関数
+    """
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    """
+    サンプル値を整形する関数
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class _Metric:
+    """
+    メトリクスの基底クラス（ラベルの組ごとに値を保持する）
+    """
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}"
+        ]
+        with self._lock:
+            lines.extend(self._samples())
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    """
+    単調増加するカウンタ
+    """
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        if not self._values and not self.labelnames:
+            return [f"{self.name} 0.0"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+class Gauge(_Metric):
+    """
+    任意に増減する値
+    """
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if not self._values and not self.labelnames:
+            return [f"{self.name} 0.0"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+class Histogram(_Metric):
+    """
+    累積バケット・合計・件数を持つヒストグラム
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def _samples(self):
+        lines = []
+        for key, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state['count'])}")
+        return lines
+
+class Registry:
+    """
+    メトリクスの登録先
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        登録済みの全メトリクスをPrometheusのテキスト形式で返す
+        """
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+REGISTRY = Registry()
+
+CHECKS = REGISTRY.register(Counter(
+    'webmonitor_checks_total', 'Number of URL checks performed.'))
+CHANGES = REGISTRY.register(Counter(
+    'webmonitor_changes_total', 'Number of checks that detected a change.'))
+FETCH_ERRORS = REGISTRY.register(Counter(
+    'webmonitor_fetch_errors_total', 'Number of failed fetches by host.', ('host',)))
+FETCHED_BYTES = REGISTRY.register(Counter(
+    'webmonitor_fetched_bytes_total', 'Response bytes fetched.'))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'webmonitor_stage_duration_seconds', 'Duration of each monitoring stage per URL.', ('stage',)))
+URL_SECONDS = REGISTRY.register(Histogram(
+    'webmonitor_url_duration_seconds', 'Total processing time per URL.'))
+SKIPPED = REGISTRY.register(Counter(
+    'webmonitor_skipped_total', 'Number of targets not checked, by reason.', ('reason',)))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'webmonitor_queue_depth', 'URLs remaining in the current run.'))
+RUNS = REGISTRY.register(Counter(
+    'webmonitor_runs_total', 'Number of completed monitoring runs.'))
+LAST_RUN_SECONDS = REGISTRY.register(Gauge(
+    'webmonitor_last_run_duration_seconds', 'Wall-clock duration of the last run.'))
+LAST_RUN_TIMESTAMP = REGISTRY.register(Gauge(
+    'webmonitor_last_run_timestamp_seconds', 'Unix time at which the last run finished.'))
+
+def observe_result(result):
+    """
+    1件の監視結果をメトリクスに反映する関数
+
+    Args:
+        result (dict): monitor_url の戻り値
+    """
+    if result.get('skipped'):
+        SKIPPED.inc(reason=result['skipped'])
+        return
+
+    CHECKS.inc()
+    if result.get('has_changed'):
+        CHANGES.inc()
+    FETCHED_BYTES.inc(result.get('response_bytes', 0))
+
+    for stage_name in STAGES:
+        value = result.get(f"{stage_name}_ms")
+        if value:
+            STAGE_SECONDS.observe(value / 1000, stage=stage_name)
+    URL_SECONDS.observe(result.get('elapsed_ms', 0.0) / 1000)
+
+def observe_fetch_error(url):
+    """
+    ページの取得の失敗をメトリクスに反映する関数（解析や差分検出の失敗は数えない）
+
+    正規化したURLが同じ監視対象は取得を1回にまとめるため、監視対象の数ではなく取得の回数を数える
+
+    Args:
+        url (str): 取得に失敗した監視対象（グループの代表）のURL
+    """
+    FETCH_ERRORS.inc(host=urlparse(url).hostname or '')
+
+def observe_run(started_at, finished_at):
+    """
+    1回の実行の完了をメトリクスに反映する関数
+
+    Args:
+        started_at (datetime): 実行開始日時
+        finished_at (datetime): 実行終了日時
+    """
+    RUNS.inc()
+    LAST_RUN_SECONDS.set((finished_at - started_at).total_seconds())
+    LAST_RUN_TIMESTAMP.set(finished_at.timestamp())
+    QUEUE_DEPTH.set(0)
+
+def write_textfile(path, registry=REGISTRY):
+    """
+    メトリクスをテキストファイルに原子的に書き出す関数
+    （node_exporterのtextfile collector向け）
+
+    Args:
+        path (str): 出力先のパス
+        registry (Registry): 出力するレジストリ
+
+    Returns:
+        bool: 成功した場合はTrue
+    """
+    try:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(registry.render())
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        logger.error(f"Error writing metrics textfile {path}: {e}")
+        return False
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """
+    /metrics を返すHTTPハンドラ
+    """
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics request: {}", format % args)
+
+def start_http_server(port, host='127.0.0.1'):
+    """
+    メトリクスを公開するHTTPサーバーをデーモンスレッドで起動する関数
+
+    Args:
+        port (int): 待ち受けポート
+        host (str): 待ち受けアドレス（既定はローカルのみ）
+
+    Returns:
+        ThreadingHTTPServer: 起動したサーバー
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{server.server_port}/metrics")
+    return server
@@ -2,37 +2,61 @@
 メインの監視ロジックを提供するモジュール
 """
 import os
+import sys
 import time
+import subprocess
 import json
 import csv
 import hashlib
-from datetime import datetime
+import argparse
+from datetime import date, datetime, timedelta
 from pathlib import Path
-import pandas as pd
 
 from utils import (
     load_config,
     load_urls,
     check_date_condition,
-    get_page_content,
-    generate_hash,
-    detect_changes,
+    fetch_page,
+    decode_body,
     create_report_dirs,
     get_timestamp
 )
 from screenshot import take_screenshot
 from notifier import send_notification
-from visualizer import create_monitoring_report
+from diff_summary import summarize_diff, DEFAULT_TOP_HUNKS
 from logger import setup_logger, get_logger
-
-def initialize():
+from store import append_results, export_csv, RUNS_DIR
+from timing import stage, empty_timings
+from history_index import save_diff, query_history
+from targets import TargetWatcher, group_targets
+from sitemap import plan_skips
+from governor import Governor, RunLock
+from journal import RunJournal
+from pipeline import Pipeline, analyze_page
+from compaction import compact, is_due
+from aggregates import migrate_legacy_reports
+import metrics
+import profiler
+
+def initialize(watcher=None):
     """
     監視ツールの初期化を行う関数
 
+    Args:
+        watcher (TargetWatcher, optional): 常駐モードで使う設定ファイル・URLリストの監視
+            （指定した場合は更新されたファイルだけを再読み込みする）
+
     Returns:
         tuple: (設定辞書, 監視対象URLリスト, ロガー)
     """
     try:
+        if watcher is not None:
+            # 更新されたファイルだけを再読み込みし、URLリストは差分のみ反映する
+            config_changed, _ = watcher.refresh()
+            config = watcher.config
+            logger = setup_logger(config.get('log', {'level': 'INFO'})) if config_changed else get_logger()
+            return config, watcher.targets, logger
+
         # 設定の読み込み
         config = load_config()
 
@@ -116,132 +140,348 @@ def save_url_history(url, content_hash, content):
         logger.error(f"Error saving history for {url}: {e}")
         return False
 
-def save_monitoring_result(result, csv_dir):
+def save_run_summary(stats, started_at, finished_at):
     """
-    監視結果をCSVに保存する関数
+    実行全体の処理時間・転送量のサマリーを結果ストアに保存する関数
 
     Args:
-        result (dict): 監視結果
-        csv_dir (Path): CSVの保存先ディレクトリ
+        stats (RunStats): 実行中に逐次集計した監視結果
+        started_at (datetime): 実行開始日時
+        finished_at (datetime): 実行終了日時
 
     Returns:
-        str: 保存したCSVのパス
+        dict: 実行サマリー
     """
+    logger = get_logger()
     try:
-        timestamp = get_timestamp()
-        csv_path = csv_dir / f"report_{timestamp}.csv"
-
-        # CSVに変換可能なデータを作成
-        csv_data = {
-            'timestamp': [],
-            'url': [],
-            'name': [],
-            'status_code': [],
-            'has_changed': [],
-            'screenshot_path': []
-        }
-
-        for url_info in result:
-            csv_data['timestamp'].append(url_info['timestamp'])
-            csv_data['url'].append(url_info['url'])
-            csv_data['name'].append(url_info.get('name', ''))
-            csv_data['status_code'].append(url_info.get('status_code', 0))
-            csv_data['has_changed'].append(url_info.get('has_changed', False))
-            csv_data['screenshot_path'].append(url_info.get('screenshot_path', ''))
+        summary = stats.summary(started_at, finished_at)
+        append_results([summary], base_dir=RUNS_DIR)
 
-        # DataFrameを作成してCSVに保存
-        df = pd.DataFrame(csv_data)
-        df.to_csv(csv_path, index=False)
-
-        logger = get_logger()
-        logger.info(f"Monitoring result saved to {csv_path}")
+        logger.info(
+            f"Run summary: {summary['urls']} URLs ({summary['unique_urls']} unique, {summary['skipped']} skipped, {summary['deferred']} deferred) "
+            f"in {summary['wall_ms']:.0f} ms, "
+            f"{summary['response_bytes']} bytes, "
+            f"fetch p50/p99 {summary['fetch_ms_p50']:.0f}/{summary['fetch_ms_p99']:.0f} ms, "
+            f"parse p50/p99 {summary['parse_ms_p50']:.0f}/{summary['parse_ms_p99']:.0f} ms"
+        )
+        for url, elapsed_ms in stats.slowest():
+            logger.debug("Slow URL: {} ({:.0f} ms)", url, elapsed_ms)
 
-        return str(csv_path)
+        return summary
 
     except Exception as e:
-        logger = get_logger()
-        logger.error(f"Error saving monitoring result: {e}")
-        return ""
+        logger.error(f"Error saving run summary: {e}")
+        return {}
 
-def monitor_url(url_info, config, csv_dir, picture_dir):
+def new_result(url_info, canonical_url='', skipped=''):
     """
-    単一のURLを監視する関数
+    監視結果の辞書を初期値で作成する関数
 
     Args:
-        url_info (dict): URL情報
-        config (dict): 設定辞書
-        csv_dir (Path): CSVの保存先ディレクトリ
-        picture_dir (Path): 画像の保存先ディレクトリ
+        url_info (Target): 監視対象
+        canonical_url (str, optional): 正規化したURL
+        skipped (str, optional): 確認を省略した理由（'sitemap'、'deferred' など、確認した場合は空文字列）
 
     Returns:
         dict: 監視結果
     """
-    logger = get_logger()
     result = {
-        'url': url_info['url'],
-        'name': url_info.get('name', ''),
+        'url': url_info.url,
+        'canonical_url': canonical_url or url_info.url,
+        'name': url_info.name,
         'timestamp': datetime.now().isoformat(),
         'has_changed': False,
         'status_code': 0,
-        'screenshot_path': ''
+        'response_bytes': 0,
+        'screenshot_path': '',
+        'diff_path': '',
+        'lines_added': 0,
+        'lines_removed': 0,
+        'elapsed_ms': 0.0,
+        'error': '',
+        'skipped': skipped
     }
+    result.update(empty_timings())
+    return result
 
-    try:
-        logger.info(f"Monitoring URL: {url_info['url']}")
+def fetch_group(targets):
+    """
+    同じリソースを指す監視対象の履歴を読み込み、ページを1回だけ取得する関数
 
-        # 過去の履歴を読み込む
-        last_hash, last_content = load_url_history(url_info['url'])
+    パイプラインでは取得用のスレッドで実行する
 
-        # ページの内容を取得
-        content = get_page_content(url_info['url'])
+    Args:
+        targets (list): 正規化したURLが同じ監視対象（Target）のリスト
 
-        if not content:
-            logger.error(f"Failed to fetch content from {url_info['url']}")
-            return result
+    Returns:
+        tuple: (fetch_page(raw=True) の戻り値, URLをキーとする (前回のハッシュ値, 前回の内容) の辞書)
+    """
+    with profiler.span('load_history'):
+        histories = {target.url: load_url_history(target.url) for target in targets}
+    with profiler.span('fetch'):
+        page = fetch_page(targets[0].url, raw=True)
+    return page, histories
+
+def analysis_args(fetched):
+    """
+    取得結果から analyze_page の引数を作成する関数（取得に失敗した場合はNone）
+
+    前回の内容が同じ監視対象は1回だけ差分を求めるよう、前回のハッシュ値ごとにまとめる
+    """
+    page, histories = fetched
+    if not page['content']:
+        return None
+    old_contents = {last_hash: last_content for last_hash, last_content in histories.values() if last_content}
+    return page['content'], page['encoding'], old_contents
+
+def complete_url(url_info, config, picture_dir, fetched, analysis, shared, canonical_url='', leader=True):
+    """
+    取得・解析済みの結果から単一の監視対象の変更を判定し、通知と履歴の保存を行う関数
+
+    スクリーンショットと保存する本文は同じリソースの監視対象間で shared を通じて共有する
+
+    Args:
+        url_info (Target): 監視対象
+        config (dict): 設定辞書
+        picture_dir (Path): 画像の保存先ディレクトリ
+        fetched (tuple): fetch_group の戻り値
+        analysis (dict): analyze_page の戻り値（取得に失敗した場合はNone）
+        shared (dict): 同じリソースの監視対象間で共有する結果
+        canonical_url (str, optional): 正規化したURL
+        leader (bool): グループの最初の監視対象か（取得と解析の所要時間はこの監視対象に記録する）
+
+    Returns:
+        dict: 監視結果
+    """
+    logger = get_logger()
+    started_at = time.perf_counter()
+    page, histories = fetched
+    result = new_result(url_info, canonical_url)
+    work_ms = 0.0
 
-        # ハッシュを生成
-        content_hash = generate_hash(content)
+    try:
+        logger.info("Monitoring URL: {}", url_info.url)
+        last_hash, last_content = histories[url_info.url]
+
+        result['status_code'] = page['status_code']
+        if leader:
+            result['response_bytes'] = page['response_bytes']
+            result['fetch_ms'] = page['fetch_ms']
+            work_ms += page['fetch_ms']
+            if analysis is not None:
+                for name in ('parse', 'hash', 'diff'):
+                    result[f"{name}_ms"] = analysis[f"{name}_ms"]
+                    work_ms += analysis[f"{name}_ms"]
+                for name, span_started_at, span_finished_at in analysis['spans']:
+                    profiler.add_event(name, span_started_at, span_finished_at, {'url': url_info.url})
+
+        if not page['content']:
+            logger.error("Failed to fetch content from {}", url_info.url)
+            result['error'] = page['error'] or 'empty_content'
+            # 取得は代表の監視対象で1回だけ行うため、失敗も1回だけ数える
+            if leader:
+                metrics.observe_fetch_error(url_info.url)
+            return result
 
-        # 変更を検出
-        has_changed, diff = detect_changes(last_content, content)
+        content_hash = analysis['content_hash']
+        if last_content:
+            has_changed, diff = analysis['detections'].get(last_hash, (False, ""))
+        else:
+            has_changed, diff = False, ""
         result['has_changed'] = has_changed
 
         if has_changed:
-            logger.info(f"Changes detected on {url_info['url']}")
-
-            # スクリーンショットの設定があれば撮影
-            if config.get('screenshot', {}).get('enabled', False):
-                screenshot_path = take_screenshot(
-                    url_info['url'],
-                    picture_dir,
-                    config.get('screenshot', {})
-                )
-                result['screenshot_path'] = screenshot_path
+            logger.info("Changes detected on {}", url_info.url)
 
-            # 通知を送信
-            if config.get('notifications', {}).get('diff_only', True) and diff:
-                send_notification(
-                    url_info,
+            # 差分の要約は1回だけ作成し、通知と結果で共有する
+            notification_config = config.get('notifications', {})
+            with profiler.span('summarize'):
+                summary = summarize_diff(
                     diff,
-                    config.get('notifications', {}),
-                    result.get('screenshot_path', '')
+                    top_n=notification_config.get('top_hunks', DEFAULT_TOP_HUNKS)
                 )
+            result['lines_added'] = summary['added']
+            result['lines_removed'] = summary['removed']
 
-        # 履歴を保存
-        save_url_history(url_info['url'], content_hash, content)
+            # 履歴検索用に差分本体を保存
+            if diff:
+                with profiler.span('save_diff'):
+                    result['diff_path'] = save_diff(url_info.url, result['timestamp'], diff)
+
+            # スクリーンショットの設定があれば撮影（同じリソースでは1回だけ）
+            if config.get('screenshot', {}).get('enabled', False):
+                if 'screenshot_path' not in shared:
+                    with stage(result, 'screenshot'):
+                        shared['screenshot_path'] = take_screenshot(
+                            url_info.url,
+                            picture_dir,
+                            config.get('screenshot', {})
+                        )
+                result['screenshot_path'] = shared['screenshot_path']
+
+            # 通知を送信
+            if notification_config.get('diff_only', True) and diff:
+                with stage(result, 'notify'):
+                    send_notification(
+                        url_info,
+                        diff,
+                        notification_config,
+                        result.get('screenshot_path', ''),
+                        summary=summary
+                    )
+
+        # 履歴を保存（本文は解析時に判定した文字コードで1回だけ文字列に変換する）
+        with profiler.span('save_history'):
+            if 'content' not in shared:
+                shared['content'] = decode_body(page['content'], analysis['encoding'])[0]
+            save_url_history(url_info.url, content_hash, shared['content'])
 
         return result
 
     except Exception as e:
-        logger.error(f"Error monitoring {url_info['url']}: {e}")
+        logger.error("Error monitoring {}: {}", url_info.url, e)
+        result['error'] = str(e)
         return result
 
-def run_monitoring():
+    finally:
+        finished_at = time.perf_counter()
+        result['elapsed_ms'] = work_ms + (finished_at - started_at) * 1000
+        profiler.add_event('monitor_url', started_at, finished_at, {'url': url_info.url})
+
+def complete_group(targets, config, picture_dir, canonical_url, fetched, analysis, error=None):
+    """
+    グループ内の各監視対象の監視結果を作成する関数
+
+    Args:
+        targets (list): 監視対象（Target）のリスト
+        config (dict): 設定辞書
+        picture_dir (Path): 画像の保存先ディレクトリ
+        canonical_url (str): 正規化したURL
+        fetched (tuple): fetch_group の戻り値（取得中に例外が発生した場合はNone）
+        analysis (dict): analyze_page の戻り値
+        error (Exception, optional): 取得または解析中に発生した例外
+
+    Returns:
+        list: 監視結果のリスト
+    """
+    logger = get_logger()
+    results = []
+    if error is not None:
+        logger.error("Error monitoring {}: {}", canonical_url, error)
+        # 取得結果がない場合は取得中の例外（ある場合は解析中の例外）。取得は1回のため1回だけ数える
+        if fetched is None:
+            metrics.observe_fetch_error(targets[0].url)
+        for url_info in targets:
+            result = new_result(url_info, canonical_url)
+            result['error'] = str(error) or type(error).__name__
+            results.append(result)
+        return results
+
+    shared = {}
+    for index, url_info in enumerate(targets):
+        # URLをコンテキストとしてバインドし、JSONログの各行に付与する
+        with logger.contextualize(url=url_info.url):
+            results.append(complete_url(
+                url_info, config, picture_dir, fetched, analysis, shared, canonical_url, leader=index == 0
+            ))
+    return results
+
+def monitor_group(targets, config, picture_dir, canonical_url=''):
+    """
+    同じリソースを指す監視対象をまとめて監視する関数（パイプラインを使わない場合）
+
+    取得・パース・ハッシュ化は1回だけ行い、差分検出は前回の内容ごとに1回だけ行う。
+    --cprofile slowest ではグループ全体（取得から通知まで）を1件として計測する
+
+    Args:
+        targets (list): 正規化したURLが同じ監視対象（Target）のリスト
+        config (dict): 設定辞書
+        picture_dir (Path): 画像の保存先ディレクトリ
+        canonical_url (str, optional): 正規化したURL
+
+    Returns:
+        list: 監視結果のリスト
+    """
+    canonical_url = canonical_url or targets[0].url
+    with profiler.profile_url(canonical_url):
+        fetched = analysis = error = None
+        try:
+            fetched = fetch_group(targets)
+            args = analysis_args(fetched)
+            if args is not None:
+                analysis = analyze_page(*args)
+        except Exception as e:
+            error = e
+        return complete_group(targets, config, picture_dir, canonical_url, fetched, analysis, error)
+
+def monitor_url(url_info, config, csv_dir, picture_dir):
+    """
+    単一のURLを監視する関数
+
+    Args:
+        url_info (Target): 監視対象
+        config (dict): 設定辞書
+        csv_dir (Path): CSVの保存先ディレクトリ
+        picture_dir (Path): 画像の保存先ディレクトリ
+
+    Returns:
+        dict: 監視結果
+    """
+    return monitor_group([url_info], config, picture_dir)[0]
+
+def start_report_process(picture_dir, chart_type, max_urls):
+    """
+    グラフ描画をバックグラウンドプロセスで開始する関数
+
+    Args:
+        picture_dir (Path): 画像の保存先ディレクトリ
+        chart_type (str): 生成するグラフの種類
+        max_urls (int): グラフに表示するURL数の上限
+
+    Returns:
+        subprocess.Popen: 起動したプロセス（失敗した場合はNone）
+    """
+    logger = get_logger()
+    try:
+        command = [
+            sys.executable,
+            str(Path(__file__).resolve().parent / 'visualizer.py'),
+            '--report-dir', str(picture_dir),
+            '--chart-type', chart_type,
+            '--max-urls', str(max_urls)
+        ]
+
+        # 監視プロセスの終了後も描画を継続できるよう切り離して起動
+        options = {}
+        if os.name == 'nt':
+            options['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+        else:
+            options['start_new_session'] = True
+
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **options
+        )
+        logger.info(f"Report rendering started in background (pid {process.pid})")
+        return process
+
+    except Exception as e:
+        logger.error(f"Error starting report process: {e}")
+        return None
+
+def run_monitoring(profile=None, watcher=None):
     """
     監視プロセスを実行するメイン関数
+
+    Args:
+        profile (dict, optional): プロファイリングの設定
+            (output_dir, cprofile_mode, top_n)。Noneの場合はプロファイリングしない
+        watcher (TargetWatcher, optional): 常駐モードで使う設定ファイル・URLリストの監視
     """
     # 初期化
-    config, urls, logger = initialize()
+    config, urls, logger = initialize(watcher)
 
     if not logger:
         print("Failed to initialize logger")
@@ -256,25 +496,388 @@ def run_monitoring():
         logger.info("Current date is outside the monitoring period")
         return
 
-    # レポートディレクトリの作成
-    csv_dir, picture_dir = create_report_dirs()
+    run_timestamp = get_timestamp()
+    journal = None
 
-    # 各URLを監視
-    monitoring_results = []
+    # 前回の実行が終わっていない場合は実行しない（取得したロックは必ず finally で解放する）
+    governor_config = config.get('governor', {})
+    lock = RunLock()
+    if governor_config.get('lock', True) and not lock.acquire():
+        return
+    try:
+        # レポートディレクトリの作成
+        csv_dir, picture_dir = create_report_dirs()
+
+        if profile is not None:
+            profiler.enable(**profile)
+
+        # ストア導入前のCSVレポートを結果ストアに取り込む（初回のみ）
+        try:
+            migrate_legacy_reports()
+        except Exception as e:
+            logger.error(f"Error importing legacy CSV reports: {e}")
+
+        # 監視結果はURLごとにジャーナルとCSVへ書き出し、中断された実行は続きから再開する
+        journal = RunJournal(config.get('journal', {}))
+
+        # 各URLを監視
+        csv_enabled = config.get('report', {}).get('csv_enabled', True)
+        journal.start(run_timestamp, datetime.now(), csv_dir if csv_enabled else None)
+        run_started_at = journal.started_at
+        # 実行時間・転送量・メモリの予算に収まらない監視対象は確認の遅れている順に次回へ繰り越す
+        governor = Governor(governor_config, run_id=journal.timestamp)
+        governor.resume(journal.deferred)
+        metrics.QUEUE_DEPTH.set(len(urls) - len(journal.completed))
+
+        # 同じリソースを指す監視対象をまとめ、取得とパースはグループごとに1回だけ行う
+        groups = group_targets(urls)
+        if len(groups) < len(urls):
+            logger.info(
+                f"{len(urls)} targets share {len(groups)} unique URLs "
+                f"(dedup ratio {1 - len(groups) / len(urls):.1%})"
+            )
+
+        # サイトマップの lastmod が前回の確認以降に更新されていない監視対象は取得しない
+        with profiler.span('sitemap'):
+            unmodified = plan_skips(groups, config.get('sitemaps', {}))
+
+        remaining = len(urls) - len(journal.completed)
+
+        def record(result):
+            nonlocal remaining
+            journal.record(result)
+            metrics.observe_result(result)
+            remaining -= 1
+            metrics.QUEUE_DEPTH.set(remaining)
+
+        def schedule():
+            # 確認しない監視対象はその場で記録し、確認するグループだけを返す
+            for canonical_url, targets in governor.order(groups):
+                # 再開した実行では完了済みの監視対象を取得しない
+                targets = [target for target in targets if target.url not in journal.completed]
+                checking = [target for target in targets if target.url not in unmodified]
+                admitted = governor.admit() if checking else False
+                for url_info in targets:
+                    if url_info.url in unmodified:
+                        record(new_result(url_info, canonical_url, skipped='sitemap'))
+                    elif not admitted:
+                        governor.defer(url_info)
+                        record(new_result(url_info, canonical_url, skipped='deferred'))
+                if admitted:
+                    yield canonical_url, checking
+
+        def pipelined(pipeline_config):
+            # 取得はスレッド、パース・ハッシュ化・差分検出はプロセスプールで並列に行う
+            # （cProfile で計測できるのはメインスレッドで行う完了処理だけ）
+            for (canonical_url, targets), fetched, analysis, error, _ in Pipeline(pipeline_config).run(
+                schedule(),
+                lambda group: fetch_group(group[1]),
+                analysis_args
+            ):
+                with profiler.profile_url(canonical_url):
+                    results = complete_group(targets, config, picture_dir, canonical_url, fetched, analysis, error)
+                yield results
+
+        pipeline_config = config.get('pipeline', {})
+        if pipeline_config.get('enabled', False):
+            completed = pipelined(pipeline_config)
+        else:
+            completed = (
+                monitor_group(targets, config, picture_dir, canonical_url)
+                for canonical_url, targets in schedule()
+            )
+
+        # 予算の見込みには完了の間隔を使う（並列に処理している場合も1グループあたりの実効時間になる）
+        group_started_at = time.perf_counter()
+        for results in completed:
+            for result in results:
+                record(result)
+            finished_at = time.perf_counter()
+            governor.account(results, finished_at - group_started_at)
+            group_started_at = finished_at
+        governor.save()
+
+        # 残りの監視結果を結果ストアに反映して実行を完了する
+        with profiler.span('save_results'):
+            stats = journal.finish()
+
+        # 実行サマリーの保存
+        run_finished_at = datetime.now()
+        with profiler.span('run_summary'):
+            save_run_summary(stats, run_started_at, run_finished_at)
+
+        # メトリクスの書き出し
+        metrics.observe_run(run_started_at, run_finished_at)
+        metrics_config = config.get('metrics', {})
+        if metrics_config.get('textfile'):
+            metrics.write_textfile(metrics_config['textfile'])
+
+        # 視覚化（既定では監視処理を待たせないよう別プロセスで描画）
+        report_config = config.get('report', {})
+        if report_config.get('visualization_enabled', False):
+            chart_type = report_config.get('chart_type', 'all')
+            max_urls = report_config.get('max_urls', 30)
+            with profiler.span('report'):
+                if report_config.get('background', True):
+                    start_report_process(picture_dir, chart_type, max_urls)
+                else:
+                    from visualizer import create_monitoring_report
+                    create_monitoring_report(picture_dir, chart_type, max_urls)
+
+        # 保持期間を過ぎたレポート・スクリーンショット・履歴の圧縮（interval_hours ごとに1回）
+        retention_config = config.get('retention', {})
+        if retention_config.get('enabled', False) and is_due(retention_config):
+            with profiler.span('compact'):
+                compact(retention_config, urls)
+
+    finally:
+        try:
+            # トレースとプロファイルの書き出し
+            profiler.disable(run_timestamp)
+            if journal is not None:
+                journal.close()
+        finally:
+            lock.release()
 
-    for url_info in urls:
-        result = monitor_url(url_info, config, csv_dir, picture_dir)
-        monitoring_results.append(result)
+    logger.info("Monitoring completed")
 
-    # 結果の保存
-    csv_path = save_monitoring_result(monitoring_results, csv_dir)
+def run_daemon(profile=None):
+    """
+    監視を一定間隔で繰り返し実行する常駐モードのメイン関数
 
-    # 視覚化
-    if config.get('report', {}).get('visualization_enabled', False):
-        chart_type = config.get('report', {}).get('chart_type', 'all')
-        create_monitoring_report(picture_dir, chart_type)
+    settings.json の monitoring.interval（分）ごとに run_monitoring を実行し、
+    metrics.http_port が設定されていればメトリクスをHTTPで公開する。
+    settings.json と urls.csv は更新された場合のみ各実行の前に再読み込みする
 
-    logger.info("Monitoring completed")
+    Args:
+        profile (dict, optional): 各実行に適用するプロファイリングの設定
+    """
+    from apscheduler.schedulers.blocking import BlockingScheduler
+
+    watcher = TargetWatcher()
+    watcher.refresh()
+    config = watcher.config
+    logger = setup_logger(config.get('log', {'level': 'INFO'}))
+
+    metrics_config = config.get('metrics', {})
+    if metrics_config.get('http_port'):
+        # ポートが使用中でも監視は止めず、エンドポイントなしで続ける
+        try:
+            metrics.start_http_server(
+                int(metrics_config['http_port']),
+                metrics_config.get('http_host', '127.0.0.1')
+            )
+        except OSError as e:
+            logger.warning(f"Could not start metrics endpoint on port {metrics_config['http_port']}: {e}")
+
+    interval = float(config.get('monitoring', {}).get('interval', 5))
+    scheduler = BlockingScheduler()
+
+    def run_once():
+        nonlocal interval
+        run_monitoring(profile, watcher)
+
+        # 監視間隔が変更されていれば次回以降のスケジュールに反映する
+        new_interval = float(watcher.config.get('monitoring', {}).get('interval', 5))
+        if new_interval != interval:
+            interval = new_interval
+            scheduler.reschedule_job('monitoring', trigger='interval', minutes=interval)
+            logger.info(f"Monitoring interval changed to {interval} minutes")
+
+    # 前回の実行が終わっていない場合は次の実行をまとめる（重複実行しない）
+    scheduler.add_job(
+        run_once,
+        'interval',
+        id='monitoring',
+        minutes=interval,
+        next_run_time=datetime.now(),
+        max_instances=1,
+        coalesce=True
+    )
+
+    logger.info(f"Web Monitor daemon started (interval: {interval} minutes)")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Web Monitor daemon stopped")
+
+def _parse_datetime(value):
+    """
+    コマンドライン引数の日付（YYYY-MM-DD またはISO形式の日時）を解釈する関数
+
+    日付だけが指定された場合は date を返し、期間の終わりではその日の終わりまでを含める
+    """
+    if len(value) == 10:
+        return date.fromisoformat(value)
+    return datetime.fromisoformat(value)
+
+def run_query(args):
+    """
+    URLの変更履歴を検索して表示する関数（queryサブコマンド）
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード
+    """
+    start = args.since
+    if args.days is not None:
+        start = datetime.now() - timedelta(days=args.days)
+    elif start is not None and not isinstance(start, datetime):
+        start = datetime.combine(start, datetime.min.time())
+
+    # 日付だけの --until は翌日0時より前（その日の全ての変更）を対象にする
+    end = before = None
+    if isinstance(args.until, datetime):
+        end = args.until
+    elif args.until is not None:
+        before = datetime.combine(args.until + timedelta(days=1), datetime.min.time())
+
+    events = query_history(
+        args.url,
+        start=start,
+        end=end,
+        include_diff=args.diff,
+        limit=args.limit,
+        before=before
+    )
+
+    if args.json:
+        print(json.dumps(events, ensure_ascii=False, indent=2))
+        return 0
+
+    if not events:
+        print(f"No changes recorded for {args.url}")
+        return 0
+
+    print(f"{len(events)} change(s) for {args.url}, last changed at {events[0]['timestamp']}")
+    for event in events:
+        print(
+            f"{event['timestamp']}  +{event['lines_added']}/-{event['lines_removed']}  "
+            f"diff={event['diff_path'] or '-'}  screenshot={event['screenshot_path'] or '-'}"
+        )
+        if args.diff and event.get('diff'):
+            print(event['diff'])
+    return 0
+
+def run_export(args):
+    """
+    結果ストアの監視結果をCSVに書き出す関数（exportサブコマンド）
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード
+    """
+    start = args.since
+    if start is not None and not isinstance(start, datetime):
+        start = datetime.combine(start, datetime.min.time())
+
+    # 日付だけの --until はその日の終わりまでを含める
+    end = args.until
+    if end is not None and not isinstance(end, datetime):
+        end = datetime.combine(end, datetime.max.time())
+
+    columns = args.columns.split(',') if args.columns else None
+    rows = export_csv(Path(args.output), start, end, columns)
+    print(f"Exported {rows} results to {args.output}")
+    return 0
+
+def run_compaction(args):
+    """
+    保持期間の方針に従ってレポート・スクリーンショット・履歴を圧縮する関数（compactサブコマンド）
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード
+    """
+    config, urls, logger = initialize()
+    if not logger:
+        print("Failed to initialize logger")
+        return 1
+
+    # 監視の実行中は履歴やレポートを書き換えないよう、実行ロックを取得してから行う
+    lock = RunLock()
+    if not lock.acquire():
+        return 1
+    try:
+        report = compact(config.get('retention', {}), urls)
+    finally:
+        lock.release()
+
+    if args.json:
+        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+    else:
+        print(f"Compaction: {report}")
+    return 0
+
+def main(argv=None):
+    """
+    コマンドラインのエントリポイント
+
+    サブコマンドを省略した場合は監視を1回実行する
+    """
+    parser = argparse.ArgumentParser(description='Web Monitor')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write a Chrome trace of per-stage spans for each run (logs/profile)')
+    parser.add_argument('--profile-dir', default=str(profiler.PROFILE_DIR),
+                        help='Directory to write traces and cProfile dumps to')
+    parser.add_argument('--cprofile', choices=profiler.CPROFILE_MODES,
+                        help='Also dump cProfile stats for the whole run or for the slowest URLs (implies --profile)')
+    parser.add_argument('--cprofile-top', type=int, default=5,
+                        help='Number of slowest URLs to dump with --cprofile slowest')
+    subparsers = parser.add_subparsers(dest='command')
+
+    subparsers.add_parser('run', help='Run monitoring once (default)')
+    subparsers.add_parser('daemon', help='Run monitoring every monitoring.interval minutes')
+
+    compact_parser = subparsers.add_parser('compact', help='Roll up old reports, shrink old screenshots and prune history')
+    compact_parser.add_argument('--json', action='store_true', help='Print the compaction report as JSON')
+
+    export_parser = subparsers.add_parser('export', help='Export stored monitoring results to a CSV file')
+    export_parser.add_argument('output', help='CSV file to write')
+    export_parser.add_argument('--since', type=_parse_datetime, help='Start date/time (YYYY-MM-DD or ISO format)')
+    export_parser.add_argument('--until', type=_parse_datetime, help='End date/time (YYYY-MM-DD or ISO format)')
+    export_parser.add_argument('--columns', help='Comma-separated list of columns to export (default: all)')
+
+    query_parser = subparsers.add_parser('query', help='Look up recorded changes for a URL')
+    query_parser.add_argument('url', help='URL to look up')
+    query_parser.add_argument('--since', type=_parse_datetime, help='Start date/time (YYYY-MM-DD or ISO format)')
+    query_parser.add_argument('--until', type=_parse_datetime, help='End date/time (YYYY-MM-DD or ISO format)')
+    query_parser.add_argument('--days', type=int, help='Only show changes from the last N days')
+    query_parser.add_argument('--limit', type=int, help='Maximum number of events to show')
+    query_parser.add_argument('--diff', action='store_true', help='Print the stored diff of each event')
+    query_parser.add_argument('--json', action='store_true', help='Print events as JSON')
+
+    args = parser.parse_args(argv)
+
+    profile = None
+    if args.profile or args.cprofile:
+        profile = {
+            'output_dir': Path(args.profile_dir),
+            'cprofile_mode': args.cprofile,
+            'top_n': args.cprofile_top
+        }
+
+    if args.command == 'query':
+        return run_query(args)
+
+    if args.command == 'compact':
+        return run_compaction(args)
+
+    if args.command == 'export':
+        return run_export(args)
+
+    if args.command == 'daemon':
+        run_daemon(profile)
+        return 0
+
+    run_monitoring(profile)
+    return 0
 
 if __name__ == "__main__":
-    run_monitoring()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
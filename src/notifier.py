@@ -2,29 +2,43 @@
 通知機能を提供するモジュール
 """
 import os
+import html
 import smtplib
 import requests
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
+from email.mime.application import MIMEApplication
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 
 from logger import get_logger
+from diff_summary import (
+    DEFAULT_TOP_HUNKS,
+    DEFAULT_EMAIL_MAX_BYTES,
+    DEFAULT_SLACK_MAX_CHARS,
+    summarize_diff,
+    render_email_diff,
+    render_text_diff,
+    compress_diff
+)
 
 # 環境変数の読み込み
 load_dotenv(Path('config/.env'))
 logger = get_logger()
 
-def send_email_notification(url_info, diff, screenshot_path=None):
+def send_email_notification(url_info, diff, screenshot_path=None, summary=None,
+                            max_bytes=DEFAULT_EMAIL_MAX_BYTES):
     """
     メール通知を送信する関数
 
     Args:
-        url_info (dict): URL情報の辞書
+        url_info (Target): 監視対象
         diff (str): 検出された差分
         screenshot_path (str, optional): スクリーンショットのパス
+        summary (dict, optional): summarize_diff で作成済みの差分要約
+        max_bytes (int, optional): 本文に埋め込む差分の最大バイト数（超過分は圧縮して添付）
 
     Returns:
         bool: 成功した場合はTrue
@@ -46,7 +60,12 @@ def send_email_notification(url_info, diff, screenshot_path=None):
             return False
 
         # URLの名前があれば使用、なければURLを使用
-        site_name = url_info.get('name', url_info['url'])
+        site_name = url_info.display_name
+
+        # 差分の要約とサイズ上限付きの本文
+        if summary is None:
+            summary = summarize_diff(diff)
+        diff_html, attach_full_diff = render_email_diff(diff, summary, max_bytes)
 
         # メッセージの作成
         msg = MIMEMultipart()
@@ -61,13 +80,13 @@ def send_email_notification(url_info, diff, screenshot_path=None):
             <h2>Web Monitor Alert</h2>
             <p>Changes have been detected on the monitored website:</p>
             <ul>
-                <li><strong>URL:</strong> <a href="{url_info['url']}">{url_info['url']}</a></li>
-                <li><strong>Name:</strong> {site_name}</li>
+                <li><strong>URL:</strong> <a href="{html.escape(url_info.url)}">{html.escape(url_info.url)}</a></li>
+                <li><strong>Name:</strong> {html.escape(site_name)}</li>
                 <li><strong>Timestamp:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</li>
             </ul>
 
             <h3>Detected Changes:</h3>
-            <pre style="background-color: #f5f5f5; padding: 10px; border-radius: 5px;">{diff}</pre>
+            {diff_html}
 
             {f'<h3>Screenshot:</h3><p>See attachment</p>' if screenshot_path else ''}
 
@@ -80,6 +99,12 @@ def send_email_notification(url_info, diff, screenshot_path=None):
         html_part = MIMEText(html_content, 'html')
         msg.attach(html_part)
 
+        # 本文に収まらない差分は圧縮して添付
+        if attach_full_diff:
+            diff_part = MIMEApplication(compress_diff(diff), _subtype='gzip')
+            diff_part.add_header('Content-Disposition', 'attachment', filename='diff.txt.gz')
+            msg.attach(diff_part)
+
         # スクリーンショットの添付
         if screenshot_path:
             try:
@@ -96,21 +121,24 @@ def send_email_notification(url_info, diff, screenshot_path=None):
             server.login(smtp_username, smtp_password)
             server.send_message(msg)
 
-        logger.info(f"Email notification sent for {url_info['url']} to {len(recipients)} recipients")
+        logger.info(f"Email notification sent for {url_info.url} to {len(recipients)} recipients")
         return True
 
     except Exception as e:
         logger.error(f"Error sending email notification: {e}")
         return False
 
-def send_slack_notification(url_info, diff, screenshot_path=None):
+def send_slack_notification(url_info, diff, screenshot_path=None, summary=None,
+                            max_chars=DEFAULT_SLACK_MAX_CHARS):
     """
     Slack通知を送信する関数
 
     Args:
-        url_info (dict): URL情報の辞書
+        url_info (Target): 監視対象
         diff (str): 検出された差分
         screenshot_path (str, optional): スクリーンショットのパス
+        summary (dict, optional): summarize_diff で作成済みの差分要約
+        max_chars (int, optional): メッセージに含める差分の最大文字数
 
     Returns:
         bool: 成功した場合はTrue
@@ -126,7 +154,10 @@ def send_slack_notification(url_info, diff, screenshot_path=None):
             return False
 
         # URLの名前があれば使用、なければURLを使用
-        site_name = url_info.get('name', url_info['url'])
+        site_name = url_info.display_name
+
+        if summary is None:
+            summary = summarize_diff(diff)
 
         # メッセージの作成
         message = {
@@ -137,12 +168,12 @@ def send_slack_notification(url_info, diff, screenshot_path=None):
                 {
                     "color": "#f2c744",
                     "title": f"Changes detected on {site_name}",
-                    "title_link": url_info['url'],
-                    "text": f"```{diff[:1000]}{'...' if len(diff) > 1000 else ''}```",
+                    "title_link": url_info.url,
+                    "text": f"```{render_text_diff(diff, summary, max_chars)}```",
                     "fields": [
                         {
                             "title": "URL",
-                            "value": url_info['url'],
+                            "value": url_info.url,
                             "short": False
                         },
                         {
@@ -165,22 +196,23 @@ def send_slack_notification(url_info, diff, screenshot_path=None):
         response = requests.post(webhook_url, json=message)
         response.raise_for_status()
 
-        logger.info(f"Slack notification sent for {url_info['url']}")
+        logger.info(f"Slack notification sent for {url_info.url}")
         return True
 
     except Exception as e:
         logger.error(f"Error sending Slack notification: {e}")
         return False
 
-def send_notification(url_info, diff, config, screenshot_path=None):
+def send_notification(url_info, diff, config, screenshot_path=None, summary=None):
     """
     設定に基づいて通知を送信する関数
 
     Args:
-        url_info (dict): URL情報の辞書
+        url_info (Target): 監視対象
         diff (str): 検出された差分
         config (dict): 通知設定
         screenshot_path (str, optional): スクリーンショットのパス
+        summary (dict, optional): summarize_diff で作成済みの差分要約（省略時はここで1回だけ作成）
 
     Returns:
         bool: いずれかの通知が成功した場合はTrue
@@ -188,20 +220,34 @@ def send_notification(url_info, diff, config, screenshot_path=None):
     success = False
 
     # URLごとの通知設定をチェック
-    should_notify = url_info.get('notification', 'true').lower() == 'true'
-
-    if not should_notify:
-        logger.debug(f"Notification disabled for {url_info['url']}")
+    if not url_info.notification:
+        logger.debug("Notification disabled for {}", url_info.url)
         return False
 
+    # 差分の要約は全チャネルで共有する
+    if summary is None:
+        summary = summarize_diff(diff, top_n=config.get('top_hunks', DEFAULT_TOP_HUNKS))
+
     # メール通知
     if config.get('email', False):
-        email_success = send_email_notification(url_info, diff, screenshot_path)
+        email_success = send_email_notification(
+            url_info,
+            diff,
+            screenshot_path,
+            summary=summary,
+            max_bytes=config.get('email_max_bytes', DEFAULT_EMAIL_MAX_BYTES)
+        )
         success = success or email_success
 
     # Slack通知
     if config.get('slack', False):
-        slack_success = send_slack_notification(url_info, diff, screenshot_path)
+        slack_success = send_slack_notification(
+            url_info,
+            diff,
+            screenshot_path,
+            summary=summary,
+            max_chars=config.get('slack_max_chars', DEFAULT_SLACK_MAX_CHARS)
+        )
         success = success or slack_success
 
     return success
\ No newline at end of file
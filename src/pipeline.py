@@ -0,0 +1,171 @@
+"""
+取得とCPU処理を並列に実行するパイプラインを提供するモジュール
+
+ページの取得（ネットワークI/O）はスレッドプールで、HTMLのパース・テキストの正規化・
+ハッシュ化・差分検出（GILを解放しない純Pythonの処理）はプロセスプールで実行する。
+プロセス間ではBeautifulSoupのオブジェクトではなく、本文のバイト列と結果の文字列だけを
+受け渡す。処理中のグループ数は max_in_flight で制限し、取得がCPU処理より速い場合も
+メモリ上に本文が溜まり続けないようにする。
+"""
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from logger import get_logger
+from utils import decode_body, extract_text, hash_text, diff_texts
+
+logger = get_logger()
+
+DEFAULT_FETCH_WORKERS = 8
+
+def analyze_page(body, encoding, old_contents):
+    """
+    ページの本文をパースし、ハッシュ値と前回の内容との差分を求める関数（プロセスプールで実行）
+
+    Args:
+        body (bytes or str): 今回取得した本文
+        encoding (str): レスポンスヘッダーの文字コード（Noneの場合は本文から推定）
+        old_contents (dict): 前回のハッシュ値をキーとする前回の内容（HTML）
+
+    Returns:
+        dict: encoding, content_hash, detections（前回のハッシュ値をキーとする
+            (変更があるか, 差分) の辞書）, 処理段階ごとの所要時間 (parse_ms, hash_ms, diff_ms)
+            と計測区間 spans を含む辞書
+    """
+    started_at = time.perf_counter()
+    if isinstance(body, bytes):
+        content, encoding = decode_body(body, encoding)
+    else:
+        content = body
+    new_text, clean_text = extract_text(content)
+    old_texts = {key: extract_text(old_content)[0] for key, old_content in old_contents.items()}
+    parsed_at = time.perf_counter()
+
+    content_hash = hash_text(clean_text)
+    hashed_at = time.perf_counter()
+
+    detections = {
+        key: diff_texts(old_text, new_text) if old_text and new_text else (False, "")
+        for key, old_text in old_texts.items()
+    }
+    finished_at = time.perf_counter()
+
+    # perf_counter はプロセス間で共通の単調時計のため、区間はそのままトレースに記録できる
+    return {
+        'encoding': encoding,
+        'content_hash': content_hash,
+        'detections': detections,
+        'parse_ms': (parsed_at - started_at) * 1000,
+        'hash_ms': (hashed_at - parsed_at) * 1000,
+        'diff_ms': (finished_at - hashed_at) * 1000,
+        'spans': [
+            ('parse', started_at, parsed_at),
+            ('hash', parsed_at, hashed_at),
+            ('diff', hashed_at, finished_at)
+        ]
+    }
+
+def _init_worker():
+    """
+    ワーカープロセスの初期化（監視処理のログ出力先は親プロセスだけが持つ）
+    """
+    from loguru import logger as root_logger
+    root_logger.remove()
+    root_logger.add(sys.stderr, level='WARNING')
+
+class Pipeline:
+    """
+    取得用のスレッドプールとCPU処理用のプロセスプールをつなぐパイプライン
+    """
+
+    def __init__(self, config):
+        """
+        Args:
+            config (dict): settings.json の pipeline セクション
+        """
+        self.fetch_workers = max(1, int(config.get('fetch_workers') or DEFAULT_FETCH_WORKERS))
+        self.cpu_workers = max(1, int(config.get('cpu_workers') or os.cpu_count() or 1))
+        self.max_in_flight = max(1, int(config.get('max_in_flight') or 2 * (self.fetch_workers + self.cpu_workers)))
+
+    def _submit(self, threads, processes, item, fetch, prepare):
+        """
+        1件を取得用のスレッドに投入し、取得後にCPU処理をプロセスプールに投入する
+
+        Returns:
+            Future: (item, 取得結果, CPU処理の結果, 例外, 所要時間（秒）) を返すFuture
+        """
+        future = Future()
+        started_at = time.perf_counter()
+
+        def settle(state, analysis=None, error=None):
+            future.set_result((item, state, analysis, error, time.perf_counter() - started_at))
+
+        def on_analyzed(cpu_future, state):
+            try:
+                settle(state, cpu_future.result())
+            except Exception as e:
+                settle(state, error=e)
+
+        def on_fetched(fetch_future):
+            try:
+                state = fetch_future.result()
+                args = prepare(state)
+            except Exception as e:
+                settle(None, error=e)
+                return
+            if args is None:
+                settle(state)
+                return
+            try:
+                cpu_future = processes.submit(analyze_page, *args)
+            except Exception as e:
+                settle(state, error=e)
+                return
+            cpu_future.add_done_callback(lambda done: on_analyzed(done, state))
+
+        threads.submit(fetch, item).add_done_callback(on_fetched)
+        return future
+
+    def run(self, items, fetch, prepare):
+        """
+        各要素を取得・解析し、終わったものから順に返すジェネレータ
+
+        処理中の要素が max_in_flight 件に達している間は、次の要素を取り出さない
+
+        Args:
+            items (iterable): 処理する要素（必要になった時点で1件ずつ取り出す）
+            fetch (callable): 要素を受け取り取得結果を返す関数（スレッドで実行）
+            prepare (callable): 取得結果から analyze_page の引数のタプルを返す関数
+                （解析が不要な場合はNone）
+
+        Yields:
+            tuple: (要素, 取得結果, analyze_page の戻り値, 例外, 所要時間（秒）)
+        """
+        logger.info(
+            f"Pipeline started ({self.fetch_workers} fetch workers, {self.cpu_workers} CPU workers, "
+            f"max {self.max_in_flight} in flight)"
+        )
+        # 取得用のスレッドが動いている間にforkしないよう、ワーカーは spawn で起動する
+        context = multiprocessing.get_context('spawn')
+        with ThreadPoolExecutor(self.fetch_workers, thread_name_prefix='fetch') as threads, \
+                ProcessPoolExecutor(self.cpu_workers, mp_context=context, initializer=_init_worker) as processes:
+            items = iter(items)
+            in_flight = set()
+            exhausted = False
+            while True:
+                while not exhausted and len(in_flight) < self.max_in_flight:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    in_flight.add(self._submit(threads, processes, item, fetch, prepare))
+
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    yield future.result()
@@ -0,0 +1,214 @@
+"""
+プロファイリングモードを提供するモジュール
+
+有効化すると処理段階ごとのスパンを記録し、Chromeのトレースイベント形式
+(chrome://tracing や Perfetto で表示可能) のJSONとして書き出す。
+cProfileによる実行全体、または処理時間の長いURL上位N件のプロファイルも出力できる。
+無効時は span() が共有の空コンテキストを返すだけなので、オーバーヘッドはほぼない。
+"""
+import os
+import json
+import heapq
+import cProfile
+import hashlib
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from logger import get_logger
+
+logger = get_logger()
+
+PROFILE_DIR = Path('logs/profile')
+CPROFILE_MODES = ('run', 'slowest')
+
+_NULL_CONTEXT = nullcontext()
+
+# 有効なプロファイラ（無効時はNone）
+_active = None
+
+class Profiler:
+    """
+    1回の実行分のトレースイベントとcProfileの結果を保持するクラス
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR, cprofile_mode=None, top_n=5):
+        if cprofile_mode not in (None,) + CPROFILE_MODES:
+            raise ValueError(f"cprofile_mode must be one of {CPROFILE_MODES}")
+        self.output_dir = Path(output_dir)
+        self.cprofile_mode = cprofile_mode
+        self.top_n = top_n
+        self.events = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.run_profile = None
+        # (所要時間, 連番, URL, cProfile) の最小ヒープ
+        self.slowest = []
+        self.sequence = 0
+
+    def add_event(self, name, started_at, finished_at, args=None):
+        """
+        完了イベント（ph: X）を追加する
+        """
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': (started_at - self.origin) * 1e6,
+            'dur': (finished_at - started_at) * 1e6,
+            'pid': self.pid,
+            'tid': threading.get_ident()
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+
+    def keep_url_profile(self, url, elapsed, profile):
+        """
+        処理時間の長いURL上位N件のプロファイルだけを保持する
+        """
+        with self.lock:
+            self.sequence += 1
+            entry = (elapsed, self.sequence, url, profile)
+            if len(self.slowest) < self.top_n:
+                heapq.heappush(self.slowest, entry)
+            elif entry[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def write(self, timestamp):
+        """
+        トレースとcProfileの結果をファイルに書き出す
+
+        Returns:
+            list: 書き出したファイルのパスのリスト
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        outputs = []
+
+        trace_path = self.output_dir / f"trace_{timestamp}.json"
+        with open(trace_path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+        outputs.append(trace_path)
+
+        if self.run_profile is not None:
+            run_path = self.output_dir / f"run_{timestamp}.pstats"
+            self.run_profile.dump_stats(str(run_path))
+            outputs.append(run_path)
+
+        for rank, (elapsed, _, url, profile) in enumerate(sorted(self.slowest, reverse=True), start=1):
+            url_hash = hashlib.md5(url.encode()).hexdigest()[:10]
+            url_path = self.output_dir / f"url_{timestamp}_{rank:02d}_{url_hash}.pstats"
+            profile.dump_stats(str(url_path))
+            outputs.append(url_path)
+            logger.info(f"Profile #{rank}: {url} ({elapsed * 1000:.0f} ms) -> {url_path}")
+
+        return outputs
+
+def enable(output_dir=PROFILE_DIR, cprofile_mode=None, top_n=5):
+    """
+    プロファイリングを有効にする関数
+
+    Args:
+        output_dir (Path): 出力先ディレクトリ
+        cprofile_mode (str, optional): 'run'（実行全体）または 'slowest'（遅いURL上位N件）
+        top_n (int): 'slowest' で保存するURL数
+
+    Returns:
+        Profiler: 有効にしたプロファイラ
+    """
+    global _active
+    _active = Profiler(output_dir, cprofile_mode, top_n)
+    if cprofile_mode == 'run':
+        _active.run_profile = cProfile.Profile()
+        _active.run_profile.enable()
+    logger.info(f"Profiling enabled (cProfile: {cprofile_mode or 'off'}, output: {_active.output_dir})")
+    return _active
+
+def disable(timestamp):
+    """
+    プロファイリングを終了して結果を書き出す関数
+
+    Args:
+        timestamp (str): 出力ファイル名に使うタイムスタンプ
+
+    Returns:
+        list: 書き出したファイルのパスのリスト
+    """
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return []
+    if profiler.run_profile is not None:
+        profiler.run_profile.disable()
+
+    outputs = profiler.write(timestamp)
+    logger.info(f"Profile trace written to {outputs[0]} ({len(profiler.events)} spans)")
+    return outputs
+
+def is_enabled():
+    """
+    プロファイリングが有効かを返す関数
+    """
+    return _active is not None
+
+def add_event(name, started_at, finished_at, args=None):
+    """
+    計測済みの区間をスパンとして記録する関数（無効時は何もしない）
+
+    Args:
+        name (str): スパン名
+        started_at (float): 開始時刻（time.perf_counter()）
+        finished_at (float): 終了時刻（time.perf_counter()）
+        args (dict, optional): スパンに付与する情報
+    """
+    profiler = _active
+    if profiler is not None:
+        profiler.add_event(name, started_at, finished_at, args)
+
+@contextmanager
+def _span(profiler, name, args):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add_event(name, started_at, time.perf_counter(), args)
+
+def span(name, **args):
+    """
+    ブロックをスパンとして記録するコンテキストマネージャを返す関数
+
+    無効時は共有の空コンテキストを返す
+
+    Args:
+        name (str): スパン名
+        **args: スパンに付与する情報
+    """
+    profiler = _active
+    if profiler is None:
+        return _NULL_CONTEXT
+    return _span(profiler, name, args)
+
+@contextmanager
+def _url_profile(profiler, url):
+    profile = cProfile.Profile()
+    started_at = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profiler.keep_url_profile(url, time.perf_counter() - started_at, profile)
+
+def profile_url(url):
+    """
+    'slowest' モードのときURL単位でcProfileを取るコンテキストマネージャを返す関数
+
+    Args:
+        url (str): 対象のURL
+    """
+    profiler = _active
+    if profiler is None or profiler.cprofile_mode != 'slowest':
+        return _NULL_CONTEXT
+    return _url_profile(profiler, url)
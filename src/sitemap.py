@@ -0,0 +1,265 @@
+"""
+サイトマップの lastmod を使って取得を省略する機能を提供するモジュール
+
+settings.json の sitemaps.domains に登録したドメインについて、sitemap.xml（サイトマップ
+インデックス・gzip圧縮されたサイトマップを含む）を逐次パースし、前回の確認以降に
+lastmod が更新されていない監視対象の取得を省略する。
+sitemaps.full_check_hours ごとに、サイトマップに関係なく全件を確認する。
+"""
+import os
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import urlsplit
+from xml.etree.ElementTree import XMLPullParser
+
+import requests
+
+from logger import get_logger
+from utils import load_json_state, save_json_state_atomic
+from targets import canonicalize_url
+from history_index import HISTORY_DIR, url_key
+
+logger = get_logger()
+
+STATE_PATH = Path('data/state/sitemap.json')
+
+# サイトマップインデックスをたどる深さの上限
+MAX_DEPTH = 3
+
+DEFAULT_FULL_CHECK_HOURS = 24
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# 1回に読み込むバイト数
+CHUNK_SIZE = 64 * 1024
+
+def _namespace(tag):
+    """
+    タグの名前空間部分（{...}）を返す
+    """
+    return tag[:tag.index('}') + 1] if tag.startswith('{') else ''
+
+def parse_lastmod(value):
+    """
+    W3C Datetime形式の lastmod をローカル時刻（タイムゾーンなし）に変換する関数
+
+    時刻を含まない値（日付・年月・年のみ）はその期間の終わりとして扱う。その期間内の
+    どの時刻に更新されたか分からないため、期間の始まりとして扱うと、確認した後の
+    同じ日の更新を見落とすことになる
+
+    Args:
+        value (str): lastmod の値（YYYY-MM-DD、YYYY-MM-DDThh:mm:ss+09:00 など）
+
+    Returns:
+        datetime: ローカル時刻（解釈できない場合はNone）
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        if len(value) == 10:
+            # 日付のみ (YYYY-MM-DD)
+            return datetime.fromisoformat(value) + timedelta(days=1) - timedelta(microseconds=1)
+        if len(value) == 7:
+            # 年月のみ (YYYY-MM)
+            start = datetime.strptime(value, '%Y-%m')
+            following = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+            return following - timedelta(microseconds=1)
+        if len(value) == 4:
+            # 年のみ (YYYY)
+            return datetime(int(value) + 1, 1, 1) - timedelta(microseconds=1)
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def _iter_chunks(url, timeout):
+    """
+    サイトマップを取得し、展開済みのバイト列を少しずつ返すジェネレータ
+    """
+    response = requests.get(
+        url,
+        headers={'User-Agent': os.environ.get('USER_AGENT', 'Mozilla/5.0')},
+        stream=True,
+        timeout=timeout
+    )
+    try:
+        response.raise_for_status()
+        decompressor = None
+        first = True
+        # Content-Encoding: gzip は iter_content 側で展開される
+        for chunk in response.iter_content(CHUNK_SIZE):
+            # .xml.gz のように本体がgzipの場合は先頭のマジックナンバーで判定して展開する
+            if first:
+                first = False
+                if chunk[:2] == GZIP_MAGIC:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            yield decompressor.decompress(chunk) if decompressor else chunk
+        if decompressor:
+            yield decompressor.flush()
+    finally:
+        response.close()
+
+def iter_sitemap(url, timeout=30, depth=0):
+    """
+    サイトマップの <url> を1件ずつ返すジェネレータ
+
+    サイトマップインデックスの場合は参照先のサイトマップを順にたどる。
+    要素は読み終えるたびに破棄するため、大きなサイトマップでもメモリ使用量は一定
+
+    Args:
+        url (str): サイトマップのURL
+        timeout (int): 取得のタイムアウト（秒）
+        depth (int): サイトマップインデックスの入れ子の深さ
+
+    Yields:
+        tuple: (loc, lastmod の文字列)
+    """
+    if depth > MAX_DEPTH:
+        logger.warning(f"Sitemap index nesting too deep at {url}")
+        return
+
+    parser = XMLPullParser(events=('start', 'end'))
+    children = []
+    root = None
+    namespace = ''
+    loc = lastmod = None
+    for chunk in _iter_chunks(url, timeout):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+                    namespace = _namespace(root.tag)
+                continue
+            # 画像サイトマップなど拡張の名前空間の要素（image:loc など）は無視する
+            if not element.tag.startswith(namespace):
+                continue
+            name = element.tag[len(namespace):]
+            if name == 'loc':
+                loc = (element.text or '').strip()
+            elif name == 'lastmod':
+                lastmod = element.text
+            elif name == 'url':
+                if loc:
+                    yield loc, lastmod
+                loc = lastmod = None
+                root.clear()
+            elif name == 'sitemap':
+                if loc:
+                    children.append(loc)
+                loc = lastmod = None
+                root.clear()
+    parser.close()
+
+    for child in children:
+        yield from iter_sitemap(child, timeout, depth + 1)
+
+def load_lastmods(canonical_urls, sitemap_url, timeout=30):
+    """
+    サイトマップから監視対象の lastmod だけを読み込む関数
+
+    Args:
+        canonical_urls (set): 正規化した監視対象のURL
+        sitemap_url (str): サイトマップ（またはサイトマップインデックス）のURL
+        timeout (int): 取得のタイムアウト（秒）
+
+    Returns:
+        dict: 正規化したURLをキーとする lastmod（ローカル時刻）の辞書
+    """
+    lastmods = {}
+    entries = 0
+    for loc, lastmod in iter_sitemap(sitemap_url, timeout):
+        entries += 1
+        canonical = canonicalize_url(loc)
+        if canonical in canonical_urls:
+            parsed = parse_lastmod(lastmod)
+            if parsed is not None:
+                lastmods[canonical] = parsed
+    logger.debug(f"Read {entries} sitemap entries from {sitemap_url}, {len(lastmods)} monitored")
+    return lastmods
+
+def last_checked(url, history_dir=HISTORY_DIR):
+    """
+    監視対象を最後に確認した日時を返す関数（履歴ファイルの更新日時を使う）
+
+    Returns:
+        datetime: 最終確認日時（履歴がない場合はNone）
+    """
+    try:
+        return datetime.fromtimestamp(os.stat(Path(history_dir) / f"{url_key(url)}.json").st_mtime)
+    except OSError:
+        return None
+
+def plan_skips(groups, config, now=None, state_path=STATE_PATH):
+    """
+    サイトマップの lastmod から、今回の実行で取得を省略できる監視対象を求める関数
+
+    lastmod が前回の確認日時以前の監視対象だけを省略する（日付のみの lastmod はその日の
+    終わりとして比較するため、同じ日に確認した監視対象は省略しない）。サイトマップにない監視対象、
+    lastmod のない監視対象、履歴のない監視対象は省略しない
+
+    Args:
+        groups (list): group_targets の戻り値（正規化したURL, Target のリスト）
+        config (dict): settings.json の sitemaps セクション
+        now (datetime, optional): 現在日時
+        state_path (Path): ドメインごとの最終全件確認日時の保存先
+
+    Returns:
+        set: 取得を省略する監視対象のURL
+    """
+    domains = {domain.lower(): url for domain, url in config.get('domains', {}).items()}
+    if not config.get('enabled', False) or not domains:
+        return set()
+
+    now = now or datetime.now()
+    full_check_interval = timedelta(hours=float(config.get('full_check_hours', DEFAULT_FULL_CHECK_HOURS)))
+    timeout = config.get('timeout', 30)
+    state = load_json_state(state_path)
+
+    # ドメインごとに監視対象をまとめる
+    by_domain = {}
+    for canonical_url, targets in groups:
+        domain = urlsplit(canonical_url).netloc
+        if domain in domains:
+            by_domain.setdefault(domain, []).append((canonical_url, targets))
+
+    skipped = set()
+    for domain, domain_groups in by_domain.items():
+        last_full_check = state.get(domain)
+        if not last_full_check or now - datetime.fromisoformat(last_full_check) >= full_check_interval:
+            # 定期的な全件確認（サイトマップが更新されていない場合の保険）
+            logger.info(f"Full check for {domain} (sitemap skipping suspended this run)")
+            state[domain] = now.isoformat()
+            continue
+
+        try:
+            lastmods = load_lastmods({canonical for canonical, _ in domain_groups}, domains[domain], timeout)
+        except Exception as e:
+            logger.error(f"Error reading sitemap for {domain}: {e}")
+            continue
+
+        domain_targets = domain_skipped = 0
+        for canonical_url, targets in domain_groups:
+            domain_targets += len(targets)
+            lastmod = lastmods.get(canonical_url)
+            if lastmod is None:
+                continue
+            for target in targets:
+                checked_at = last_checked(target.url)
+                if checked_at is not None and lastmod <= checked_at:
+                    skipped.add(target.url)
+                    domain_skipped += 1
+
+        logger.info(
+            f"Sitemap for {domain}: skipping {domain_skipped} of {domain_targets} "
+            f"targets not modified since last check"
+        )
+
+    save_json_state_atomic(state, state_path)
+    return skipped
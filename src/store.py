@@ -0,0 +1,366 @@
+"""
+監視結果の列指向ストアを提供するモジュール
+
+結果は日付ごとのArrow IPCストリームファイル (data/results/YYYYMMDD.arrows) に
+追記専用で保存する。1回の書き込みが1つのストリームセグメントになり、
+読み込み時はファイル内のセグメントを順に読み出す。書き込み途中で中断された
+末尾のセグメントは読み込み時に読み飛ばし、次の追記の前に切り詰める。
+
+追記のたびにパーティション全体を読み直さないよう、最後に追記を終えた時点のファイル
+サイズと書き込み済みの batch_id をサイドカーファイル (YYYYMMDD.arrows.idx) に記録する。
+ファイルサイズがサイドカーと一致しない場合（書き込み途中の中断など）だけ全体を読み直す。
+
+ストア導入前のCSVレポート (reports/YYYYMMDD/CSV/*.csv と reports/archive 以下のgzip圧縮CSV) は
+import_legacy_csv で1回だけストアに取り込む。
+"""
+import csv
+import gzip
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.csv as pa_csv
+
+from logger import get_logger
+from utils import load_json_state, save_json_state_atomic
+
+logger = get_logger()
+
+RESULTS_DIR = Path('data/results')
+RUNS_DIR = RESULTS_DIR / 'runs'
+LEGACY_REPORTS_DIR = Path('reports')
+PARTITION_SUFFIX = '.arrows'
+INDEX_SUFFIX = '.idx'
+
+# ストリームの終端マーカー（書き込みを最後まで終えたセグメントだけが持つ）
+END_OF_STREAM = b'\xff\xff\xff\xff\x00\x00\x00\x00'
+
+def _partition_path(date_str, base_dir=RESULTS_DIR):
+    """
+    日付パーティションのファイルパスを返す関数
+
+    Args:
+        date_str (str): YYYYMMDD形式の日付
+        base_dir (Path): ストアのディレクトリ
+
+    Returns:
+        Path: パーティションファイルのパス
+    """
+    return Path(base_dir) / f"{date_str}{PARTITION_SUFFIX}"
+
+def _index_path(path):
+    """
+    パーティションのサイドカーファイルのパスを返す関数
+    """
+    return path.with_name(f"{path.name}{INDEX_SUFFIX}")
+
+def _to_table(records):
+    """
+    結果レコードのリストをArrowテーブルに変換する関数
+
+    timestamp列はISO形式の文字列からタイムスタンプ型に変換する
+    """
+    table = pa.Table.from_pylist(records)
+    if 'timestamp' in table.column_names:
+        index = table.column_names.index('timestamp')
+        timestamps = pc.cast(table.column('timestamp'), pa.timestamp('us'))
+        table = table.set_column(index, 'timestamp', timestamps)
+    return table
+
+def append_results(records, base_dir=RESULTS_DIR, batch_id=None):
+    """
+    監視結果をストアに追記する関数
+
+    Args:
+        records (list): 監視結果の辞書のリスト
+        base_dir (Path): ストアのディレクトリ
+        batch_id (str, optional): 書き込みの識別子。セグメントのメタデータに記録し、
+            同じ識別子のセグメントが既にあるパーティションには書き込まない（再実行しても重複しない）
+
+    Returns:
+        int: 書き込んだ行数
+    """
+    if not records:
+        return 0
+
+    base_dir = Path(base_dir)
+    base_dir.mkdir(parents=True, exist_ok=True)
+
+    # タイムスタンプの日付ごとにパーティションを分ける
+    partitions = {}
+    for record in records:
+        date_str = record['timestamp'][:10].replace('-', '')
+        partitions.setdefault(date_str, []).append(record)
+
+    written = 0
+    for date_str, rows in partitions.items():
+        path = _partition_path(date_str, base_dir)
+        batch_ids = _prepare_partition(path)
+        if batch_id in batch_ids:
+            logger.debug(f"Batch {batch_id} is already stored in {path}")
+            continue
+        table = _to_table(rows)
+        if batch_id is not None:
+            table = table.replace_schema_metadata({'batch_id': batch_id})
+            batch_ids.add(batch_id)
+        with open(path, 'ab') as file:
+            with ipc.new_stream(file, table.schema) as writer:
+                writer.write_table(table)
+            size = file.tell()
+        # 追記を終えてから記録する（記録の前に中断した場合はサイズが一致せず、次回は全体を読み直す）
+        save_json_state_atomic({'size': size, 'batch_ids': sorted(batch_ids)}, _index_path(path))
+        written += table.num_rows
+
+    logger.debug(f"Appended {written} results to {base_dir}")
+    return written
+
+def _scan_partition(path, columns=None):
+    """
+    パーティションファイル内のセグメントを先頭から読み込む関数
+
+    ファイルはメモリマップして読み込むため、各列のバッファはファイル上の位置を参照するだけで
+    コピーされない。指定されなかった列のバッファは参照されないまま破棄され、ディスクから読み込まれない
+    （スキーマとレコードバッチのメタデータは列の指定に関係なく読み込む）
+
+    Args:
+        path (Path): パーティションファイルのパス
+        columns (list, optional): 読み込む列（Noneの場合は全列）
+
+    Returns:
+        tuple: (セグメントごとのArrowテーブルのリスト, 最後の完全なセグメントの終端位置, ファイルサイズ)
+    """
+    tables = []
+    with pa.memory_map(str(path), 'r') as source:
+        size = source.size()
+        end = 0
+        while end < size:
+            try:
+                table = ipc.open_stream(source).read_all()
+                position = source.tell()
+                source.seek(position - len(END_OF_STREAM))
+                if source.read(len(END_OF_STREAM)) != END_OF_STREAM:
+                    raise pa.ArrowInvalid('missing end-of-stream marker')
+            except (pa.ArrowInvalid, OSError) as e:
+                # 書き込み途中で中断された末尾セグメント（以降は追記前に切り詰められる）
+                logger.warning(f"Skipping truncated segment at byte {end} of {path}: {e}")
+                break
+            end = position
+            if columns is not None:
+                table = table.select([name for name in columns if name in table.column_names])
+            tables.append(table)
+    return tables, end, size
+
+def _read_partition(path, columns=None):
+    """
+    パーティションファイル内の全セグメントを読み込む関数
+
+    Args:
+        path (Path): パーティションファイルのパス
+        columns (list, optional): 読み込む列（Noneの場合は全列）
+
+    Returns:
+        list: セグメントごとのArrowテーブルのリスト
+    """
+    return _scan_partition(path, columns)[0]
+
+def _prepare_partition(path):
+    """
+    追記の前にパーティションを確認する関数
+
+    書き込み途中で中断された末尾セグメントを切り詰める（不完全なセグメントの後ろに
+    追記すると、追記したセグメントも読み込めなくなるため）。ファイルサイズがサイドカーに
+    記録したサイズと一致する場合は、最後の追記以降に変更されていないため読み直さない
+
+    Returns:
+        set: 書き込み済みのセグメントの batch_id
+    """
+    if not path.exists():
+        return set()
+    index = load_json_state(_index_path(path))
+    if index.get('size') == path.stat().st_size:
+        return set(index.get('batch_ids', []))
+
+    tables, end, size = _scan_partition(path, columns=[])
+    batch_ids = {
+        table.schema.metadata[b'batch_id'].decode('utf-8')
+        for table in tables
+        if table.schema.metadata and b'batch_id' in table.schema.metadata
+    }
+    # メモリマップを参照するテーブルを破棄してから切り詰める
+    del tables
+    if end < size:
+        logger.warning(f"Truncating {size - end} bytes of incomplete segment from {path}")
+        with open(path, 'r+b') as file:
+            file.truncate(end)
+    save_json_state_atomic({'size': end, 'batch_ids': sorted(batch_ids)}, _index_path(path))
+    return batch_ids
+
+def stored_dates(base_dir=RESULTS_DIR):
+    """
+    ストアに存在する日付パーティションの一覧を返す関数
+
+    Args:
+        base_dir (Path): ストアのディレクトリ
+
+    Returns:
+        set: YYYYMMDD形式の日付の集合
+    """
+    base_dir = Path(base_dir)
+    if not base_dir.exists():
+        return set()
+    return {path.name[:-len(PARTITION_SUFFIX)] for path in base_dir.glob(f"*{PARTITION_SUFFIX}")}
+
+def read_results(start=None, end=None, columns=None, base_dir=RESULTS_DIR):
+    """
+    期間と列を指定してストアから監視結果を読み込む関数
+
+    期間外の日付パーティションは開かずにスキップする
+
+    Args:
+        start (datetime, optional): 開始日時（含む）
+        end (datetime, optional): 終了日時（含む）
+        columns (list, optional): 読み込む列（Noneの場合は全列）
+        base_dir (Path): ストアのディレクトリ
+
+    Returns:
+        pyarrow.Table: 監視結果のテーブル
+    """
+    # 期間での絞り込みにはtimestamp列が必要
+    if columns is not None and 'timestamp' not in columns and (start or end):
+        columns = ['timestamp'] + list(columns)
+
+    start_key = start.strftime('%Y%m%d') if start else None
+    end_key = end.strftime('%Y%m%d') if end else None
+
+    tables = []
+    for date_str in sorted(stored_dates(base_dir)):
+        if start_key and date_str < start_key:
+            continue
+        if end_key and date_str > end_key:
+            continue
+        tables.extend(_read_partition(_partition_path(date_str, base_dir), columns))
+
+    if not tables:
+        return pa.table({})
+
+    # 後から列が追加されたセグメントも結合できるようにスキーマを統合する
+    # （セグメントごとの batch_id は結合したテーブルには引き継がない）
+    table = pa.concat_tables(tables, promote_options='default').replace_schema_metadata(None)
+
+    if 'timestamp' in table.column_names:
+        mask = None
+        if start is not None:
+            mask = pc.greater_equal(table['timestamp'], pa.scalar(start, pa.timestamp('us')))
+        if end is not None:
+            upper = pc.less_equal(table['timestamp'], pa.scalar(end, pa.timestamp('us')))
+            mask = upper if mask is None else pc.and_(mask, upper)
+        if mask is not None:
+            table = table.filter(mask)
+
+    return table
+
+def _legacy_csv_files(reports_dir):
+    """
+    ストア導入前のCSVレポートのパスを古い順に返す関数
+
+    実行ごとのCSVと、compaction で日次・月次にまとめたgzip圧縮CSVを対象にする
+    """
+    reports_dir = Path(reports_dir)
+    if not reports_dir.exists():
+        return []
+    paths = []
+    for day_dir in sorted(reports_dir.iterdir()):
+        if day_dir.is_dir() and len(day_dir.name) == 8 and day_dir.name.isdigit():
+            paths.extend(sorted((day_dir / 'CSV').glob('*.csv')))
+    for period in ('monthly', 'daily'):
+        paths.extend(sorted((reports_dir / 'archive' / period).glob('*.csv.gz')))
+    return paths
+
+def _read_legacy_csv(path, exclude_dates):
+    """
+    CSVレポートを監視結果のリストとして読み込む関数
+
+    ストア導入前のCSVにある列 (timestamp, url, name, status_code, has_changed,
+    screenshot_path) だけを、監視結果と同じ型に変換して読み込む
+
+    Args:
+        path (Path): CSVファイルのパス（.gz の場合はgzip圧縮CSV）
+        exclude_dates (set): 読み込まない日付（YYYYMMDD）
+
+    Returns:
+        list: 監視結果の辞書のリスト
+    """
+    opener = gzip.open if path.suffix == '.gz' else open
+    records = []
+    with opener(path, 'rt', encoding='utf-8', newline='') as file:
+        for row in csv.DictReader(file):
+            timestamp = row.get('timestamp') or ''
+            if not timestamp or not row.get('url'):
+                continue
+            if timestamp[:10].replace('-', '') in exclude_dates:
+                continue
+            records.append({
+                'timestamp': timestamp,
+                'url': row['url'],
+                'name': row.get('name') or '',
+                'status_code': int(float(row.get('status_code') or 0)),
+                'has_changed': (row.get('has_changed') or '').lower() in ('true', '1'),
+                'screenshot_path': row.get('screenshot_path') or ''
+            })
+    return records
+
+def import_legacy_csv(exclude_dates=(), reports_dir=LEGACY_REPORTS_DIR, base_dir=RESULTS_DIR):
+    """
+    ストア導入前のCSVレポートを結果ストアに取り込む関数（1回限りの移行用）
+
+    ファイルごとに batch_id を付けて追記するため、途中で中断して再実行しても
+    同じファイルを二重に取り込まない
+
+    Args:
+        exclude_dates (set): 取り込まない日付（YYYYMMDD）。移行を始める前からストアにある日付を渡す
+            （導入後のCSVレポートはストアと同じ監視結果のため）
+        reports_dir (Path): CSVレポートのディレクトリ
+        base_dir (Path): ストアのディレクトリ
+
+    Returns:
+        set: 取り込んだ監視結果の日付（YYYYMMDD）
+    """
+    reports_dir = Path(reports_dir)
+    exclude_dates = set(exclude_dates)
+    imported = set()
+    for path in _legacy_csv_files(reports_dir):
+        try:
+            records = _read_legacy_csv(path, exclude_dates)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable legacy report {path}: {e}")
+            continue
+        if not records:
+            continue
+        batch_id = f"legacy:{path.relative_to(reports_dir).as_posix()}"
+        append_results(records, base_dir, batch_id=batch_id)
+        imported.update(record['timestamp'][:10].replace('-', '') for record in records)
+
+    if imported:
+        logger.info(f"Imported legacy CSV reports for {len(imported)} day(s) into {base_dir}")
+    return imported
+
+def export_csv(output_path, start=None, end=None, columns=None, base_dir=RESULTS_DIR):
+    """
+    ストアの監視結果をCSVとして書き出す関数
+
+    Args:
+        output_path (Path): 出力先のCSVパス
+        start (datetime, optional): 開始日時
+        end (datetime, optional): 終了日時
+        columns (list, optional): 出力する列
+        base_dir (Path): ストアのディレクトリ
+
+    Returns:
+        int: 書き出した行数
+    """
+    table = read_results(start, end, columns, base_dir)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    pa_csv.write_csv(table, str(output_path))
+    logger.info(f"Exported {table.num_rows} results to {output_path}")
+    return table.num_rows
@@ -0,0 +1,355 @@
+"""
+監視対象（urls.csv の各行）の読み込みと変更の監視を提供するモジュール
+
+各行は検証済みの Target に変換し、check_frequency や notification の型変換と
+URLの正規化は読み込み時に1回だけ行う。CSVは1行ずつ読み込むため、10万行規模のリストでも高速に読み込める。
+常駐モードでは TargetWatcher が設定ファイルとURLリストの更新を検知し、追加・削除・変更された
+監視対象だけを反映する。
+"""
+import os
+import re
+import csv
+import json
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from logger import get_logger
+
+logger = get_logger()
+
+URLS_PATH = Path('config/urls.csv')
+SETTINGS_PATH = Path('config/settings.json')
+
+# check_frequency が空の場合の既定値（分）
+DEFAULT_CHECK_FREQUENCY = 5
+
+# http/https のスキームとホストを持つURL（urlparse より高速に検証するため正規表現を使う）
+URL_PATTERN = re.compile(r'https?://[^/?#\s]+(?:[/?#]\S*)?\Z', re.IGNORECASE)
+
+# 正規化で除去するトラッキング用のクエリパラメータ（utm_* は前方一致）
+TRACKING_PARAMS = frozenset((
+    'gclid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi'
+))
+TRACKING_PREFIXES = ('utm_',)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+TRUE_VALUES = ('true', '1', 'yes', 'on')
+FALSE_VALUES = ('false', '0', 'no', 'off')
+
+class Target:
+    """
+    1件の監視対象
+
+    canonical_url は url から決まるため、比較やハッシュには含めない
+    """
+    __slots__ = ('url', 'name', 'check_frequency', 'notification', 'canonical_url')
+
+    def __init__(self, url, name='', check_frequency=DEFAULT_CHECK_FREQUENCY, notification=True, canonical_url=''):
+        self.url = url
+        self.name = name
+        self.check_frequency = check_frequency
+        self.notification = notification
+        # 正規化したURL（毎回の実行で求め直さないよう、作成時に1回だけ求める）
+        self.canonical_url = canonical_url or canonicalize_url(url)
+
+    def _values(self):
+        return (self.url, self.name, self.check_frequency, self.notification)
+
+    def __eq__(self, other):
+        if not isinstance(other, Target):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return (
+            f"Target(url={self.url!r}, name={self.name!r}, "
+            f"check_frequency={self.check_frequency}, notification={self.notification})"
+        )
+
+    @property
+    def display_name(self):
+        """
+        通知などに表示する名前（未設定の場合はURL）
+        """
+        return self.name or self.url
+
+class TargetDelta:
+    """
+    URLリストの再読み込みで追加・削除・変更された監視対象
+    """
+    __slots__ = ('added', 'removed', 'changed')
+
+    def __init__(self, added=(), removed=(), changed=()):
+        self.added = list(added)
+        self.removed = list(removed)
+        self.changed = list(changed)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return f"+{len(self.added)} -{len(self.removed)} ~{len(self.changed)}"
+
+def _parse_bool(value):
+    value = value.strip().lower()
+    if not value or value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"invalid notification value {value!r}")
+
+def _parse_frequency(value):
+    value = value.strip()
+    if not value:
+        return DEFAULT_CHECK_FREQUENCY
+    frequency = int(value)
+    if frequency <= 0:
+        raise ValueError(f"check_frequency must be positive, got {frequency}")
+    return frequency
+
+def iter_targets(path=URLS_PATH, known=None):
+    """
+    URLリストのCSVを1行ずつ検証して Target を返すジェネレータ
+
+    不正な行は警告を出力して読み飛ばす。監視履歴・ジャーナル・繰り越しはURLをキーに
+    保存するため、同じURLの2行目以降はエラーを出力して読み込まない（同じページを別の設定で
+    監視する場合はフラグメントなどでURLを変えれば、取得は1回にまとめられる）
+
+    Args:
+        path (Path): CSVファイルのパス
+        known (dict): URLをキーとする読み込み済みの Target の辞書（正規化したURLを再利用する）
+
+    Yields:
+        Target: 監視対象
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        reader = csv.reader(file)
+        header = [column.strip() for column in next(reader, [])]
+        if 'url' not in header:
+            raise ValueError(f"{path} has no 'url' column")
+
+        # 列の位置（存在しない列は範囲外の位置にして空文字列として扱う）
+        width = len(header)
+        url_index = header.index('url')
+        name_index, frequency_index, notification_index = (
+            header.index(name) if name in header else width
+            for name in ('name', 'check_frequency', 'notification')
+        )
+        # URLと最初に定義された行番号
+        seen = {}
+        known = known or {}
+
+        for line_number, row in enumerate(reader, start=2):
+            if not any(row):
+                continue
+            # 列数をヘッダーに揃え、存在しない列の位置に空文字列を置く
+            row = (row + [''] * width)[:width] + ['']
+            try:
+                url = row[url_index].strip()
+                if not URL_PATTERN.match(url):
+                    raise ValueError(f"invalid URL {url!r}")
+                if url in seen:
+                    logger.error(
+                        f"Rejecting {path} line {line_number}: duplicate URL {url!r} already defined on line {seen[url]} "
+                        f"(use a distinct fragment such as '#2' to monitor the same page with other settings)"
+                    )
+                    continue
+
+                target = Target(
+                    url,
+                    row[name_index].strip(),
+                    _parse_frequency(row[frequency_index]),
+                    _parse_bool(row[notification_index]),
+                    known[url].canonical_url if url in known else ''
+                )
+            except ValueError as e:
+                logger.warning(f"Skipping {path} line {line_number}: {e}")
+                continue
+
+            seen[url] = line_number
+            yield target
+
+def load_targets(path=URLS_PATH):
+    """
+    URLリストを読み込む関数
+
+    Args:
+        path (Path): CSVファイルのパス
+
+    Returns:
+        list: Target のリスト
+    """
+    targets = list(iter_targets(path))
+    logger.debug(f"Loaded {len(targets)} targets from {path}")
+    return targets
+
+def canonicalize_url(url):
+    """
+    同じリソースを指すURLを同一の文字列にそろえる関数
+
+    スキームとホストの小文字化、既定のポート・フラグメント・トラッキング用パラメータ・
+    末尾のスラッシュの除去、クエリパラメータの並べ替えを行う
+
+    Args:
+        url (str): URL
+
+    Returns:
+        str: 正規化したURL
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else '')
+        netloc = f"{userinfo}@{netloc}"
+
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+def group_targets(targets):
+    """
+    正規化したURLが同じ監視対象をまとめる関数
+
+    Args:
+        targets (iterable): Target
+
+    Returns:
+        list: (正規化したURL, Target のリスト) のリスト（最初に出現した順）
+    """
+    groups = {}
+    for target in targets:
+        groups.setdefault(target.canonical_url, []).append(target)
+    return list(groups.items())
+
+def diff_targets(current, targets):
+    """
+    現在の監視対象と新しく読み込んだ監視対象の差分を求める関数
+
+    Args:
+        current (dict): URLをキーとする現在の Target の辞書
+        targets (iterable): 新しく読み込んだ Target
+
+    Returns:
+        TargetDelta: 追加・削除・変更された監視対象
+    """
+    delta = TargetDelta()
+    urls = set()
+    for target in targets:
+        urls.add(target.url)
+        existing = current.get(target.url)
+        if existing is None:
+            delta.added.append(target)
+        elif existing != target:
+            delta.changed.append(target)
+    delta.removed = [target for url, target in current.items() if url not in urls]
+    return delta
+
+class TargetWatcher:
+    """
+    設定ファイルとURLリストの更新を検知して再読み込みするクラス（常駐モード用）
+
+    URLリストは更新時刻とサイズが変わった場合のみ読み込み、差分だけを反映する
+    """
+
+    def __init__(self, urls_path=URLS_PATH, settings_path=SETTINGS_PATH):
+        self.urls_path = Path(urls_path)
+        self.settings_path = Path(settings_path)
+        self.config = {}
+        self._targets = {}
+        self._stamps = {}
+
+    def _modified(self, path):
+        """
+        前回の確認以降にファイルが更新されたかを返す
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if self._stamps.get(path) == stamp:
+            return False
+        self._stamps[path] = stamp
+        return True
+
+    @property
+    def targets(self):
+        return list(self._targets.values())
+
+    def apply(self, delta):
+        """
+        差分を現在の監視対象に反映する
+        """
+        for target in delta.removed:
+            del self._targets[target.url]
+        for target in delta.changed + delta.added:
+            self._targets[target.url] = target
+
+    def _load_settings(self):
+        """
+        設定ファイルを読み込んで検証する
+
+        Returns:
+            dict: 設定情報の辞書
+
+        Raises:
+            OSError: ファイルを読み込めない場合
+            ValueError: JSONとして不正な場合（書き込み途中を含む）や、オブジェクトでない場合
+        """
+        with open(self.settings_path, 'r', encoding='utf-8') as file:
+            config = json.load(file)
+        if not isinstance(config, dict):
+            raise ValueError(f"expected a JSON object, got {type(config).__name__}")
+        return config
+
+    def refresh(self):
+        """
+        更新されたファイルを再読み込みする
+
+        読み込みに失敗したファイルは現在の内容を使い続け、次回の確認で再読み込みする
+
+        Returns:
+            tuple: (設定が更新されたか, URLリストの差分（更新がない場合はNone）)
+        """
+        config_changed = False
+        if self._modified(self.settings_path):
+            try:
+                config = self._load_settings()
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reloading {self.settings_path}, keeping the current configuration: {e}")
+                # 次回の確認で再読み込みする
+                self._stamps.pop(self.settings_path, None)
+            else:
+                self.config = config
+                config_changed = True
+                logger.info(f"Configuration loaded from {self.settings_path}")
+
+        delta = None
+        if self._modified(self.urls_path):
+            try:
+                delta = diff_targets(self._targets, iter_targets(self.urls_path, self._targets))
+            except Exception as e:
+                logger.error(f"Error reloading {self.urls_path}: {e}")
+                # 次回の確認で再読み込みする
+                self._stamps.pop(self.urls_path, None)
+                return config_changed, None
+            self.apply(delta)
+            logger.info(f"Targets reloaded from {self.urls_path}: {delta} ({len(self._targets)} total)")
+
+        return config_changed, delta
@@ -0,0 +1,148 @@
+"""
+処理段階ごとの所要時間の計測と実行サマリーを提供するモジュール
+"""
+import math
+import time
+import heapq
+from array import array
+from contextlib import contextmanager
+
+import profiler
+
+# 監視結果に記録する処理段階（列名は "<段階>_ms"）
+STAGES = ('fetch', 'parse', 'hash', 'diff', 'screenshot', 'notify')
+
+# 実行サマリーに出力するパーセンタイル
+PERCENTILES = (50, 90, 99)
+
+@contextmanager
+def stage(record, name):
+    """
+    ブロックの所要時間をミリ秒で記録するコンテキストマネージャ
+
+    同じ段階を複数回計測した場合は加算する
+    プロファイリングが有効な場合はスパンとしても記録する
+
+    Args:
+        record (dict): 計測結果を書き込む監視結果の辞書
+        name (str): 処理段階の名前
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        finished_at = time.perf_counter()
+        key = f"{name}_ms"
+        record[key] = record.get(key, 0.0) + (finished_at - started_at) * 1000
+        profiler.add_event(name, started_at, finished_at)
+
+def empty_timings():
+    """
+    全段階を0で初期化した計測結果の辞書を返す関数
+
+    Returns:
+        dict: "<段階>_ms" をキーとする辞書
+    """
+    return {f"{name}_ms": 0.0 for name in STAGES}
+
+def percentile(values, q):
+    """
+    ソート済みの値のリストからパーセンタイルを求める関数（最近傍法）
+
+    Args:
+        values (list): 昇順にソートされた数値のリスト
+        q (float): パーセンタイル (0-100)
+
+    Returns:
+        float: パーセンタイル値（空の場合は0.0）
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+    return float(values[index])
+
+class RunStats:
+    """
+    監視結果を1件ずつ受け取り、実行サマリーを逐次集計するクラス
+
+    監視結果そのものは保持せず、計測値だけを配列に蓄えるため、URL数が多くても
+    メモリ使用量はほとんど増えない
+    """
+
+    def __init__(self, slowest_limit=5):
+        self.urls = 0
+        self.canonical_urls = set()
+        self.changes = 0
+        self.failures = 0
+        self.response_bytes = 0
+        self.skipped = 0
+        self.deferred = 0
+        self.values = {f"{name}_ms": array('d') for name in ('elapsed',) + STAGES}
+        self.slowest_limit = slowest_limit
+        self._slowest = []
+
+    def add(self, result):
+        """
+        監視結果を1件加算する
+        """
+        self.urls += 1
+        self.canonical_urls.add(result.get('canonical_url') or result['url'])
+        self.changes += bool(result.get('has_changed'))
+        self.failures += bool(result.get('error'))
+        self.response_bytes += result.get('response_bytes', 0)
+        if result.get('skipped'):
+            # 所要時間の統計は実際に確認した監視結果だけで求める
+            self.skipped += 1
+            self.deferred += result['skipped'] == 'deferred'
+            return
+
+        for key, values in self.values.items():
+            values.append(result.get(key, 0.0))
+
+        # 処理時間の長い監視結果を上位 slowest_limit 件だけ保持する
+        item = (result.get('elapsed_ms', 0.0), result['url'])
+        if len(self._slowest) < self.slowest_limit:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def slowest(self):
+        """
+        処理時間の長い順に (URL, 所要時間) のタプルのリストを返す
+        """
+        return [(url, elapsed_ms) for elapsed_ms, url in sorted(self._slowest, reverse=True)]
+
+    def summary(self, started_at, finished_at):
+        """
+        実行サマリーを返す
+
+        Args:
+            started_at (datetime): 実行開始日時
+            finished_at (datetime): 実行終了日時
+
+        Returns:
+            dict: 実行サマリー（結果ストアのruns テーブルにそのまま保存できる形式）
+        """
+        summary = {
+            'timestamp': started_at.isoformat(),
+            'finished_at': finished_at.isoformat(),
+            'wall_ms': (finished_at - started_at).total_seconds() * 1000,
+            'urls': self.urls,
+            'unique_urls': len(self.canonical_urls),
+            'changes': self.changes,
+            'failures': self.failures,
+            'response_bytes': self.response_bytes,
+            'skipped': self.skipped,
+            'deferred': self.deferred
+        }
+        # 正規化したURLが重複していたため取得を省略できた割合
+        summary['dedup_ratio'] = 1 - summary['unique_urls'] / summary['urls'] if self.urls else 0.0
+
+        for key, values in self.values.items():
+            values = sorted(values)
+            summary[f"{key}_total"] = float(sum(values))
+            for q in PERCENTILES:
+                summary[f"{key}_p{q}"] = percentile(values, q)
+            summary[f"{key}_max"] = values[-1] if values else 0.0
+
+        return summary
@@ -3,16 +3,17 @@
 """
 import os
 import json
+import time
 import hashlib
 import difflib
 from datetime import datetime, timedelta
 from pathlib import Path
-import csv
 import requests
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
 from logger import get_logger
+from targets import load_targets
 
 # 環境変数の読み込み
 load_dotenv(Path('config/.env'))
@@ -28,7 +29,7 @@ def load_config():
     try:
         with open(Path('config/settings.json'), 'r', encoding='utf-8') as file:
             config = json.load(file)
-        logger.debug(f"Configuration loaded: {config}")
+        logger.opt(lazy=True).debug("Configuration loaded: {}", lambda: json.dumps(config, ensure_ascii=False))
         return config
     except Exception as e:
         logger.error(f"Error loading configuration: {e}")
@@ -39,14 +40,10 @@ def load_urls():
     監視対象URLをCSVから読み込む関数
 
     Returns:
-        list: 監視対象URLの辞書のリスト
+        list: 監視対象（Target）のリスト
     """
-    urls = []
     try:
-        with open(Path('config/urls.csv'), 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                urls.append(row)
+        urls = load_targets(Path('config/urls.csv'))
         logger.debug(f"Loaded {len(urls)} URLs for monitoring")
         return urls
     except Exception as e:
@@ -80,16 +77,28 @@ def check_date_condition(config):
         logger.error(f"Error checking date condition: {e}")
         return False
 
-def get_page_content(url):
+def fetch_page(url, raw=False):
     """
-    指定されたURLのページコンテンツを取得する関数
+    指定されたURLのページを取得し、ステータスや転送量も返す関数
 
     Args:
         url (str): 取得対象のURL
+        raw (bool): 本文を文字列に変換せずバイト列のまま返すか（文字コードの判定と変換は
+            decode_body で別途行う）
 
     Returns:
-        str: ページの内容
+        dict: content（失敗時は空文字列）, encoding, status_code, response_bytes, fetch_ms, error を含む辞書
     """
+    page = {
+        'content': '',
+        'encoding': None,
+        'status_code': 0,
+        'response_bytes': 0,
+        'fetch_ms': 0.0,
+        'error': ''
+    }
+    started_at = time.perf_counter()
+
     try:
         user_agent = os.environ.get('USER_AGENT', 'Mozilla/5.0')
         headers = {'User-Agent': user_agent}
@@ -102,13 +111,85 @@ def get_page_content(url):
             proxies['https'] = os.environ.get('HTTPS_PROXY')
 
         response = requests.get(url, headers=headers, proxies=proxies if proxies else None, timeout=30)
+        page['status_code'] = response.status_code
+        page['response_bytes'] = len(response.content)
         response.raise_for_status()
 
-        logger.debug(f"Successfully fetched content from {url}")
-        return response.text
+        page['encoding'] = response.encoding
+        page['content'] = response.content if raw else response.text
+        logger.debug("Successfully fetched content from {}", url)
     except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching URL {url}: {e}")
-        return ""
+        logger.error("Error fetching URL {}: {}", url, e)
+        page['error'] = type(e).__name__
+    finally:
+        page['fetch_ms'] = (time.perf_counter() - started_at) * 1000
+
+    return page
+
+def decode_body(body, encoding=None):
+    """
+    取得したバイト列を requests の Response.text と同じ規則で文字列に変換する関数
+
+    Args:
+        body (bytes): レスポンスの本文
+        encoding (str, optional): レスポンスヘッダーの文字コード（Noneの場合は本文から推定）
+
+    Returns:
+        tuple: (文字列, 使用した文字コード)
+    """
+    if not encoding:
+        import charset_normalizer
+        encoding = charset_normalizer.detect(body)['encoding']
+    try:
+        return str(body, encoding, errors='replace'), encoding
+    except (LookupError, TypeError):
+        return str(body, errors='replace'), None
+
+def get_page_content(url):
+    """
+    指定されたURLのページコンテンツを取得する関数
+
+    Args:
+        url (str): 取得対象のURL
+
+    Returns:
+        str: ページの内容
+    """
+    return fetch_page(url)['content']
+
+def extract_text(content):
+    """
+    HTMLを1回だけパースし、差分用テキストとハッシュ用テキストを抽出する関数
+
+    Args:
+        content (str): HTML
+
+    Returns:
+        tuple: (ページ全体のテキスト, 動的要素を除外したテキスト)
+    """
+    # BeautifulSoupでHTMLをパース
+    soup = BeautifulSoup(content, 'html.parser')
+    text = soup.get_text()
+
+    # 動的に変わる可能性のある要素を除外
+    for element in soup.select('script, style, meta[http-equiv="refresh"], meta[name="viewport"]'):
+        element.extract()
+
+    return text, soup.get_text()
+
+def hash_text(clean_text):
+    """
+    抽出済みテキストのハッシュ値を生成する関数
+
+    Args:
+        clean_text (str): 動的要素を除外したテキスト
+
+    Returns:
+        str: SHA-256ハッシュ値
+    """
+    hash_value = hashlib.sha256(clean_text.encode()).hexdigest()
+    logger.debug("Generated hash: {:.10}...", hash_value)
+    return hash_value
 
 def generate_hash(content):
     """
@@ -121,20 +202,8 @@ def generate_hash(content):
         str: SHA-256ハッシュ値
     """
     try:
-        # BeautifulSoupでHTMLをパース
-        soup = BeautifulSoup(content, 'html.parser')
-
-        # 動的に変わる可能性のある要素を除外
-        for element in soup.select('script, style, meta[http-equiv="refresh"], meta[name="viewport"]'):
-            element.extract()
-
-        # ハッシュ生成
-        clean_content = soup.get_text()
-        hash_obj = hashlib.sha256(clean_content.encode())
-        hash_value = hash_obj.hexdigest()
-
-        logger.debug(f"Generated hash: {hash_value[:10]}...")
-        return hash_value
+        _, clean_content = extract_text(content)
+        return hash_text(clean_content)
     except Exception as e:
         logger.error(f"Error generating hash: {e}")
         return ""
@@ -154,22 +223,37 @@ def detect_changes(old_content, new_content):
         if not old_content or not new_content:
             return False, ""
 
-        # BeautifulSoupでHTMLをパース
-        old_soup = BeautifulSoup(old_content, 'html.parser')
-        new_soup = BeautifulSoup(new_content, 'html.parser')
+        old_text, _ = extract_text(old_content)
+        new_text, _ = extract_text(new_content)
+        return diff_texts(old_text, new_text)
+    except Exception as e:
+        logger.error(f"Error detecting changes: {e}")
+        return False, ""
 
-        # テキストの抽出
-        old_text = old_soup.get_text().strip().split('\n')
-        new_text = new_soup.get_text().strip().split('\n')
+def diff_texts(old_text, new_text):
+    """
+    抽出済みテキスト同士の差分を検出する関数
 
+    Args:
+        old_text (str): 以前のテキスト
+        new_text (str): 新しいテキスト
+
+    Returns:
+        tuple: (変更があるかのブール値, 変更の差分)
+    """
+    try:
         # difflibを使用して差分を検出
-        diff = list(difflib.unified_diff(old_text, new_text, n=3))
+        diff = list(difflib.unified_diff(
+            old_text.strip().split('\n'),
+            new_text.strip().split('\n'),
+            n=3
+        ))
 
         # 差分があるかどうか
         has_changes = len(diff) > 0
 
         if has_changes:
-            logger.debug(f"Changes detected: {len(diff)} diff lines")
+            logger.debug("Changes detected: {} diff lines", len(diff))
         else:
             logger.debug("No changes detected")
 
@@ -205,4 +289,38 @@ def get_timestamp():
     Returns:
         str: YYYYMMDDHHMMSSフォーマットのタイムスタンプ
     """
-    return datetime.now().strftime('%Y%m%d%H%M%S')
\ No newline at end of file
+    return datetime.now().strftime('%Y%m%d%H%M%S')
+
+def load_json_state(path):
+    """
+    実行をまたいで保持する状態をJSONファイルから読み込む関数
+
+    Args:
+        path (Path): 状態ファイルのパス
+
+    Returns:
+        dict: 読み込んだ状態（ファイルが存在しない・読み込めない場合は空の辞書）
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_json_state_atomic(state, path):
+    """
+    状態をJSONファイルに保存する関数
+
+    一時ファイルに書き出してから置き換えるため、書き込み途中で中断されても
+    前回の内容か今回の内容のどちらかが残る
+
+    Args:
+        state: 保存する状態（JSONに変換できる値）
+        path (Path): 状態ファイルのパス
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
\ No newline at end of file
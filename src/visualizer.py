@@ -2,76 +2,66 @@
 視覚化機能を提供するモジュール
 """
 import os
+import sys
+import hashlib
+import argparse
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # バックグラウンドプロセスで描画するため非対話型バックエンドを使用
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 import matplotlib.dates as mdates
 
 from logger import get_logger
+from utils import get_timestamp, load_config, load_json_state, save_json_state_atomic
+from store import RESULTS_DIR, stored_dates
+from aggregates import load_aggregates, rebuild_aggregates
 
 logger = get_logger()
 
-def load_monitoring_data(days=30):
+# グラフに表示するURL数の上限（変更回数の多い順）
+DEFAULT_MAX_URLS = 30
+
+# 前回描画したデータのフィンガープリント
+FINGERPRINT_PATH = RESULTS_DIR / 'chart_fingerprint.json'
+
+# chart_type の別名（settings.json の "line" はタイムラインを指す）
+CHART_TYPE_ALIASES = {'line': 'timeline'}
+
+def select_top_urls(data, max_urls=DEFAULT_MAX_URLS):
     """
-    過去の監視データを読み込む関数
+    変更回数の多いURLだけに集計データを絞り込む関数
 
     Args:
-        days (int): 読み込む日数
+        data (pandas.DataFrame): URL×日付の集計データ
+        max_urls (int): 残すURL数
 
     Returns:
-        pandas.DataFrame: 監視データのデータフレーム
+        tuple: (絞り込んだデータ, 全URL数)
     """
-    try:
-        # 過去n日分のCSVファイルを検索
-        all_data = []
-        reports_dir = Path('reports')
-
-        # 対象となる日付のリストを生成
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
-
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y%m%d')
-            csv_dir = reports_dir / date_str / 'CSV'
-
-            if csv_dir.exists():
-                for csv_file in csv_dir.glob('*.csv'):
-                    try:
-                        df = pd.read_csv(csv_file)
-                        all_data.append(df)
-                    except Exception as e:
-                        logger.error(f"Error reading CSV file {csv_file}: {e}")
-
-            current_date += timedelta(days=1)
-
-        if not all_data:
-            logger.warning(f"No monitoring data found for the last {days} days")
-            return pd.DataFrame()
-
-        # データの結合
-        combined_data = pd.concat(all_data, ignore_index=True)
-
-        # タイムスタンプを日時型に変換
-        if 'timestamp' in combined_data.columns:
-            combined_data['timestamp'] = pd.to_datetime(combined_data['timestamp'])
+    totals = data.groupby('url')['changes'].sum()
+    if len(totals) <= max_urls:
+        return data, len(totals)
 
-        logger.debug(f"Loaded monitoring data: {len(combined_data)} records")
-        return combined_data
+    top_urls = totals.nlargest(max_urls).index
+    return data[data['url'].isin(top_urls)], len(totals)
 
-    except Exception as e:
-        logger.error(f"Error loading monitoring data: {e}")
-        return pd.DataFrame()
+def _figure_height(rows, per_row=0.3, minimum=4, maximum=20):
+    """
+    表示行数に応じたグラフの高さ（インチ）を返す関数
+    """
+    return min(maximum, max(minimum, rows * per_row))
 
-def create_changes_timeline(data, output_path):
+def create_changes_timeline(data, output_path, max_urls=DEFAULT_MAX_URLS):
     """
     変更頻度のタイムラインを作成する関数
 
     Args:
-        data (pandas.DataFrame): 監視データのデータフレーム
+        data (pandas.DataFrame): URL×日付の集計データ（load_aggregatesの戻り値）
         output_path (Path): 出力パス
+        max_urls (int): 表示するURL数の上限（変更回数の多い順）
 
     Returns:
         bool: 成功した場合はTrue
@@ -81,19 +71,20 @@ def create_changes_timeline(data, output_path):
             logger.warning("No data available for visualization")
             return False
 
-        # 変更があったデータのみ抽出
-        changes_data = data[data['has_changed'] == True].copy()
+        # 変更があった日のみ抽出（集計済みのため再集計は不要）
+        changes_count = data.loc[data['changes'] > 0, ['url', 'date', 'changes']]
 
-        if changes_data.empty:
+        if changes_count.empty:
             logger.warning("No changes detected in the data")
             return False
 
-        # URLごとにグループ化
-        grouped = changes_data.groupby(['url', pd.Grouper(key='timestamp', freq='D')])
-        changes_count = grouped.size().reset_index(name='count')
+        # URL数が多い場合は変更回数の多いURLのみ表示
+        changes_count, total_urls = select_top_urls(changes_count, max_urls)
+        changes_count = changes_count.rename(columns={'date': 'timestamp', 'changes': 'count'})
+        shown_urls = changes_count['url'].nunique()
 
         # プロットの設定
-        plt.figure(figsize=(12, 8))
+        plt.figure(figsize=(12, _figure_height(shown_urls, minimum=8)))
         sns.set(style="whitegrid")
 
         # マークサイズを変更回数に比例させる
@@ -103,12 +94,14 @@ def create_changes_timeline(data, output_path):
             y='url',
             size='count',
             sizes=(20, 200),
-            alpha=0.8,
-            palette='viridis'
+            alpha=0.8
         )
 
         # グラフのスタイル設定
-        plt.title('Website Changes Timeline', fontsize=16)
+        title = 'Website Changes Timeline'
+        if total_urls > shown_urls:
+            title += f' (top {shown_urls} of {total_urls} URLs)'
+        plt.title(title, fontsize=16)
         plt.xlabel('Date', fontsize=12)
         plt.ylabel('URL', fontsize=12)
 
@@ -131,13 +124,14 @@ def create_changes_timeline(data, output_path):
         logger.error(f"Error creating changes timeline: {e}")
         return False
 
-def create_url_changes_chart(data, output_path):
+def create_url_changes_chart(data, output_path, max_urls=DEFAULT_MAX_URLS):
     """
     URLごとの変更頻度グラフを作成する関数
 
     Args:
-        data (pandas.DataFrame): 監視データのデータフレーム
+        data (pandas.DataFrame): URL×日付の集計データ（load_aggregatesの戻り値）
         output_path (Path): 出力パス
+        max_urls (int): 表示するURL数の上限（残りは "others" としてまとめる）
 
     Returns:
         bool: 成功した場合はTrue
@@ -148,12 +142,20 @@ def create_url_changes_chart(data, output_path):
             return False
 
         # URLごとの変更回数を集計
-        url_changes = data.groupby('url')['has_changed'].sum().reset_index()
+        url_changes = data.groupby('url')['changes'].sum().reset_index()
         url_changes.columns = ['url', 'changes']
         url_changes = url_changes.sort_values('changes', ascending=False)
 
+        # 上限を超えるURLは1本の棒にまとめる
+        if len(url_changes) > max_urls:
+            others = url_changes.iloc[max_urls:]
+            url_changes = pd.concat([
+                url_changes.iloc[:max_urls],
+                pd.DataFrame({'url': [f"(other {len(others)} URLs)"], 'changes': [others['changes'].sum()]})
+            ], ignore_index=True)
+
         # プロット
-        plt.figure(figsize=(10, 6))
+        plt.figure(figsize=(10, _figure_height(len(url_changes), minimum=6)))
         sns.set(style="whitegrid")
 
         ax = sns.barplot(x='changes', y='url', data=url_changes, palette='viridis')
@@ -179,41 +181,123 @@ def create_url_changes_chart(data, output_path):
         logger.error(f"Error creating URL changes chart: {e}")
         return False
 
-def create_monitoring_report(report_dir, chart_type='all'):
+def data_fingerprint(data, chart_type, max_urls):
+    """
+    グラフの入力データのフィンガープリントを計算する関数
+
+    Args:
+        data (pandas.DataFrame): URL×日付の集計データ
+        chart_type (str): グラフの種類
+        max_urls (int): 表示するURL数の上限
+
+    Returns:
+        str: SHA-256ハッシュ値
+    """
+    columns = data[['url', 'date', 'changes']].sort_values(['url', 'date']).reset_index(drop=True)
+    digest = hashlib.sha256(f"{chart_type}:{max_urls}:".encode())
+    digest.update(pd.util.hash_pandas_object(columns, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def _load_fingerprint():
+    """
+    前回描画時のフィンガープリント情報を読み込む関数
+    """
+    return load_json_state(FINGERPRINT_PATH)
+
+def _save_fingerprint(fingerprint, outputs):
+    """
+    描画したデータのフィンガープリントと出力先を保存する関数（一時ファイル経由で置き換える）
+    """
+    save_json_state_atomic({
+        'fingerprint': fingerprint,
+        'outputs': [str(path) for path in outputs],
+        'rendered_at': datetime.now().isoformat()
+    }, FINGERPRINT_PATH)
+
+def create_monitoring_report(report_dir, chart_type='all', max_urls=DEFAULT_MAX_URLS, force=False):
     """
     監視レポートを作成する関数
 
+    入力データが前回描画時から変わっていない場合は描画を省略する
+
     Args:
         report_dir (Path): レポートディレクトリのパス
-        chart_type (str): 生成するグラフの種類 ('timeline', 'bar', 'all')
+        chart_type (str): 生成するグラフの種類 ('timeline', 'line', 'bar', 'all')
+        max_urls (int): グラフに表示するURL数の上限
+        force (bool): データが変わっていなくても描画するか
 
     Returns:
         bool: 成功した場合はTrue
     """
     try:
-        # 監視データの読み込み
-        data = load_monitoring_data(days=30)
+        report_dir = Path(report_dir)
+        chart_type = CHART_TYPE_ALIASES.get(chart_type, chart_type)
+
+        # 集計テーブルの読み込み（未作成の場合は結果ストアから作成）
+        data = load_aggregates(days=30)
+        if data.empty and stored_dates():
+            rebuild_aggregates(days=30)
+            data = load_aggregates(days=30)
 
         if data.empty:
             logger.warning("No data available for report generation")
             return False
 
-        from utils import get_timestamp
+        # 前回と同じデータであれば描画しない
+        fingerprint = data_fingerprint(data, chart_type, max_urls)
+        previous = _load_fingerprint()
+        if not force and previous.get('fingerprint') == fingerprint:
+            logger.info(f"Report data unchanged since {previous.get('rendered_at')}, skipping chart rendering")
+            return True
+
         timestamp = get_timestamp()
+        expected = 0
+        outputs = []
 
         if chart_type in ['timeline', 'all']:
             # タイムラインの作成
+            expected += 1
             timeline_path = report_dir / f"timeline_{timestamp}.png"
-            create_changes_timeline(data, timeline_path)
+            if create_changes_timeline(data, timeline_path, max_urls):
+                outputs.append(timeline_path)
 
         if chart_type in ['bar', 'all']:
             # URLごとの変更頻度グラフの作成
+            expected += 1
             bar_chart_path = report_dir / f"url_changes_{timestamp}.png"
-            create_url_changes_chart(data, bar_chart_path)
+            if create_url_changes_chart(data, bar_chart_path, max_urls):
+                outputs.append(bar_chart_path)
+
+        # 描画できなかったグラフがある場合は、次回も同じデータで描画し直す
+        if not outputs or len(outputs) < expected:
+            logger.warning(f"Created {len(outputs)} of {expected} charts in {report_dir}")
+            return False
+
+        _save_fingerprint(fingerprint, outputs)
 
         logger.info(f"Monitoring report created in {report_dir}")
         return True
 
     except Exception as e:
         logger.error(f"Error creating monitoring report: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def main():
+    """
+    バックグラウンドプロセスとしてレポートを作成するエントリポイント
+    """
+    parser = argparse.ArgumentParser(description='Render monitoring report charts')
+    parser.add_argument('--report-dir', required=True, help='Directory to write chart images to')
+    parser.add_argument('--chart-type', default='all', help='timeline, line, bar or all')
+    parser.add_argument('--max-urls', type=int, default=DEFAULT_MAX_URLS, help='Maximum number of URLs per chart')
+    parser.add_argument('--force', action='store_true', help='Render even if the data is unchanged')
+    args = parser.parse_args()
+
+    from logger import setup_logger
+    setup_logger(load_config().get('log', {'level': 'INFO'}))
+
+    success = create_monitoring_report(Path(args.report_dir), args.chart_type, args.max_urls, args.force)
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file